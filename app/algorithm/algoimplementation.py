@@ -9,20 +9,26 @@ def get_all_filenames_in_folder(folder_path):
             filenames.append(filename) 
     return filenames
 
-def total_score(total_result, user_file):
+def total_score(total_result, user_file, user_sentences=None, sentence_table=None):
+    # With a sentence_table (check_state.resolve_sentences) every sentence is
+    # classified once, by its best source, instead of by the union of the
+    # per-resource matches
     user_basename = os.path.basename(user_file)
     all_exact_matches = set()
     all_partial_matches = set()
     all_matched_pairs = []
+    all_passages = []
 
     for result in total_result:
         all_exact_matches.update(result.get("exact_matches", []))
         all_partial_matches.update(result.get("partial_matches", []))
         all_matched_pairs.extend(result.get("matched_pairs", []))
+        all_passages.extend(result.get("passages", []))
 
     all_partial_matches -= all_exact_matches
 
-    user_sentences = tta.read_file(user_file)
+    if user_sentences is None:
+        user_sentences = tta.read_file(user_file)
     total_count = len(user_sentences)
 
     if total_count == 0:
@@ -36,11 +42,19 @@ def total_score(total_result, user_file):
             "plagiarism_files": [],
             "submittedDocument": "",
             "plagiarisedSnippets": [],
-            "matched_pairs": []
+            "matched_pairs": [],
+            "passages": []
         }
 
-    exact_count = len(all_exact_matches)
-    partial_count = len(all_partial_matches)
+    if sentence_table is not None:
+        types = sentence_table["type"]
+        exact_matches = [user_sentences[i] for i, kind in enumerate(types) if kind == "exact"]
+        partial_matches = [user_sentences[i] for i, kind in enumerate(types) if kind == "partial"]
+        exact_count, partial_count = len(exact_matches), len(partial_matches)
+        all_exact_matches, all_partial_matches = set(exact_matches), set(partial_matches)
+    else:
+        exact_count = len(all_exact_matches)
+        partial_count = len(all_partial_matches)
     unique_count = total_count - exact_count - partial_count
 
     total_exact_score = (exact_count / total_count) * 100
@@ -81,6 +95,7 @@ def total_score(total_result, user_file):
         "submittedDocument": "\n".join(user_sentences),
         "plagiarisedSnippets": list(all_exact_matches.union(all_partial_matches)),
         "matched_pairs": all_matched_pairs,
+        "passages": sorted(all_passages, key=lambda p: (p["doc1_start"], -p["avg_similarity"])),
         "document_citation_status": document_citation_status,
         "citations_found": citations,
     }
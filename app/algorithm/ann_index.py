@@ -0,0 +1,299 @@
+# ann_index.py
+import logging
+import threading
+
+import numpy as np
+from scipy.cluster.vq import kmeans2
+
+from app.algorithm import corpus_index
+from app.config import ANN_MAX_STALE, ANN_NLIST, ANN_NPROBE, ANN_PQ_SUBSPACES, ANN_RERANK, ANN_TRAIN_SAMPLE
+from app.controllers.resource_controller import get_all_resources
+
+INDEX_PATH = corpus_index.INDEX_DIR / "ivfpq.npz"
+
+# -----------------------------
+# IVF + PQ approximate search
+# -----------------------------
+# Reference sentence embeddings are assigned to the closest (highest inner
+# product) of `nlist` unit coarse centroids (inverted lists); the residual to that centroid is product-quantized
+# into one byte per subspace. A query scans only its `nprobe` closest lists,
+# scoring codes with per-query lookup tables, and the best `rerank` candidates
+# are re-scored exactly against the stored embeddings. The index is only ever
+# built on a background thread or offline, never by a check.
+
+
+def _subspaces(dim, requested):
+    # Largest subspace count not above the request that divides the dimension
+    return next(m for m in range(min(requested, dim), 0, -1) if dim % m == 0)
+
+
+def train_kmeans(data, k):
+    k = max(1, min(k, len(data)))
+    centroids, labels = kmeans2(data, k, minit="points", rng=0)
+    return centroids.astype(np.float32), labels
+
+
+def train_coarse(data, k):
+    """
+    Coarse centroids for unit embeddings: k-means centroids normalized to unit
+    length (spherical k-means), with every row labelled by its highest inner
+    product, the same rule rows are assigned and queries probed by afterwards.
+    """
+    centroids, _ = train_kmeans(data, k)
+    centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+    return centroids, np.argmax(data @ centroids.T, axis=1)
+
+
+class IvfPqIndex:
+    def __init__(self, coarse, codebooks, codes, list_offsets, resource_ids, sentence_idx, versions):
+        self.coarse = coarse                # (nlist, dim)
+        self.codebooks = codebooks          # (subspaces, ksub, dim / subspaces)
+        self.codes = codes                  # (rows, subspaces) uint8, grouped by list
+        self.list_offsets = list_offsets    # (nlist + 1,) row range of every list
+        self.resource_ids = resource_ids    # (rows,) resource of every row
+        self.sentence_idx = sentence_idx    # (rows,) resource sentence of every row
+        self.versions = versions            # {resource_id: corpus_version} indexed
+
+    def __len__(self):
+        return len(self.codes)
+
+    @classmethod
+    def build(cls, resources, nlist=ANN_NLIST, subspaces=ANN_PQ_SUBSPACES, train_sample=ANN_TRAIN_SAMPLE):
+        """
+        Trains on a sample of the corpus and encodes it one resource at a time, so
+        only the sample and the codes need to fit in memory.
+        """
+        indexed = []
+        for resource in resources:
+            embeddings = corpus_index.resource_embeddings(resource)
+            if embeddings is not None and len(embeddings):
+                indexed.append((resource, len(embeddings)))
+        if not indexed:
+            return None
+        total = sum(n for _, n in indexed)
+
+        rng = np.random.default_rng(0)
+        keep = min(1.0, train_sample / total)
+        sample = np.concatenate([
+            np.asarray(embeddings)[rng.random(len(embeddings)) < keep]
+            for embeddings in (corpus_index.resource_embeddings(r) for r, _ in indexed)
+        ])
+        if not len(sample):
+            sample = np.asarray(corpus_index.resource_embeddings(indexed[0][0]))
+
+        dim = sample.shape[1]
+        m = _subspaces(dim, subspaces)
+        coarse, labels = train_coarse(sample, nlist or int(4 * np.sqrt(total)))
+        residuals = (sample - coarse[labels]).reshape(len(sample), m, dim // m)
+        codebooks = np.stack([train_kmeans(residuals[:, s], 256)[0] for s in range(m)])
+
+        all_lists, all_codes, all_resources, all_sentences = [], [], [], []
+        for resource, n in indexed:
+            embeddings = np.asarray(corpus_index.resource_embeddings(resource), dtype=np.float32)
+            lists = np.argmax(embeddings @ coarse.T, axis=1)
+            residual = (embeddings - coarse[lists]).reshape(n, m, dim // m)
+            codes = np.stack([
+                np.argmin(((residual[:, s, None, :] - codebooks[s][None]) ** 2).sum(axis=2), axis=1)
+                for s in range(m)
+            ], axis=1).astype(np.uint8)
+            all_lists.append(lists)
+            all_codes.append(codes)
+            all_resources.append(np.full(n, resource["id"], dtype=np.int64))
+            all_sentences.append(np.arange(n, dtype=np.int64))
+
+        lists = np.concatenate(all_lists)
+        order = np.argsort(lists, kind="stable")
+        list_offsets = np.searchsorted(lists[order], np.arange(len(coarse) + 1))
+        return cls(
+            coarse, codebooks, np.concatenate(all_codes)[order], list_offsets,
+            np.concatenate(all_resources)[order], np.concatenate(all_sentences)[order],
+            {resource["id"]: resource.get("corpus_version", 0) for resource, _ in indexed},
+        )
+
+    def save(self, path=INDEX_PATH):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp.npz")
+        np.savez(
+            tmp, coarse=self.coarse, codebooks=self.codebooks, codes=self.codes,
+            list_offsets=self.list_offsets, resource_ids=self.resource_ids, sentence_idx=self.sentence_idx,
+            version_ids=np.fromiter(self.versions.keys(), dtype=np.int64, count=len(self.versions)),
+            version_values=np.fromiter(self.versions.values(), dtype=np.int64, count=len(self.versions)),
+        )
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path=INDEX_PATH):
+        if not path.exists():
+            return None
+        try:
+            with np.load(path) as data:
+                return cls(
+                    data["coarse"], data["codebooks"], data["codes"], data["list_offsets"],
+                    data["resource_ids"], data["sentence_idx"],
+                    dict(zip(data["version_ids"].tolist(), data["version_values"].tolist())),
+                )
+        except Exception as e:
+            logging.warning(f"Discarding unreadable ANN index {path}: {e}")
+            return None
+
+    def current_ids(self, resources):
+        # Resources whose indexed rows are still the resource's current sentences
+        return {r["id"] for r in resources if self.versions.get(r["id"]) == r.get("corpus_version", 0)}
+
+    def search(self, queries, resources_by_id, nprobe=ANN_NPROBE, rerank=ANN_RERANK):
+        """
+        Approximate search followed by exact re-ranking. Returns (resource_ids,
+        sentence_idx, similarity) arrays of shape (len(queries), rerank), best
+        first; missing candidates have resource id -1. Rows of resources not in
+        `resources_by_id` or indexed at another version are skipped.
+        """
+        n = len(queries)
+        result_ids = np.full((n, rerank), -1, dtype=np.int64)
+        result_sentences = np.full((n, rerank), -1, dtype=np.int64)
+        result_similarity = np.full((n, rerank), -1.0, dtype=np.float32)
+        if not n or not len(self):
+            return result_ids, result_sentences, result_similarity
+
+        current = self.current_ids(resources_by_id.values())
+        valid = np.isin(self.resource_ids, list(current))
+        m, _, dsub = self.codebooks.shape
+        coarse_scores = queries @ self.coarse.T
+        tables = np.einsum("nmd,mkd->nmk", queries.reshape(n, m, dsub), self.codebooks)
+        probe = min(nprobe, len(self.coarse))
+        probed = np.argpartition(-coarse_scores, probe - 1, axis=1)[:, :probe]
+
+        list_sizes = np.diff(self.list_offsets)
+        shortlists = []
+        for i in range(n):
+            rows = np.concatenate([np.arange(self.list_offsets[l], self.list_offsets[l + 1]) for l in probed[i]])
+            lists = np.repeat(probed[i], list_sizes[probed[i]])
+            keep = valid[rows]
+            rows, lists = rows[keep], lists[keep]
+            if len(rows) > rerank:
+                approx = coarse_scores[i, lists] + tables[i][np.arange(m), self.codes[rows]].sum(axis=1)
+                rows = rows[np.argpartition(-approx, rerank - 1)[:rerank]]
+            shortlists.append(rows)
+
+        # Exact re-ranking, reading every resource's embeddings once
+        candidates = np.unique(np.concatenate(shortlists)) if shortlists else np.zeros(0, dtype=np.int64)
+        vectors = np.zeros((len(candidates), queries.shape[1]), dtype=np.float32)
+        for resource_id in np.unique(self.resource_ids[candidates]):
+            at = np.nonzero(self.resource_ids[candidates] == resource_id)[0]
+            embeddings = corpus_index.resource_embeddings(resources_by_id[int(resource_id)])
+            vectors[at] = embeddings[self.sentence_idx[candidates[at]]]
+
+        for i, rows in enumerate(shortlists):
+            if not len(rows):
+                continue
+            exact = vectors[np.searchsorted(candidates, rows)] @ queries[i]
+            order = np.argsort(-exact, kind="stable")
+            result_ids[i, :len(rows)] = self.resource_ids[rows[order]]
+            result_sentences[i, :len(rows)] = self.sentence_idx[rows[order]]
+            result_similarity[i, :len(rows)] = exact[order]
+        return result_ids, result_sentences, result_similarity
+
+
+_index = None
+_loaded = False
+_building = False
+_lock = threading.Lock()
+
+
+def get_ann_index(resources):
+    """
+    The corpus ANN index as loaded from disk or last rebuilt, or None. When it is
+    missing or more than ANN_MAX_STALE of `resources` are missing from it or
+    changed since, a rebuild over the whole corpus starts in the background; the
+    check goes on with the current index (None = exhaustive comparison).
+    """
+    global _index, _loaded
+    with _lock:
+        if not _loaded:
+            _index, _loaded = IvfPqIndex.load(), True
+        index = _index
+    stale = len(resources) - len(index.current_ids(resources)) if index else len(resources)
+    if index is None or stale > ANN_MAX_STALE * len(resources):
+        _schedule_rebuild()
+    return index
+
+
+def _schedule_rebuild():
+    global _building
+    with _lock:
+        if _building:
+            return
+        _building = True
+    threading.Thread(target=_rebuild, daemon=True).start()
+
+
+def _rebuild():
+    global _index, _building
+    try:
+        index = rebuild_ann_index()
+        if index is not None:
+            with _lock:
+                _index = index
+    except Exception as e:
+        logging.error(f"ANN index rebuild failed: {e}")
+    finally:
+        with _lock:
+            _building = False
+
+
+def rebuild_ann_index():
+    """
+    Builds and saves the index over every active resource. Runs on the background
+    thread started by get_ann_index, or offline with `python -m app.algorithm.ann_index`.
+    """
+    resources = get_all_resources()
+    logging.info(f"Building ANN index over {len(resources)} resources")
+    index = IvfPqIndex.build(resources)
+    if index is not None:
+        index.save()
+    return index
+
+
+def search_corpus(user_embeddings, resources, nprobe=ANN_NPROBE, rerank=ANN_RERANK):
+    """
+    Re-ranked candidates of every submission sentence grouped by resource,
+    {resource_id: (rows, sentence_idx, similarity)}, and the ids of the resources
+    the index covers. Resources outside that set must be compared exhaustively.
+    """
+    index = get_ann_index(resources)
+    if index is None:
+        return {}, set()
+    ids, sentences, similarity = index.search(user_embeddings, {r["id"]: r for r in resources}, nprobe, rerank)
+    return group_hits(ids, sentences, similarity), index.current_ids(resources)
+
+
+def group_hits(ids, sentences, similarity):
+    """
+    (n, k) candidate arrays (resource id -1 = none) regrouped by resource:
+    {resource_id: (rows, sentence_idx, similarity)}.
+    """
+    rows, slots = np.nonzero(ids >= 0)
+    flat_ids = ids[rows, slots]
+    order = np.argsort(flat_ids, kind="stable")
+    resource_ids, starts = np.unique(flat_ids[order], return_index=True)
+    hits = {}
+    for resource_id, group in zip(resource_ids, np.split(order, starts[1:])):
+        hits[int(resource_id)] = (rows[group], sentences[rows[group], slots[group]], similarity[rows[group], slots[group]])
+    return hits
+
+
+def hit_similarity(hits, num_rows, num_sentences, rows=None):
+    """
+    Dense similarity matrix of one resource with the ANN hits filled in and -1
+    elsewhere, in the shape exhaustive matching produces.
+    """
+    similarity = np.full((num_rows, num_sentences), -1.0, dtype=np.float32)
+    if hits is not None:
+        hit_rows, hit_sentences, hit_similarity = hits
+        similarity[hit_rows, hit_sentences] = hit_similarity
+    return similarity if rows is None else similarity[rows]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    built = rebuild_ann_index()
+    print(f"✅ ANN index: {len(built) if built else 0} sentences")
@@ -0,0 +1,159 @@
+# boilerplate.py
+import re
+import threading
+from collections import Counter
+
+from app.algorithm import corpus_index
+from app.config import (
+    BOILERPLATE_MAX_DF,
+    BOILERPLATE_MIN_DOCS,
+    BOILERPLATE_MIN_WORDS,
+    BOILERPLATE_PHRASE_SHARE,
+    BOILERPLATE_PHRASE_WORDS,
+)
+
+# -----------------------------
+# Boilerplate suppression
+# -----------------------------
+# Submission sentences are dropped before encoding when they carry too little
+# content (fewer than BOILERPLATE_MIN_WORDS content words: headings, captions,
+# short fragments) or when their normalized text occurs in at least
+# BOILERPLATE_MAX_DF of the corpus documents, and in no fewer than
+# BOILERPLATE_MIN_DOCS of them (standard phrases, template text).
+# With BOILERPLATE_PHRASE_WORDS set, runs of that many normalized words are
+# counted the same way, so templated sentences that differ only in a name, a
+# date or a title are caught too: a sentence goes when at least
+# BOILERPLATE_PHRASE_SHARE of its phrases are that frequent.
+
+WORD = re.compile(r"[a-z]+")
+TOKEN = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset("""
+    a an and are as at be been but by can do does for from had has have he her his
+    i if in into is it its may me my no not of on or our she so such than that the
+    their them then there these they this those to was we were what when which who
+    will with would you your also only
+""".split())
+
+
+def normalize_sentence(sentence):
+    return " ".join(TOKEN.findall(sentence.lower()))
+
+
+def sentence_phrases(sentence, words):
+    # Hashed, not stored as text: the counter holds every phrase of the corpus
+    tokens = TOKEN.findall(sentence.lower())
+    return [hash(tuple(tokens[i:i + words])) for i in range(len(tokens) - words + 1)]
+
+
+def content_words(sentence):
+    return sum(1 for word in WORD.findall(sentence.lower()) if len(word) > 2 and word not in STOPWORDS)
+
+
+class DocumentFrequencyIndex:
+    """
+    Number of corpus documents containing each normalized sentence and, with
+    `phrase_words`, each run of that many normalized words. Resources
+    are counted once per corpus_version, from the corpus index only: resources
+    not indexed yet are never parsed or encoded here, and are counted on a
+    later update once they are. Changed and deleted resources are uncounted on
+    the next update, so only new text is read. Updates for the corpus_version
+    already seen only look at resources still waiting to be indexed.
+    """
+
+    def __init__(self, phrase_words=BOILERPLATE_PHRASE_WORDS):
+        self.phrase_words = phrase_words
+        self.frequency = Counter()
+        self.phrase_frequency = Counter()
+        self._counted = {}  # resource_id -> (corpus_version, normalized sentences, phrases)
+        self._unindexed = []
+        self._version = None
+        self._num_documents = 0
+        self._lock = threading.Lock()
+
+    def update(self, resources, corpus_version=None):
+        with self._lock:
+            if corpus_version is None or corpus_version != self._version:
+                current = {r["id"]: r.get("corpus_version", 0) for r in resources}
+                stale = [
+                    resource_id for resource_id, (version, _, _) in self._counted.items()
+                    if current.get(resource_id) != version
+                ]
+                for resource_id in stale:
+                    _, normalized, phrases = self._counted.pop(resource_id)
+                    self._uncount(self.frequency, normalized)
+                    self._uncount(self.phrase_frequency, phrases)
+                self._unindexed = [r for r in resources if r["id"] not in self._counted]
+                self._version = corpus_version
+                self._num_documents = len(current)
+            missing, num_documents = self._unindexed, self._num_documents
+        unindexed = []
+        for resource in missing:
+            sentences = corpus_index.resource_sentences(resource, build=False)
+            if sentences is None:
+                unindexed.append(resource)
+                continue
+            normalized = {normalize_sentence(s) for s in sentences} - {""}
+            phrases = set()
+            if self.phrase_words:
+                for sentence in sentences:
+                    phrases.update(sentence_phrases(sentence, self.phrase_words))
+            with self._lock:
+                if resource["id"] not in self._counted:
+                    self._counted[resource["id"]] = (resource.get("corpus_version", 0), normalized, phrases)
+                    self.frequency.update(normalized)
+                    self.phrase_frequency.update(phrases)
+        with self._lock:
+            if self._unindexed is missing:
+                self._unindexed = unindexed
+        return num_documents
+
+    @staticmethod
+    def _uncount(frequency, keys):
+        # Keys that reach zero are removed, so the counter only holds corpus text
+        for key in keys:
+            if frequency[key] <= 1:
+                del frequency[key]
+            else:
+                frequency[key] -= 1
+
+    def document_frequency(self, sentence):
+        with self._lock:
+            return self.frequency.get(normalize_sentence(sentence), 0)
+
+    def frequent_phrase_share(self, sentence, limit):
+        """
+        Share of the sentence's phrases found in at least `limit` documents (0
+        without phrase counting or for sentences shorter than one phrase).
+        """
+        if not self.phrase_words:
+            return 0.0
+        phrases = sentence_phrases(sentence, self.phrase_words)
+        if not phrases:
+            return 0.0
+        with self._lock:
+            return sum(1 for phrase in phrases if self.phrase_frequency.get(phrase, 0) >= limit) / len(phrases)
+
+
+document_frequency_index = DocumentFrequencyIndex()
+
+
+def suppress_boilerplate(sentences, resources, corpus_version=None, min_words=BOILERPLATE_MIN_WORDS,
+                         max_df=BOILERPLATE_MAX_DF, phrase_share=BOILERPLATE_PHRASE_SHARE):
+    """
+    The informative sentences (in order) and the number suppressed. `resources`
+    should be the whole active corpus at `corpus_version`, not a filtered
+    subset, so frequencies do not depend on the request.
+    """
+    if not sentences or not (min_words or max_df):
+        return sentences, 0
+    kept = [s for s in sentences if content_words(s) >= min_words]
+    if max_df and kept:
+        num_documents = document_frequency_index.update(resources, corpus_version)
+        limit = max(BOILERPLATE_MIN_DOCS, max_df * num_documents)
+        kept = [
+            s for s in kept
+            if document_frequency_index.document_frequency(s) < limit
+            and not (phrase_share and document_frequency_index.frequent_phrase_share(s, limit) >= phrase_share)
+        ]
+    return kept, len(sentences) - len(kept)
@@ -0,0 +1,338 @@
+# check_state.py
+import difflib
+import json
+import uuid
+
+import numpy as np
+import psycopg2
+
+from app.config import CHECK_STATE_TTL_DAYS, RETHRESHOLD_FLOOR, RETHRESHOLD_TOP_K
+from app.database.db_connect import test_database_connection
+
+
+# -----------------------------
+# Per-sentence top-k match state
+# -----------------------------
+# For every submission sentence the k most similar resources (one candidate per
+# resource: similarity, resource id, resource sentence index), best first.
+# Column 0 is the sentence's best match; empty slots hold -1.
+
+def new_top_matches(num_sentences, k=RETHRESHOLD_TOP_K):
+    return {
+        "similarity": np.full((num_sentences, k), -1.0, dtype=np.float32),
+        "resource_id": np.full((num_sentences, k), -1, dtype=np.int64),
+        "sentence_idx": np.full((num_sentences, k), -1, dtype=np.int64),
+    }
+
+
+def _row_order(top):
+    return np.argsort(-top["similarity"], axis=1, kind="stable")
+
+
+def _sort_rows(top, order=None):
+    if order is None:
+        order = _row_order(top)
+    for key in top:
+        top[key] = np.take_along_axis(top[key], order, axis=1)
+    return top
+
+
+def update_top_matches(top, similarity_matrix, resource_id, rows=None):
+    if similarity_matrix.size == 0:
+        return top
+    if rows is None:
+        rows = np.arange(similarity_matrix.shape[0])
+    best_idx = np.argmax(similarity_matrix, axis=1)
+    best_sim = similarity_matrix[np.arange(len(best_idx)), best_idx]
+    keep = best_sim >= RETHRESHOLD_FLOOR
+    rows, best_idx, best_sim = rows[keep], best_idx[keep], best_sim[keep]
+    if not len(rows):
+        return top
+
+    k = top["similarity"].shape[1]
+    merged = {
+        "similarity": np.concatenate([top["similarity"][rows], best_sim[:, None]], axis=1),
+        "resource_id": np.concatenate([top["resource_id"][rows], np.full((len(rows), 1), resource_id)], axis=1),
+        "sentence_idx": np.concatenate([top["sentence_idx"][rows], best_idx[:, None]], axis=1),
+    }
+    merged = _sort_rows(merged)
+    for key in top:
+        top[key][rows] = merged[key][:, :k]
+    return top
+
+
+def drop_top_matches(top, stale):
+    """
+    Empties the candidate slots marked in `stale` and re-sorts every row best
+    first. Returns the new slot order per row, for anything kept alongside.
+    """
+    top["similarity"][stale] = -1.0
+    top["resource_id"][stale] = -1
+    top["sentence_idx"][stale] = -1
+    order = _row_order(top)
+    _sort_rows(top, order)
+    return order
+
+
+def replace_top_matches(top, similarity_matrix, resource_id, rows):
+    # Drops the resource's candidates in `rows` before adding its new ones
+    rows = np.asarray(rows)
+    stale = np.zeros(top["resource_id"].shape, dtype=bool)
+    stale[rows] = top["resource_id"][rows] == resource_id
+    drop_top_matches(top, stale)
+    return update_top_matches(top, similarity_matrix, resource_id, rows=rows)
+
+
+def rebuild_top_matches(top, results):
+    """
+    Drops candidates from resources without a result any more and refills the
+    freed slots from the remaining results' matched pairs. Sub-threshold
+    candidates of the remaining resources are unknown and are not refilled.
+    """
+    kept_ids = {result["resource_id"] for result in results}
+    stale = ~np.isin(top["resource_id"], list(kept_ids))
+    top["similarity"][stale] = -1.0
+    top["resource_id"][stale] = -1
+    top["sentence_idx"][stale] = -1
+    rows_with_gaps = stale.any(axis=1)
+    for result in results:
+        resource_id = result["resource_id"]
+        for pair in result.get("matched_pairs", []):
+            i = pair["doc1_idx"]
+            if not rows_with_gaps[i] or resource_id in top["resource_id"][i]:
+                continue
+            slot = np.argmin(top["similarity"][i])
+            if pair["similarity"] > top["similarity"][i, slot]:
+                top["similarity"][i, slot] = pair["similarity"]
+                top["resource_id"][i, slot] = resource_id
+                top["sentence_idx"][i, slot] = pair["doc2_idx"]
+    return _sort_rows(top)
+
+
+def remap_top_matches(previous_top, row_map, num_sentences):
+    top = new_top_matches(num_sentences)
+    k = min(top["similarity"].shape[1], previous_top["similarity"].shape[1])
+    if row_map:
+        new_rows = np.fromiter(row_map.keys(), dtype=np.int64)
+        old_rows = np.fromiter(row_map.values(), dtype=np.int64)
+        for key in top:
+            top[key][new_rows, :k] = previous_top[key][old_rows, :k]
+    return top
+
+
+def top_matches_to_json(top):
+    return {key: values.tolist() for key, values in top.items()}
+
+
+def top_matches_from_json(data):
+    top = {
+        "similarity": np.asarray(data["similarity"], dtype=np.float32),
+        "resource_id": np.asarray(data["resource_id"], dtype=np.int64),
+        "sentence_idx": np.asarray(data["sentence_idx"], dtype=np.int64),
+    }
+    for key in top:
+        # States saved before top-k kept a single best match per sentence
+        if top[key].ndim == 1:
+            top[key] = top[key].reshape(-1, 1)
+    return top
+
+
+def resolve_sentences(top, threshold, exact_threshold):
+    """
+    Compact per-sentence result table built from the top-k state: every sentence
+    is resolved once to its best source across the corpus (resource id, resource
+    sentence index, similarity and match type, or -1/None when unmatched), and
+    `sources` lists all resources at or above the threshold, best first.
+    """
+    best_similarity = top["similarity"][:, 0]
+    matched = best_similarity >= threshold
+    return {
+        "resource_id": np.where(matched, top["resource_id"][:, 0], -1).tolist(),
+        "sentence_idx": np.where(matched, top["sentence_idx"][:, 0], -1).tolist(),
+        "similarity": np.round(np.where(matched, best_similarity, 0.0), 4).tolist(),
+        "type": [
+            ("exact" if similarity >= exact_threshold else "partial") if is_matched else None
+            for similarity, is_matched in zip(best_similarity, matched)
+        ],
+        "sources": [
+            resource_ids[similarities >= threshold].tolist()
+            for resource_ids, similarities in zip(top["resource_id"], top["similarity"])
+        ],
+    }
+
+
+def source_stats(table, titles):
+    """
+    Per-resource share of the submission resolved to that resource as its best
+    source, so no sentence is counted for more than one resource.
+    """
+    num_sentences = len(table["type"])
+    stats = {}
+    for resource_id, match_type in zip(table["resource_id"], table["type"]):
+        if match_type is None:
+            continue
+        entry = stats.setdefault(resource_id, {
+            "resource_id": resource_id,
+            "filename": titles.get(str(resource_id), "Undefined Resource"),
+            "exact": 0,
+            "partial": 0,
+        })
+        entry[match_type] += 1
+    for entry in stats.values():
+        entry["exact_score"] = round(entry["exact"] / num_sentences * 100, 2)
+        entry["partial_score"] = round(entry["partial"] / num_sentences * 100, 2)
+    return sorted(stats.values(), key=lambda e: (-(e["exact"] + e["partial"]), -e["exact"], e["resource_id"]))
+
+
+# -----------------------------
+# Draft diffing
+# -----------------------------
+
+def diff_sentences(old_sentences, new_sentences):
+    """
+    Sentence-level diff of two drafts. Returns ({new_idx: old_idx} for unchanged
+    sentences, sorted array of new indices that were added or edited).
+    """
+    matcher = difflib.SequenceMatcher(None, old_sentences, new_sentences, autojunk=False)
+    row_map = {}
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            for offset in range(i2 - i1):
+                row_map[j1 + offset] = i1 + offset
+    changed_rows = np.array(
+        [j for j in range(len(new_sentences)) if j not in row_map], dtype=np.int64
+    )
+    return row_map, changed_rows
+
+
+# -----------------------------
+# Persistence
+# -----------------------------
+
+def save_check_state(check_id, content_hash, corpus_version, settings, state, user_id=None, embeddings=None):
+    conn = test_database_connection()
+    if not conn:
+        return
+    cursor = conn.cursor()
+    try:
+        embedding_bytes = None
+        if embeddings is not None:
+            state = {**state, "embedding_dim": int(embeddings.shape[1])}
+            embedding_bytes = psycopg2.Binary(np.ascontiguousarray(embeddings, dtype=np.float32).tobytes())
+        cursor.execute("""
+            INSERT INTO check_states (check_id, user_id, content_hash, corpus_version, settings, state, embeddings)
+            VALUES (%s, %s, %s, %s, %s, %s::jsonb, %s)
+            ON CONFLICT (check_id) DO UPDATE SET
+                user_id = COALESCE(EXCLUDED.user_id, check_states.user_id),
+                corpus_version = EXCLUDED.corpus_version,
+                settings = EXCLUDED.settings,
+                state = EXCLUDED.state,
+                embeddings = COALESCE(EXCLUDED.embeddings, check_states.embeddings),
+                updated_at = CURRENT_TIMESTAMP
+        """, (
+            check_id, user_id, content_hash, corpus_version, settings,
+            json.dumps(state, default=str), embedding_bytes
+        ))
+        cursor.execute("""
+            DELETE FROM check_states
+            WHERE report_id IS NULL AND updated_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 day'
+        """, (CHECK_STATE_TTL_DAYS,))
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"⚠️ Could not save check state: {e}")
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def claim_check_state(content_hash, corpus_version, settings, resource_filter, user_id):
+    """
+    The check_id of `user_id`'s check state for this upload, corpus, settings
+    and (normalized) resource filter. A report served from the cache or shared
+    with another user's concurrent upload was checked under someone else's
+    check_id; its newest state is then copied under a new check_id owned by
+    `user_id`. None if no state is left (it expired) or the DB is unreachable.
+    """
+    conn = test_database_connection()
+    if not conn:
+        return None
+    cursor = conn.cursor()
+    match = """
+        content_hash = %s AND corpus_version = %s AND settings = %s
+        AND state -> 'resource_filter' = %s::jsonb
+    """
+    params = (content_hash, corpus_version, settings, json.dumps(resource_filter))
+    try:
+        cursor.execute(f"""
+            SELECT check_id FROM check_states
+            WHERE user_id = %s AND {match}
+            ORDER BY updated_at DESC LIMIT 1
+        """, (user_id, *params))
+        row = cursor.fetchone()
+        if row:
+            return row[0]
+        check_id = uuid.uuid4().hex
+        cursor.execute(f"""
+            INSERT INTO check_states (check_id, user_id, content_hash, corpus_version, settings, state, embeddings)
+            SELECT %s, %s, content_hash, corpus_version, settings, state, embeddings
+            FROM check_states
+            WHERE {match}
+            ORDER BY updated_at DESC LIMIT 1
+        """, (check_id, user_id, *params))
+        copied = cursor.rowcount
+        conn.commit()
+        return check_id if copied else None
+    except Exception as e:
+        conn.rollback()
+        print(f"⚠️ Could not claim check state: {e}")
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _load_check_state(where_clause, params):
+    conn = test_database_connection()
+    if not conn:
+        return None
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"""
+            SELECT check_id, report_id, user_id, content_hash, corpus_version, settings, state, embeddings
+            FROM check_states
+            {where_clause}
+        """, params)
+        row = cursor.fetchone()
+        if not row:
+            return None
+        columns = [desc[0] for desc in cursor.description]
+        record = dict(zip(columns, row))
+        if isinstance(record["state"], str):
+            record["state"] = json.loads(record["state"])
+        if record["embeddings"] is not None and record["state"].get("embedding_dim"):
+            record["embeddings"] = np.frombuffer(bytes(record["embeddings"]), dtype=np.float32).reshape(
+                -1, record["state"]["embedding_dim"]
+            )
+        else:
+            record["embeddings"] = None
+        return record
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def load_check_state(check_id):
+    return _load_check_state("WHERE check_id = %s", (check_id,))
+
+
+def load_latest_user_check_state(user_id):
+    return _load_check_state(
+        "WHERE user_id = %s ORDER BY updated_at DESC LIMIT 1", (user_id,)
+    )
+
+
+def load_check_state_by_hash(content_hash):
+    return _load_check_state(
+        "WHERE content_hash = %s ORDER BY updated_at DESC LIMIT 1", (content_hash,)
+    )
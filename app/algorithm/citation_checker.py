@@ -1,13 +1,30 @@
 # citation_checker.py
 import re
+import threading
+from collections import Counter
+
 import psycopg2
 
 from app.database.db_connect import test_database_connection
 
 
+REFERENCES_HEADING = re.compile(r'^(references|bibliography)\s*$', re.IGNORECASE)
+IEEE_ENTRY = re.compile(r'\[(\d+)\]\s*(.*)')
+AUTHOR_YEAR_ENTRY = re.compile(r'(\b[A-Z][a-zA-Z]+)[^\n]*?(\d{4})')
+SURNAME_FIRST_ENTRY = re.compile(r'(\b[A-Z][a-zA-Z]+),\s+[A-Z][a-zA-Z]+.*?(\d{4})')
+
+# (Author, 2020) | (Author 12) | [3], [1,2], [4-6] in one scan
+IN_TEXT_CITATION = re.compile(
+    r'\((?P<author>[A-Z][a-zA-Z]+),\s*(?P<year>\d{4})\)'
+    r'|\((?P<author_page>[A-Z][a-zA-Z]+)\s+\d+\)'
+    r'|\[(?P<ieee>\d+(?:[-,]\d+)*)\]'
+)
+IEEE_SEPARATOR = re.compile(r'[-,]')
+
+
 def extract_references_section(lines):
     for i, line in enumerate(lines):
-        if re.search(r'^(references|bibliography)\s*$', line.strip(), re.IGNORECASE):
+        if REFERENCES_HEADING.search(line.strip()):
             return lines[i + 1:]
     return []
 
@@ -17,19 +34,19 @@ def normalize_reference_entries(ref_lines):
     ieee_map = {}
 
     for i, line in enumerate(ref_lines):
-        match = re.match(r'\[(\d+)\]\s*(.*)', line)
+        match = IEEE_ENTRY.match(line)
         if match:
             ref_num = match.group(1)
             rest = match.group(2)
             ieee_map[ref_num] = rest
 
-        match = re.search(r'(\b[A-Z][a-zA-Z]+)[^\n]*?(\d{4})', line)
+        match = AUTHOR_YEAR_ENTRY.search(line)
         if match:
             author = match.group(1).lower()
             year = match.group(2)
             ref_keys.add(f"{author}_{year}")
 
-        match = re.search(r'(\b[A-Z][a-zA-Z]+),\s+[A-Z][a-zA-Z]+.*?(\d{4})', line)
+        match = SURNAME_FIRST_ENTRY.search(line)
         if match:
             author = match.group(1).lower()
             year = match.group(2)
@@ -38,27 +55,101 @@ def normalize_reference_entries(ref_lines):
     return ref_keys, ieee_map
 
 
-def fetch_db_references():
-    conn =test_database_connection()
-    cursor = conn.cursor()
-
-    cursor.execute("""
-        SELECT a.name, r.publication_date
-        FROM authors a
-        JOIN resource_authors ra ON a.id = ra.author_id
-        JOIN resources r ON r.id = ra.resource_id
-    """)
-    rows = cursor.fetchall()
-    db_keys = set()
-    for name, pub_date in rows:
-        if pub_date:
-            db_keys.add(f"{name.lower().split()[0]}_{pub_date.year}")
-        else:
-            db_keys.add(f"{name.lower().split()[0]}_unknown")
+def parse_references(lines):
+    return normalize_reference_entries(extract_references_section(lines))
+
+
+def reference_key(name, pub_date):
+    if pub_date:
+        return f"{name.lower().split()[0]}_{pub_date.year}"
+    return f"{name.lower().split()[0]}_unknown"
+
+
+class ReferenceKeyIndex:
+    """
+    author_year keys of every resource in the database, built once and then kept
+    current incrementally: resource_controller refreshes a resource whenever its
+    authors are linked, and lookups catch up on resources whose corpus_version is
+    newer than anything seen (changes made by other processes). Soft-deleted
+    resources have no keys.
+    """
+
+    def __init__(self):
+        self._keys_by_resource = {}
+        self._key_counts = Counter()
+        self._keys = frozenset()
+        self._version = None
+        self._dirty = set()
+        self._lock = threading.Lock()
+
+    def _set_resource_keys(self, resource_id, keys):
+        self._key_counts.subtract(self._keys_by_resource.pop(resource_id, ()))
+        if keys:
+            self._keys_by_resource[resource_id] = keys
+            self._key_counts.update(keys)
+        self._key_counts = +self._key_counts
+        self._keys = frozenset(self._key_counts)
+
+    def _load(self, cursor, where_clause, params):
+        cursor.execute(f"""
+            SELECT r.id, r.corpus_version, a.name, r.publication_date, r.deleted_at
+            FROM resources r
+            LEFT JOIN resource_authors ra ON ra.resource_id = r.id
+            LEFT JOIN authors a ON a.id = ra.author_id
+            {where_clause}
+        """, params)
+        keys_by_resource = {}
+        max_version = 0
+        for resource_id, version, name, pub_date, deleted_at in cursor.fetchall():
+            keys = keys_by_resource.setdefault(resource_id, set())
+            if name and deleted_at is None:
+                keys.add(reference_key(name, pub_date))
+            max_version = max(max_version, version or 0)
+        return keys_by_resource, max_version
+
+    def _catch_up(self, where_clause, params):
+        conn = test_database_connection()
+        cursor = conn.cursor()
+        try:
+            keys_by_resource, max_version = self._load(cursor, where_clause, params)
+        finally:
+            cursor.close()
+            conn.close()
+        for resource_id, keys in keys_by_resource.items():
+            self._set_resource_keys(resource_id, keys)
+        self._version = max(self._version or 0, max_version)
+
+    def keys(self, corpus_version=None):
+        with self._lock:
+            if self._version is None:
+                self._catch_up("", ())
+            elif corpus_version is not None and corpus_version > self._version:
+                self._catch_up("WHERE r.corpus_version > %s", (self._version,))
+            if self._dirty:
+                dirty, self._dirty = list(self._dirty), set()
+                for resource_id in dirty:
+                    self._set_resource_keys(resource_id, set())
+                self._catch_up("WHERE r.id = ANY(%s)", (dirty,))
+            return self._keys
+
+    def refresh_resource(self, cursor, resource_id):
+        # Runs on the caller's cursor so rows written in its open transaction are seen
+        keys_by_resource, _ = self._load(cursor, "WHERE r.id = %s", (resource_id,))
+        with self._lock:
+            self._set_resource_keys(resource_id, keys_by_resource.get(resource_id, set()))
+
+    def discard_resource(self, resource_id):
+        # The resource was deleted, or the transaction that refreshed it was rolled
+        # back; reload on next use
+        with self._lock:
+            self._dirty.add(resource_id)
+
+
+reference_index = ReferenceKeyIndex()
+
 
-    cursor.close()
-    conn.close()
-    return db_keys
+def fetch_db_references():
+    return reference_index.keys()
 
 
 def find_in_text_citations(sentence):
@@ -66,50 +157,77 @@ def find_in_text_citations(sentence):
     ieee_numbers = []
     citation_texts = []
 
-    for match in re.finditer(r'\(([A-Z][a-zA-Z]+),\s*(\d{4})\)', sentence):
-        author, year = match.groups()
-        keys.append(f"{author.lower()}_{year}")
-        citation_texts.append(match.group(0))
-
-    for match in re.finditer(r'\(([A-Z][a-zA-Z]+)\s+\d+\)', sentence):
-        author = match.group(1)
-        keys.append(f"{author.lower()}_unknown")
+    for match in IN_TEXT_CITATION.finditer(sentence):
+        if match.group("author"):
+            keys.append(f"{match.group('author').lower()}_{match.group('year')}")
+        elif match.group("author_page"):
+            keys.append(f"{match.group('author_page').lower()}_unknown")
+        else:
+            ieee_numbers.extend(IEEE_SEPARATOR.split(match.group("ieee")))
         citation_texts.append(match.group(0))
 
-    for match in re.finditer(r'\[(\d+(?:[-,]\d+)*)\]', sentence):
-        citation = match.group(0)
-        parts = re.split(r'[-,]', match.group(1))
-        ieee_numbers.extend(parts)
-        citation_texts.append(citation)
-
     return keys, ieee_numbers, citation_texts
 
 
-def classify_citation_status(matched_pairs, doc1_sentences, doc2_sentences, doc2_lines):
-    ref_lines = extract_references_section(doc2_lines)
-    ref_keys, ieee_map = normalize_reference_entries(ref_lines)
-    db_keys = fetch_db_references()
-    ref_keys.update(db_keys)
+class CitationAnnotations:
+    """
+    In-text citations of every sentence of a document, found in a single scan.
+    Window queries union the per-sentence sets; a prefix count of citing sentences
+    answers windows without any citation without looking at the sentences.
+    """
+
+    def __init__(self, sentences):
+        self.keys = []
+        self.ieee_numbers = []
+        self.citation_texts = []
+        self._citing_prefix = [0]
+        for sentence in sentences:
+            keys, ieee_numbers, citation_texts = find_in_text_citations(sentence)
+            self.keys.append(frozenset(keys))
+            self.ieee_numbers.append(frozenset(ieee_numbers))
+            self.citation_texts.append(citation_texts)
+            self._citing_prefix.append(self._citing_prefix[-1] + bool(citation_texts))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def window(self, start, stop):
+        """
+        (keys, IEEE numbers, citation texts) found in sentences start..stop-1.
+        """
+        start, stop = max(0, start), min(len(self), stop)
+        if start >= stop or self._citing_prefix[stop] == self._citing_prefix[start]:
+            return set(), set(), []
+        keys = set().union(*self.keys[start:stop])
+        ieee_numbers = set().union(*self.ieee_numbers[start:stop])
+        citation_texts = [text for texts in self.citation_texts[start:stop] for text in texts]
+        return keys, ieee_numbers, citation_texts
+
+
+def classify_citation_status(matched_pairs, doc1_sentences, doc2_sentences, doc2_lines, db_keys=None,
+                             annotations=None, references=None):
+    """
+    Marks every pair properly_cited, mismatched or uncited from the citations in
+    the resource sentences around it. `annotations` (CitationAnnotations of
+    doc2_sentences) and `references` (parse_references of doc2_lines) are computed
+    here unless the caller keeps them per resource.
+    """
+    if annotations is None:
+        annotations = CitationAnnotations(doc2_sentences)
+    if references is None:
+        references = parse_references(doc2_lines)
+    ref_keys, ieee_map = references
+    if db_keys is None:
+        db_keys = fetch_db_references()
 
     for pair in matched_pairs:
         idx = pair['doc1_idx']
-        context_indices = range(max(0, idx - 2), min(len(doc2_sentences), idx + 3))
-        context = [doc2_sentences[i] for i in context_indices]
-
-        found_keys = set()
-        found_ieee = set()
-        citation_texts = []
-
-        for sent in context:
-            keys, ieee_nums, ctexts = find_in_text_citations(sent)
-            found_keys.update(keys)
-            found_ieee.update(ieee_nums)
-            citation_texts.extend(ctexts)
+        found_keys, found_ieee, citation_texts = annotations.window(idx - 2, idx + 3)
 
         status = "uncited"
 
         ieee_matched = any(num in ieee_map for num in found_ieee)
-        key_matched = any(key in ref_keys for key in found_keys)
+        key_matched = any(key in ref_keys or key in db_keys for key in found_keys)
 
         if ieee_matched or key_matched:
             status = "properly_cited"
@@ -126,7 +244,7 @@ def split_text_and_references(full_text):
     lines = [line.strip() for line in full_text.strip().split('\n') if line.strip()]
     ref_start_idx = None
     for i in range(len(lines) - 1, -1, -1):
-        if re.match(r'^(references|bibliography)\s*$', lines[i], re.IGNORECASE):
+        if REFERENCES_HEADING.match(lines[i]):
             ref_start_idx = i
             break
 
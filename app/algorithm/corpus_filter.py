@@ -0,0 +1,85 @@
+# corpus_filter.py
+import threading
+
+import numpy as np
+
+from app.algorithm.resource_filter import normalize_filter
+
+# Filter format and normalization: see resource_filter.py (importable without numpy)
+
+
+class CorpusMasks:
+    """
+    Boolean masks over the active resources, one per publisher, publication year
+    and author, built once per corpus state. A filter is answered by OR-ing and
+    AND-ing masks, without looking at the resources themselves.
+    """
+
+    def __init__(self, resources):
+        self.resources = resources
+        self.ids = np.array([r["id"] for r in resources], dtype=np.int64)
+        self.years = np.array(
+            [r["publication_date"].year if r.get("publication_date") else -1 for r in resources], dtype=np.int64
+        )
+        self.by_publisher = self._masks(resources, lambda r: [r.get("publisher")])
+        self.by_year = {int(year): self.years == year for year in np.unique(self.years) if year >= 0}
+        self.by_author = self._masks(resources, lambda r: [a.get("name") for a in r.get("authors") or []])
+
+    @staticmethod
+    def _masks(resources, values_of):
+        masks = {}
+        for position, resource in enumerate(resources):
+            for value in values_of(resource):
+                if value:
+                    mask = masks.setdefault(str(value).strip().lower(), np.zeros(len(resources), dtype=bool))
+                    mask[position] = True
+        return masks
+
+    def _any(self, masks, keys):
+        selected = np.zeros(len(self.resources), dtype=bool)
+        for key in keys:
+            if key in masks:
+                selected |= masks[key]
+        return selected
+
+    def mask(self, resource_filter):
+        selected = np.ones(len(self.resources), dtype=bool)
+        resource_filter = normalize_filter(resource_filter)
+        if not resource_filter:
+            return selected
+        if "publishers" in resource_filter:
+            selected &= self._any(self.by_publisher, resource_filter["publishers"])
+        if "authors" in resource_filter:
+            selected &= self._any(self.by_author, resource_filter["authors"])
+        if "year_from" in resource_filter or "year_to" in resource_filter:
+            year_from = resource_filter.get("year_from", -np.inf)
+            year_to = resource_filter.get("year_to", np.inf)
+            selected &= self._any(self.by_year, [y for y in self.by_year if year_from <= y <= year_to])
+        if "resource_ids" in resource_filter:
+            selected &= np.isin(self.ids, resource_filter["resource_ids"])
+        return selected
+
+    def select(self, resource_filter):
+        return [self.resources[i] for i in np.flatnonzero(self.mask(resource_filter))]
+
+
+_masks = None
+_masks_key = None
+_lock = threading.Lock()
+
+
+def filter_resources(resources, resource_filter):
+    """
+    The resources matching `resource_filter`, in their original order. Masks are
+    rebuilt only when the corpus changed (every create, update and delete bumps
+    the maximum corpus_version).
+    """
+    global _masks, _masks_key
+    if not normalize_filter(resource_filter):
+        return resources
+    key = (len(resources), max((r.get("corpus_version", 0) for r in resources), default=0))
+    with _lock:
+        if _masks is None or _masks_key != key:
+            _masks, _masks_key = CorpusMasks(resources), key
+        masks = _masks
+    return masks.select(resource_filter)
@@ -0,0 +1,256 @@
+# corpus_index.py
+import json
+import logging
+import threading
+from pathlib import Path
+
+import numpy as np
+import requests
+
+from app.algorithm import hierarchy, truetypealgorithm
+from app.algorithm.citation_checker import CitationAnnotations, parse_references
+from app.config import CORPUS_INDEX_DIR, CORPUS_MMAP, UPLOAD_DIR
+
+UPLOAD_DIR.mkdir(exist_ok=True)
+
+# Entries hold segmented sentences, so each segmenter gets its own index
+INDEX_DIR = Path(CORPUS_INDEX_DIR) / truetypealgorithm.MODEL_NAME / truetypealgorithm.SENTENCE_SEGMENTER
+
+# resource_id -> entry; an entry is only reused while its corpus_version matches
+_entries = {}
+# resource_id -> corpus_version of resources that yielded no usable text
+_empty = {}
+# resource_id -> (corpus_version, document centroid); tiny, so kept for every resource
+_centroids = {}
+_lock = threading.Lock()
+
+
+def load_reference_text(resource):
+    reference_text = None
+    file_path = resource.get("file_path")
+    if isinstance(file_path, str) and Path(file_path).exists():
+        reference_text = truetypealgorithm.read_file(file_path)
+        if isinstance(reference_text, list):
+            reference_text = "\n".join(reference_text)
+    else:
+        file_url = resource.get("file_url")
+        if isinstance(file_url, str) and file_url:
+            response = requests.get(file_url)
+            if response.status_code == 200:
+                content_type = response.headers.get("Content-Type", "")
+                temp_path = UPLOAD_DIR / f"temp_{resource['id']}"
+                if "text/plain" in content_type:
+                    reference_text = response.text
+                elif "application/pdf" in content_type:
+                    temp_path = temp_path.with_suffix(".pdf")
+                    with open(temp_path, "wb") as f:
+                        f.write(response.content)
+                    reference_text = truetypealgorithm.read_file(str(temp_path))
+                    temp_path.unlink()
+                elif "wordprocessingml.document" in content_type:
+                    temp_path = temp_path.with_suffix(".docx")
+                    with open(temp_path, "wb") as f:
+                        f.write(response.content)
+                    reference_text = truetypealgorithm.read_file(str(temp_path))
+                    temp_path.unlink()
+            # Skip if unsupported
+    return reference_text
+
+
+def _entry_paths(resource_id, version):
+    stem = INDEX_DIR / f"{resource_id}_{version}"
+    return stem.with_suffix(".npy"), stem.with_suffix(".json")
+
+
+def _centroid_path(resource_id, version):
+    return INDEX_DIR / f"{resource_id}_{version}_centroid.npy"
+
+
+def _load_from_disk(resource, version):
+    embeddings_path, meta_path = _entry_paths(resource["id"], version)
+    if not (embeddings_path.exists() and meta_path.exists()):
+        return None
+    try:
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        # Memory-mapped matrices live in the page cache, shared by every worker
+        embeddings = np.load(embeddings_path, mmap_mode="r" if CORPUS_MMAP else None)
+    except Exception as e:
+        logging.warning(f"Discarding unreadable index entry for resource {resource['id']}: {e}")
+        return None
+    return {
+        "resource_id": resource["id"],
+        "version": version,
+        "title": resource.get("title", "Undefined Resource"),
+        "sentences": meta["sentences"],
+        "lines": meta["lines"],
+        "embeddings": embeddings,
+    }
+
+
+def _annotate_citations(entry):
+    # In-text citations and the reference section are scanned once per entry,
+    # not once per matched pair
+    entry["citations"] = CitationAnnotations(entry["sentences"])
+    entry["references"] = parse_references(entry["lines"])
+    return entry
+
+
+def _save_to_disk(entry):
+    INDEX_DIR.mkdir(parents=True, exist_ok=True)
+    # Older versions of this resource are unreachable from now on
+    for stale in INDEX_DIR.glob(f"{entry['resource_id']}_*"):
+        stale.unlink(missing_ok=True)
+    embeddings_path, meta_path = _entry_paths(entry["resource_id"], entry["version"])
+    np.save(embeddings_path, entry["embeddings"])
+    np.save(_centroid_path(entry["resource_id"], entry["version"]), hierarchy.document_centroid(entry["embeddings"]))
+    meta_path.write_text(
+        json.dumps({"sentences": entry["sentences"], "lines": entry["lines"]}),
+        encoding="utf-8",
+    )
+
+
+def build_resource_entry(resource):
+    reference_text = load_reference_text(resource)
+    if not isinstance(reference_text, str):
+        return None
+    sentences = truetypealgorithm.read_text(reference_text)
+    if not sentences:
+        return None
+    return {
+        "resource_id": resource["id"],
+        "version": resource.get("corpus_version", 0),
+        "title": resource.get("title", "Undefined Resource"),
+        "sentences": sentences,
+        "lines": reference_text.split("\n"),
+        "embeddings": truetypealgorithm.encode_sentences(sentences),
+    }
+
+
+def get_resource_entry(resource):
+    """
+    Sentences, raw lines, citation annotations, parsed references, normalized
+    sentence embeddings and document/paragraph centroids of a resource. Served from memory, then disk, and only
+    parsed and encoded when the resource is new or its corpus_version changed.
+    Returns None for resources without usable text.
+    """
+    resource_id = resource["id"]
+    version = resource.get("corpus_version", 0)
+
+    with _lock:
+        entry = _entries.get(resource_id)
+        if _empty.get(resource_id) == version:
+            return None
+    if entry is not None and entry["version"] == version:
+        return entry
+
+    entry = _load_from_disk(resource, version)
+    if entry is None:
+        entry = build_resource_entry(resource)
+        if entry is None:
+            with _lock:
+                _empty[resource_id] = version
+            return None
+        _save_to_disk(entry)
+        if CORPUS_MMAP:
+            entry["embeddings"] = np.load(_entry_paths(resource_id, version)[0], mmap_mode="r")
+    _annotate_citations(entry)
+    hierarchy.add_centroids(entry)
+
+    with _lock:
+        _entries[resource_id] = entry
+    return entry
+
+
+def resource_embeddings(resource):
+    """
+    Sentence embeddings of a resource without keeping a full entry in memory:
+    the cached entry if there is one, else the on-disk array memory-mapped, else
+    a freshly built entry. None for resources without usable text.
+    """
+    version = resource.get("corpus_version", 0)
+    with _lock:
+        entry = _entries.get(resource["id"])
+    if entry is not None and entry["version"] == version:
+        return entry["embeddings"]
+    embeddings_path, _ = _entry_paths(resource["id"], version)
+    if embeddings_path.exists():
+        try:
+            return np.load(embeddings_path, mmap_mode="r")
+        except Exception as e:
+            logging.warning(f"Could not map embeddings of resource {resource['id']}: {e}")
+    entry = get_resource_entry(resource)
+    return entry["embeddings"] if entry is not None else None
+
+
+def resource_sentences(resource, build=True):
+    """
+    Sentences of a resource, from the cached entry or the on-disk index without
+    loading its embeddings; built like resource_embeddings otherwise, or None
+    without `build`.
+    """
+    version = resource.get("corpus_version", 0)
+    with _lock:
+        entry = _entries.get(resource["id"])
+    if entry is not None and entry["version"] == version:
+        return entry["sentences"]
+    _, meta_path = _entry_paths(resource["id"], version)
+    if meta_path.exists():
+        try:
+            return json.loads(meta_path.read_text(encoding="utf-8"))["sentences"]
+        except Exception as e:
+            logging.warning(f"Could not read sentences of resource {resource['id']}: {e}")
+    if not build:
+        return None
+    entry = get_resource_entry(resource)
+    return entry["sentences"] if entry is not None else None
+
+
+def embeddings_path(resource):
+    """
+    Path of the resource's on-disk embeddings, building the entry first if
+    needed. None for resources without usable text.
+    """
+    path, _ = _entry_paths(resource["id"], resource.get("corpus_version", 0))
+    if not path.exists() and get_resource_entry(resource) is None:
+        return None
+    return path if path.exists() else None
+
+
+def resource_centroid(resource):
+    """
+    Document centroid of a resource (see hierarchy.py) without loading its
+    sentences or embeddings when the index has it; entries indexed before
+    centroids were saved get theirs computed from the memory-mapped embeddings
+    once. None for resources without usable text.
+    """
+    resource_id = resource["id"]
+    version = resource.get("corpus_version", 0)
+    with _lock:
+        cached = _centroids.get(resource_id)
+        entry = _entries.get(resource_id)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    if entry is not None and entry["version"] == version:
+        centroid = entry["centroid"]
+    else:
+        path = _centroid_path(resource_id, version)
+        centroid = None
+        try:
+            if path.exists():
+                centroid = np.load(path)
+            else:
+                embeddings = resource_embeddings(resource)
+                if embeddings is None:
+                    return None
+                centroid = hierarchy.document_centroid(embeddings)
+                if _entry_paths(resource_id, version)[0].exists():
+                    np.save(path, centroid)
+        except Exception as e:
+            logging.warning(f"Could not read the centroid of resource {resource_id}: {e}")
+            entry = get_resource_entry(resource)
+            if entry is None:
+                return None
+            centroid = entry["centroid"]
+    with _lock:
+        _centroids[resource_id] = (version, centroid)
+    return centroid
@@ -0,0 +1,101 @@
+# detection_service.py
+import json
+import os
+import shutil
+import uuid
+from pathlib import Path
+
+from starlette.concurrency import run_in_threadpool
+
+from app.algorithm.pipeline import (
+    add_peer_results,
+    assign_check_state,
+    detection_settings,
+    run_batch_check,
+    run_plagiarism_check,
+)
+from app.algorithm.report_cache import get_cached_report, hash_file, memory_cache, store_report
+from app.controllers.resource_controller import get_corpus_version
+from app.utils.compute_threads import thread_settings
+from app.utils.single_flight import SingleFlight
+
+# -----------------------------
+# Detection entry points
+# -----------------------------
+# What the API needs from the detection pipeline, in the form both the API
+# process (no DETECTION_WORKER_URL) and the detection worker service call it.
+
+# Identical uploads checked at the same time share one pipeline run
+check_flight = SingleFlight()
+
+
+def check_and_store(user_file, filename, content_hash, corpus_version, settings, user_id=None, resource_filter=None):
+    # Logged-in users get their previous draft's embeddings and matches reused
+    final_plag = run_plagiarism_check(
+        user_file, content_hash, corpus_version, uploaded_filename=filename, user_id=user_id,
+        resource_filter=resource_filter,
+    )
+    # Partial (time-budgeted) reports and reports of unreadable files are not
+    # cached; the next upload checks again
+    if not final_plag.get("partial") and final_plag.get("user_files"):
+        store_report(content_hash, corpus_version, settings, final_plag)
+    return final_plag
+
+
+def private_copy(user_file):
+    """
+    A hard link (or copy) of the upload for the shared check: the request that
+    started it deletes its own file as soon as it is cancelled, while the check
+    keeps running for the others.
+    """
+    path = Path(user_file)
+    copy = path.with_name(f"{uuid.uuid4().hex}_{path.name}")
+    try:
+        os.link(path, copy)
+    except OSError:
+        shutil.copyfile(path, copy)
+    return copy
+
+
+async def check_upload(user_file, filename, user_id=None, resource_filter=None, peer_details=False):
+    content_hash = hash_file(user_file)
+    corpus_version = get_corpus_version()
+    settings = detection_settings(resource_filter)
+
+    final_plag = get_cached_report(content_hash, corpus_version, settings)
+    if final_plag is None:
+        check_file = private_copy(user_file)
+        final_plag = await check_flight.run(
+            (content_hash, corpus_version, settings),
+            check_and_store, str(check_file), filename, content_hash, corpus_version, settings,
+            user_id, resource_filter, release=lambda: check_file.unlink(missing_ok=True),
+        )
+    # Cached and coalesced reports carry no check_id, or the first caller's
+    final_plag = await run_in_threadpool(
+        assign_check_state, final_plag, content_hash, corpus_version, user_id, resource_filter
+    )
+    # Matches against other users' submissions are never cached
+    final_plag = await run_in_threadpool(
+        add_peer_results, final_plag, content_hash, user_id=user_id, peer_details=peer_details
+    )
+    return {**final_plag, "uploaded_filename": filename}
+
+
+def upload_metrics():
+    return {
+        "coalescing": check_flight.stats(),
+        "report_cache": memory_cache.stats(),
+        "compute_threads": thread_settings(),
+    }
+
+
+def batch_lines(submissions, user_id=None, pairwise=False, peer_details=False):
+    """
+    run_batch_check as newline-delimited JSON: one line per report, with its
+    "position", and a last {"pairwise": ...} line when asked for.
+    """
+    for position, report in run_batch_check(submissions, user_id=user_id, pairwise=pairwise, peer_details=peer_details):
+        if position is None:
+            yield json.dumps(report, default=str) + "\n"
+        else:
+            yield json.dumps({"position": position, **report}, default=str) + "\n"
@@ -0,0 +1,75 @@
+# hierarchy.py
+import numpy as np
+
+from app.algorithm.truetypealgorithm import normalize_embeddings
+from app.config import HIERARCHY_PARAGRAPH_SENTENCES, HIERARCHY_TOP_PARAGRAPHS, HIERARCHY_TOP_RESOURCES
+
+# -----------------------------
+# Coarse-to-fine matching
+# -----------------------------
+# Documents are cut into paragraphs of HIERARCHY_PARAGRAPH_SENTENCES consecutive
+# sentences. Resources are ranked by their document centroid, and inside the
+# shortlisted resources each submission paragraph is only compared sentence by
+# sentence with its best-matching resource paragraphs.
+
+
+def paragraph_centroids(embeddings, size=HIERARCHY_PARAGRAPH_SENTENCES):
+    """
+    Normalized mean embedding of every run of `size` consecutive sentences.
+    """
+    if len(embeddings) == 0:
+        return np.zeros((0, embeddings.shape[1]), dtype=np.float32)
+    sums = np.add.reduceat(embeddings, np.arange(0, len(embeddings), size), axis=0)
+    return normalize_embeddings(sums)
+
+
+def document_centroid(embeddings):
+    return normalize_embeddings(np.asarray(embeddings).sum(axis=0, keepdims=True))[0]
+
+
+def add_centroids(entry, size=HIERARCHY_PARAGRAPH_SENTENCES):
+    entry["paragraph_centroids"] = paragraph_centroids(entry["embeddings"], size)
+    entry["centroid"] = document_centroid(entry["embeddings"])
+    return entry
+
+
+def rank_resources(query_centroids, entries, top=HIERARCHY_TOP_RESOURCES):
+    """
+    The `top` entries whose document centroid is closest to any submission
+    paragraph, in their original order.
+    """
+    if len(entries) <= top or len(query_centroids) == 0:
+        return entries
+    document_centroids = np.stack([entry["centroid"] for entry in entries])
+    scores = (query_centroids @ document_centroids.T).max(axis=0)
+    keep = np.argsort(-scores, kind="stable")[:top]
+    return [entries[i] for i in sorted(keep)]
+
+
+def restricted_similarity(user_embeddings, query_centroids, entry, rows=None,
+                          top_paragraphs=HIERARCHY_TOP_PARAGRAPHS, size=HIERARCHY_PARAGRAPH_SENTENCES):
+    """
+    Similarity matrix of the submission `rows` against the resource sentences in
+    the shape exhaustive matching produces, filled only inside each submission
+    paragraph's `top_paragraphs` closest resource paragraphs; all other cells are -1.
+    """
+    if rows is None:
+        rows = np.arange(len(user_embeddings))
+    resource_embeddings = entry["embeddings"]
+    similarity = np.full((len(rows), len(resource_embeddings)), -1.0, dtype=np.float32)
+    if not len(rows) or not len(resource_embeddings):
+        return similarity
+
+    paragraph_similarity = query_centroids @ entry["paragraph_centroids"].T
+    fan_out = min(top_paragraphs, paragraph_similarity.shape[1])
+    best_paragraphs = np.argpartition(-paragraph_similarity, fan_out - 1, axis=1)[:, :fan_out]
+
+    row_paragraphs = rows // size
+    for paragraph in np.unique(row_paragraphs):
+        local = np.nonzero(row_paragraphs == paragraph)[0]
+        columns = np.concatenate([
+            np.arange(p * size, min((p + 1) * size, len(resource_embeddings)))
+            for p in np.sort(best_paragraphs[paragraph])
+        ])
+        similarity[np.ix_(local, columns)] = user_embeddings[rows[local]] @ resource_embeddings[columns].T
+    return similarity
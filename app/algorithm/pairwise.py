@@ -0,0 +1,80 @@
+# pairwise.py
+import numpy as np
+
+from app.algorithm import truetypealgorithm
+from app.algorithm.ann_index import hit_similarity
+from app.config import PAIRWISE_BLOCK_SIZE
+
+# -----------------------------
+# Submission x submission overlap
+# -----------------------------
+# The sentence embeddings of a whole class set are stacked into one matrix and
+# compared with themselves in square blocks of PAIRWISE_BLOCK_SIZE rows. Only
+# blocks on or above the diagonal are computed, and of those only the entries
+# above the similarity threshold between two different submissions are kept, so
+# memory grows with the number of similar sentence pairs, not with the set size.
+
+
+def pairwise_hits(embeddings, offsets, threshold=truetypealgorithm.SIMILARITY_THRESHOLD, block=PAIRWISE_BLOCK_SIZE):
+    """
+    Sentence pairs above `threshold` between submissions a < b (rows of
+    `embeddings` split at `offsets`), grouped by pair:
+    {(a, b): (sentences of a, sentences of b, similarity)}.
+    """
+    total = len(embeddings)
+    owner = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    found = []
+    for row_start in range(0, total, block):
+        rows = embeddings[row_start:row_start + block]
+        for col_start in range(row_start, total, block):
+            similarity = rows @ embeddings[col_start:col_start + block].T
+            r, c = np.nonzero(similarity >= threshold)
+            sims = similarity[r, c]
+            r, c = r + row_start, c + col_start
+            # Same-submission pairs and the mirrored half of diagonal blocks
+            keep = owner[r] < owner[c]
+            found.append((r[keep], c[keep], sims[keep]))
+    if not found:
+        return {}
+
+    r, c, sims = (np.concatenate(parts) for parts in zip(*found))
+    pair = owner[r] * (len(offsets) - 1) + owner[c]
+    order = np.argsort(pair, kind="stable")
+    pairs, starts = np.unique(pair[order], return_index=True)
+    hits = {}
+    for key, group in zip(pairs, np.split(order, starts[1:])):
+        a, b = divmod(int(key), len(offsets) - 1)
+        hits[(a, b)] = (r[group] - offsets[a], c[group] - offsets[b], sims[group])
+    return hits
+
+
+def pairwise_overlap(documents, offsets, embeddings, names):
+    """
+    The overlap of every submission with every other. "overlap"[a][b] is the
+    share of a's sentences matched in b (exact + partial); "pairs" lists the
+    submission pairs with any match, with the passages they share, most
+    overlapping first.
+    """
+    overlap = np.zeros((len(documents), len(documents)))
+    pairs = []
+    for (a, b), (rows_a, rows_b, sims) in pairwise_hits(embeddings, offsets).items():
+        similarity = hit_similarity((rows_a, rows_b, sims), len(documents[a]), len(documents[b]))
+        forward = truetypealgorithm.match_sentences(documents[a], documents[b], similarity, names[b])
+        backward = truetypealgorithm.match_sentences(documents[b], documents[a], similarity.T, names[a])
+        summary = truetypealgorithm.summarize_matches(documents[a], forward, names[b])
+        overlap[a, b] = summary["exact_score"] + summary["partial_score"]
+        overlap[b, a] = len(backward) / len(documents[b])
+        pairs.append({
+            "submissions": [a, b],
+            "filenames": [names[a], names[b]],
+            "overlap": [round(overlap[a, b], 4), round(overlap[b, a], 4)],
+            "exact_score": summary["exact_score"],
+            "partial_score": summary["partial_score"],
+            "passages": summary["passages"],
+        })
+    pairs.sort(key=lambda p: -max(p["overlap"]))
+    return {
+        "submissions": list(names),
+        "overlap": np.round(overlap, 4).tolist(),
+        "pairs": pairs,
+    }
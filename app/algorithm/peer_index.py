@@ -0,0 +1,304 @@
+# peer_index.py
+import logging
+import threading
+import time
+
+import numpy as np
+
+from app.algorithm import truetypealgorithm
+from app.algorithm.ann_index import train_coarse, hit_similarity
+from app.config import ANN_NPROBE, PEER_MIN_TRAIN, PEER_PRUNE_SECONDS, SIMILARITY_THRESHOLD
+from app.database.db_connect import test_database_connection
+
+# -----------------------------
+# Prior submissions
+# -----------------------------
+# Sentences of every saved report (reports.submitted_document, one sentence per
+# line as the check returned it), with embeddings reused from the report's check
+# state where it is linked. New reports are appended on the next search. Once
+# PEER_MIN_TRAIN sentences are indexed they are split into inverted lists (as in
+# ann_index) and a query only scans its ANN_NPROBE closest lists, plus the rows
+# appended since the lists were last grouped.
+# Everything that touches the whole index runs on one background thread, never
+# on a check: (re)training the lists whenever the index has doubled, regrouping
+# them, and dropping deleted reports. Reports found deleted when a check hits
+# them are tombstoned until then; the full list of report ids is re-read every
+# PEER_PRUNE_SECONDS.
+
+
+class PeerIndex:
+
+    def __init__(self):
+        self.last_id = 0
+        self.embeddings = None
+        self.report_ids = np.zeros(0, dtype=np.int64)
+        self.user_ids = np.zeros(0, dtype=np.int64)
+        self.sentence_idx = np.zeros(0, dtype=np.int64)
+        self.sentences = {}  # report_id -> sentences
+        self.owners = {}  # report_id -> user_id (None for guests)
+        self.deleted = set()  # tombstoned report ids, still in the arrays
+        self.coarse = None
+        self.lists = np.zeros(0, dtype=np.int64)
+        self.trained_size = 0
+        self._members = np.zeros(0, dtype=np.int64)  # rows grouped by list
+        self._offsets = np.zeros(1, dtype=np.int64)  # row range of every list in _members
+        self._grouped = 0  # rows covered by _members; later rows are scanned directly
+        self._pruned_at = time.monotonic()
+        self._maintaining = False
+        self._lock = threading.Lock()
+
+    def _fetch(self, cursor):
+        cursor.execute("""
+            SELECT r.id, r.user_id, r.submitted_document, cs.state, cs.embeddings
+            FROM reports r
+            LEFT JOIN check_states cs ON cs.report_id = r.id
+            WHERE r.id > %s
+            ORDER BY r.id
+        """, (self.last_id,))
+        return cursor.fetchall()
+
+    def refresh(self):
+        """
+        Appends reports saved since the last refresh and starts the background
+        maintenance when it is due. Work here grows with the new reports only.
+        """
+        conn = test_database_connection()
+        if not conn:
+            return
+        cursor = conn.cursor()
+        try:
+            with self._lock:
+                rows = self._fetch(cursor)
+                if rows:
+                    self._append(rows)
+        except Exception as e:
+            print(f"⚠️ Could not refresh peer index: {e}")
+        finally:
+            cursor.close()
+            conn.close()
+        self._schedule_maintenance()
+
+    def _append(self, rows):
+        new_embeddings, new_reports, new_users, new_sentences = [], [], [], []
+        for report_id, user_id, document, state, embeddings in rows:
+            self.last_id = max(self.last_id, report_id)
+            sentences = [line for line in (document or "").split("\n") if line.strip()]
+            if not sentences:
+                continue
+            if embeddings is not None and state and state.get("sentences") == sentences and state.get("embedding_dim"):
+                vectors = np.frombuffer(bytes(embeddings), dtype=np.float32).reshape(-1, state["embedding_dim"])
+            else:
+                vectors = truetypealgorithm.encode_sentences(sentences)
+            self.sentences[report_id] = sentences
+            self.owners[report_id] = user_id
+            new_embeddings.append(vectors)
+            new_reports.append(np.full(len(sentences), report_id, dtype=np.int64))
+            new_users.append(np.full(len(sentences), -1 if user_id is None else user_id, dtype=np.int64))
+            new_sentences.append(np.arange(len(sentences), dtype=np.int64))
+        if not new_embeddings:
+            return
+
+        added = np.concatenate(new_embeddings)
+        self.embeddings = added if self.embeddings is None else np.concatenate([self.embeddings, added])
+        self.report_ids = np.concatenate([self.report_ids] + new_reports)
+        self.user_ids = np.concatenate([self.user_ids] + new_users)
+        self.sentence_idx = np.concatenate([self.sentence_idx] + new_sentences)
+        if self.coarse is not None:
+            self.lists = np.concatenate([self.lists, np.argmax(added @ self.coarse.T, axis=1)])
+
+    def _maintenance_due(self):
+        if self.embeddings is None:
+            return False
+        return (
+            len(self.embeddings) >= max(PEER_MIN_TRAIN, 2 * self.trained_size)
+            or (self.coarse is not None and self._grouped < len(self.embeddings))
+            or bool(self.deleted)
+            or time.monotonic() - self._pruned_at > PEER_PRUNE_SECONDS
+        )
+
+    def _schedule_maintenance(self):
+        with self._lock:
+            if self._maintaining or not self._maintenance_due():
+                return
+            self._maintaining = True
+        threading.Thread(target=self._maintain, daemon=True).start()
+
+    def _maintain(self):
+        try:
+            if time.monotonic() - self._pruned_at > PEER_PRUNE_SECONDS:
+                self._find_deleted()
+            with self._lock:
+                self._drop_deleted()
+                embeddings = self.embeddings
+                retrain = len(embeddings) >= max(PEER_MIN_TRAIN, 2 * self.trained_size)
+            if retrain:
+                # Rows are only appended meanwhile (this thread is the only one
+                # dropping), so the first len(embeddings) rows stay the same
+                logging.info(f"Training peer index lists over {len(embeddings)} sentences")
+                coarse, lists = train_coarse(embeddings, int(4 * np.sqrt(len(embeddings))))
+                with self._lock:
+                    added = self.embeddings[len(embeddings):]
+                    self.coarse = coarse
+                    self.lists = np.concatenate([lists, np.argmax(added @ coarse.T, axis=1)])
+                    self.trained_size = len(embeddings)
+            with self._lock:
+                lists, coarse = self.lists, self.coarse
+            if coarse is not None:
+                members = np.argsort(lists, kind="stable")
+                offsets = np.searchsorted(lists[members], np.arange(len(coarse) + 1))
+                with self._lock:
+                    if self.coarse is coarse:
+                        self._members, self._offsets, self._grouped = members, offsets, len(lists)
+        except Exception as e:
+            print(f"⚠️ Peer index maintenance failed: {e}")
+        finally:
+            with self._lock:
+                self._maintaining = False
+
+    def _find_deleted(self):
+        conn = test_database_connection()
+        if not conn:
+            return
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT id FROM reports WHERE id <= %s", (self.last_id,))
+            existing = {row[0] for row in cursor.fetchall()}
+        finally:
+            cursor.close()
+            conn.close()
+        with self._lock:
+            self.deleted.update(report_id for report_id in self.sentences if report_id not in existing)
+            self._pruned_at = time.monotonic()
+
+    def _drop_deleted(self):
+        if not self.deleted:
+            return
+        keep = ~np.isin(self.report_ids, np.fromiter(self.deleted, dtype=np.int64))
+        for report_id in self.deleted:
+            self.sentences.pop(report_id, None)
+            self.owners.pop(report_id, None)
+        self.deleted = set()
+        self.embeddings = self.embeddings[keep]
+        self.report_ids, self.user_ids = self.report_ids[keep], self.user_ids[keep]
+        self.sentence_idx = self.sentence_idx[keep]
+        if self.coarse is not None:
+            self.lists = self.lists[keep]
+            # Old groups point at the old rows; everything is scanned directly until regrouped
+            self._members, self._offsets, self._grouped = (
+                np.zeros(0, dtype=np.int64), np.zeros(len(self.coarse) + 1, dtype=np.int64), 0
+            )
+
+    def confirm(self, report_ids):
+        """
+        The subset of `report_ids` that still exists; the others are tombstoned.
+        """
+        report_ids = list(report_ids)
+        if not report_ids:
+            return set()
+        conn = test_database_connection()
+        if not conn:
+            return set(report_ids)
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT id FROM reports WHERE id = ANY(%s)", (report_ids,))
+            existing = {row[0] for row in cursor.fetchall()}
+        finally:
+            cursor.close()
+            conn.close()
+        with self._lock:
+            self.deleted.update(set(report_ids) - existing)
+        return existing
+
+    def search(self, queries, exclude_user_id=None, exclude_report_id=None, nprobe=ANN_NPROBE,
+               min_similarity=SIMILARITY_THRESHOLD):
+        """
+        Best prior-submission sentence of every query per report, where it
+        reaches `min_similarity`, grouped by report: {report_id: (rows,
+        sentence_idx, similarity)}. Sentences of `exclude_user_id`,
+        `exclude_report_id` and tombstoned reports are never returned.
+        """
+        with self._lock:
+            if self.embeddings is None or not len(queries):
+                return {}
+            embeddings, report_ids, user_ids, sentence_idx = (
+                self.embeddings, self.report_ids, self.user_ids, self.sentence_idx
+            )
+            coarse, members, offsets, grouped = self.coarse, self._members, self._offsets, self._grouped
+            deleted = np.fromiter(self.deleted, dtype=np.int64)
+
+        if coarse is None:
+            candidates = [np.arange(len(report_ids))] * len(queries)
+        else:
+            probe = min(nprobe, len(coarse))
+            probed = np.argpartition(-(queries @ coarse.T), probe - 1, axis=1)[:, :probe]
+            recent = np.arange(grouped, len(report_ids))
+            candidates = [
+                np.concatenate([members[offsets[l]:offsets[l + 1]] for l in probed[i]] + [recent])
+                for i in range(len(queries))
+            ]
+
+        hits = {}
+        for i, rows in enumerate(candidates):
+            similarity = embeddings[rows] @ queries[i]
+            keep = similarity >= min_similarity
+            if exclude_user_id is not None:
+                keep &= user_ids[rows] != exclude_user_id
+            if exclude_report_id is not None:
+                keep &= report_ids[rows] != exclude_report_id
+            if len(deleted):
+                keep &= ~np.isin(report_ids[rows], deleted)
+            rows, similarity = rows[keep], similarity[keep]
+            if not len(rows):
+                continue
+            # Best sentence per report for this query
+            order = np.lexsort((-similarity, report_ids[rows]))
+            first = np.ones(len(order), dtype=bool)
+            first[1:] = report_ids[rows][order][1:] != report_ids[rows][order][:-1]
+            for row, sim in zip(rows[order][first], similarity[order][first]):
+                hit = hits.setdefault(int(report_ids[row]), ([], [], []))
+                hit[0].append(i)
+                hit[1].append(int(sentence_idx[row]))
+                hit[2].append(float(sim))
+        return {
+            report_id: (np.array(r, dtype=np.int64), np.array(s, dtype=np.int64), np.array(v, dtype=np.float32))
+            for report_id, (r, s, v) in hits.items()
+        }
+
+
+peer_index = PeerIndex()
+
+
+PEER_SCORE_FIELDS = ("filename", "exact_score", "partial_score", "unique_score", "total_score")
+
+
+def find_peer_matches(user_sentences, user_embeddings, user_id=None, exclude_report_id=None, details=False):
+    """
+    Per prior report with matches above the similarity threshold: its id and
+    scores. With `details` (PEER_DETAIL_ROLES only), also its author and the
+    usual per-source summary (matched pairs and passages with its sentences).
+    """
+    peer_index.refresh()
+    hits = peer_index.search(user_embeddings, exclude_user_id=user_id, exclude_report_id=exclude_report_id)
+    existing = peer_index.confirm(hits)
+    with peer_index._lock:
+        owners = {report_id: peer_index.owners.get(report_id) for report_id in hits}
+        documents = {report_id: peer_index.sentences.get(report_id) for report_id in hits}
+
+    peer_results = []
+    for report_id, report_hits in sorted(hits.items()):
+        sentences = documents[report_id]
+        if sentences is None or report_id not in existing:
+            continue
+        source_name = f"Submission #{report_id}"
+        similarity_matrix = hit_similarity(report_hits, len(user_sentences), len(sentences))
+        matched_pairs = truetypealgorithm.match_sentences(user_sentences, sentences, similarity_matrix, source_name)
+        if not matched_pairs:
+            continue
+        result = truetypealgorithm.summarize_matches(user_sentences, matched_pairs, source_name)
+        if details:
+            result["user_id"] = owners[report_id]
+        else:
+            result = {field: result[field] for field in PEER_SCORE_FIELDS}
+        result["report_id"] = report_id
+        peer_results.append(result)
+    return sorted(peer_results, key=lambda r: -(r["exact_score"] + r["partial_score"]))
@@ -0,0 +1,828 @@
+# pipeline.py
+import logging
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from fastapi import HTTPException
+
+from app.algorithm import ann_index, hierarchy, sharded_index, truetypealgorithm
+from app.algorithm.algoimplementation import total_score
+from app.algorithm.boilerplate import suppress_boilerplate
+from app.algorithm.check_state import (
+    claim_check_state,
+    diff_sentences,
+    drop_top_matches,
+    load_check_state,
+    load_check_state_by_hash,
+    load_latest_user_check_state,
+    new_top_matches,
+    rebuild_top_matches,
+    remap_top_matches,
+    replace_top_matches,
+    resolve_sentences,
+    save_check_state,
+    source_stats,
+    top_matches_from_json,
+    top_matches_to_json,
+    update_top_matches,
+)
+from app.algorithm.citation_checker import classify_citation_status, reference_index
+from app.algorithm.corpus_filter import filter_resources
+from app.algorithm.corpus_index import get_resource_entry, resource_centroid
+from app.algorithm.pairwise import pairwise_overlap
+from app.algorithm.peer_index import find_peer_matches
+from app.algorithm.rerank import BorderlinePairs
+from app.algorithm.report_cache import get_cached_report, hash_file, store_report
+from app.algorithm.resource_filter import filter_key, normalize_filter
+from app.algorithm.screening import rank_by_screening, screen_resources
+from app.controllers.report_controller import update_report_scores
+from app.config import (
+    ANN_NPROBE,
+    ANN_RERANK,
+    BATCH_PARSE_WORKERS,
+    BOILERPLATE_MAX_DF,
+    BOILERPLATE_MIN_DOCS,
+    BOILERPLATE_MIN_WORDS,
+    BOILERPLATE_PHRASE_SHARE,
+    BOILERPLATE_PHRASE_WORDS,
+    CHECK_TIME_BUDGET,
+    COMPARE_WORKERS,
+    EXACT_EARLY_STOP,
+    HIERARCHY_PARAGRAPH_SENTENCES,
+    HIERARCHY_TOP_PARAGRAPHS,
+    HIERARCHY_TOP_RESOURCES,
+    MATCHING_MODE,
+    PEER_SEARCH,
+    RERANK_BAND_HIGH,
+    RERANK_BAND_LOW,
+    RERANK_BUDGET,
+    RERANK_EXACT_THRESHOLD,
+    RERANK_SCORER,
+    RERANK_THRESHOLD,
+    SCREENING_TOP_RESOURCES,
+    SHARD_TOP_K,
+)
+from app.controllers.resource_controller import get_all_resources, get_corpus_version, get_resource_by_id
+
+
+def detection_settings(resource_filter=None):
+    # Everything that changes the outcome of a check for the same upload and corpus
+    settings = (
+        f"{truetypealgorithm.MODEL_NAME}"
+        f"|threshold={truetypealgorithm.SIMILARITY_THRESHOLD}"
+        f"|exact={truetypealgorithm.EXACT_THRESHOLD}"
+        f"|segmenter={truetypealgorithm.SENTENCE_SEGMENTER}"
+    )
+    if BOILERPLATE_MIN_WORDS or BOILERPLATE_MAX_DF:
+        settings += f"|boilerplate={BOILERPLATE_MIN_WORDS}/{BOILERPLATE_MAX_DF}/{BOILERPLATE_MIN_DOCS}"
+        if BOILERPLATE_MAX_DF and BOILERPLATE_PHRASE_WORDS:
+            settings += f"|phrases={BOILERPLATE_PHRASE_WORDS}/{BOILERPLATE_PHRASE_SHARE}"
+    if SCREENING_TOP_RESOURCES:
+        settings += f"|screening={SCREENING_TOP_RESOURCES}"
+    if EXACT_EARLY_STOP:
+        settings += "|early_stop"
+    if RERANK_SCORER:
+        settings += (
+            f"|rerank={RERANK_SCORER}/{RERANK_BAND_LOW}/{RERANK_BAND_HIGH}/{RERANK_BUDGET}"
+            f"/{RERANK_THRESHOLD}/{RERANK_EXACT_THRESHOLD}"
+        )
+    if MATCHING_MODE == "hierarchical":
+        settings += (
+            f"|hierarchical={HIERARCHY_PARAGRAPH_SENTENCES}"
+            f"/{HIERARCHY_TOP_RESOURCES}/{HIERARCHY_TOP_PARAGRAPHS}"
+        )
+    elif MATCHING_MODE == "ann":
+        settings += f"|ann={ANN_NPROBE}/{ANN_RERANK}"
+    elif MATCHING_MODE == "sharded":
+        settings += f"|sharded={SHARD_TOP_K}"
+    if normalize_filter(resource_filter):
+        settings += f"|filter={filter_key(resource_filter)}"
+    return settings
+
+
+def compare_resources(user_sentences, user_embeddings, resources, top, previous=None, db_keys=None,
+                      borderline=None, deadline=None, coverage=None):
+    """
+    Compares the submission with every resource and returns the per-resource results.
+
+    `previous` describes an earlier check of (a draft of) the same text:
+    {"results": {resource_id: result}, "old_to_new": {old_idx: new_idx},
+     "changed_rows": array, "unchanged": bool}.
+    Resources with a still-valid earlier result are only searched for the changed
+    rows; the matches of unchanged rows are carried over.
+
+    With SCREENING_TOP_RESOURCES set, resources are first screened by their title
+    and content (see screening.py). In hierarchical MATCHING_MODE only shortlisted
+    resources are compared, and only inside the closest paragraphs (see hierarchy.py).
+    In ann mode the whole corpus is searched once through the IVF/PQ index (see
+    ann_index.py); only resources with hits, or not yet indexed, are loaded.
+    Sharded mode does the same with an exact search across shard processes (see
+    sharded_index.py).
+    With RERANK_SCORER set, borderline pairs are collected in `borderline` across
+    all resources and the most similar are re-scored at the end (see rerank.py).
+
+    With a `deadline` (time.monotonic()), resources are compared most promising
+    first by screening score and the rest are skipped once it has passed. With
+    EXACT_EARLY_STOP, a sentence is no longer searched once it has an exact match.
+    Either way `coverage`, if given, is filled in with what was actually compared.
+
+    With COMPARE_WORKERS > 1, resources are loaded and their similarity matrices
+    computed on a thread pool (BLAS threads are capped per process, see
+    compute_threads.py).
+    """
+    total_result = []
+    entries = {}
+    positions = {r["id"]: position for position, r in enumerate(resources)}
+    open_rows = np.ones(len(user_sentences), dtype=bool) if EXACT_EARLY_STOP else None
+    skipped = 0
+    if SCREENING_TOP_RESOURCES:
+        resources = screen_resources(resources, user_embeddings, keep=previous["results"] if previous else ())
+    query_centroids = None
+    ann_hits, ann_covered = None, set()
+    if MATCHING_MODE == "hierarchical":
+        query_centroids = hierarchy.paragraph_centroids(user_embeddings)
+        resources = shortlist_resources(resources, query_centroids, previous)
+    elif MATCHING_MODE == "ann":
+        ann_hits, ann_covered = ann_index.search_corpus(user_embeddings, resources)
+    elif MATCHING_MODE == "sharded":
+        ann_hits, ann_covered = sharded_index.search_corpus(user_embeddings, resources)
+    if deadline is not None:
+        # Only stored screening embeddings: encoding missing ones is not bounded by the deadline
+        resources = rank_by_screening(resources, user_embeddings, encode_missing=False)
+
+    def similarity(job):
+        # Runs on the compare pool: reading the entry and the matrix products
+        # release the GIL
+        resource, prior, rows, carried_pairs, closed = job
+        try:
+            entry = get_resource_entry(resource)
+            if entry is None:
+                return None
+            if resource["id"] in ann_covered:
+                similarity_matrix = ann_index.hit_similarity(
+                    ann_hits.get(resource["id"]), len(user_sentences), len(entry["sentences"]), rows=rows
+                )
+            elif query_centroids is not None:
+                similarity_matrix = hierarchy.restricted_similarity(user_embeddings, query_centroids, entry, rows=rows)
+            else:
+                query_embeddings = user_embeddings if rows is None else user_embeddings[rows]
+                similarity_matrix = query_embeddings @ entry["embeddings"].T
+            return entry, similarity_matrix
+        except Exception:
+            logging.warning(f"Resource error: {resource.get('title', 'Undefined Resource')}", exc_info=True)
+            return None
+
+    # Resources are compared in rounds of COMPARE_WORKERS; everything that depends
+    # on earlier resources (top-k state, borderline pairs, closed sentences) is
+    # applied between rounds in resource order, so results do not depend on timing
+    pool = ThreadPoolExecutor(max_workers=COMPARE_WORKERS) if COMPARE_WORKERS > 1 else None
+    try:
+        for start in range(0, len(resources), COMPARE_WORKERS):
+            jobs = []
+            for resource in resources[start:start + COMPARE_WORKERS]:
+                prior = previous["results"].get(resource["id"]) if previous else None
+                if prior is not None and previous["unchanged"]:
+                    total_result.append(prior)
+                    continue
+                if deadline is not None and time.monotonic() > deadline:
+                    skipped += 1
+                    continue
+                if resource["id"] in ann_covered and resource["id"] not in ann_hits and prior is None:
+                    continue
+
+                rows = None
+                carried_pairs = []
+                closed = 0
+                if prior is not None:
+                    rows = previous["changed_rows"]
+                    carried_pairs = carry_over_pairs(prior["matched_pairs"], previous["old_to_new"])
+                if open_rows is not None:
+                    candidate_rows = np.arange(len(user_sentences)) if rows is None else np.asarray(rows)
+                    rows = candidate_rows[open_rows[candidate_rows]]
+                    closed = len(candidate_rows) - len(rows)
+                    if not len(rows) and prior is None:
+                        continue
+                jobs.append((resource, prior, rows, carried_pairs, closed))
+
+            computed = pool.map(similarity, jobs) if pool else map(similarity, jobs)
+            for (resource, prior, rows, carried_pairs, closed), outcome in zip(jobs, computed):
+                if outcome is None:
+                    continue
+                entry, similarity_matrix = outcome
+                reference_name = resource.get("title", "Undefined Resource")
+                try:
+                    if borderline is not None:
+                        borderline.collect(resource["id"], similarity_matrix, entry["sentences"], row_indices=rows)
+                        entries[resource["id"]] = entry
+                    matched_pairs = truetypealgorithm.match_sentences(
+                        user_sentences, entry["sentences"], similarity_matrix, reference_name, row_indices=rows
+                    )
+                    if open_rows is not None:
+                        open_rows[[p["doc1_idx"] for p in matched_pairs if p["type"] == "exact"]] = False
+                    matched_pairs = sorted(carried_pairs + matched_pairs, key=lambda p: p["doc1_idx"])
+                    result = truetypealgorithm.build_report(
+                        user_sentences, entry["sentences"], entry["lines"], matched_pairs, reference_name,
+                        db_keys=db_keys, citations=entry["citations"], references=entry["references"],
+                    )
+                    result["resource_id"] = resource["id"]
+                    # Sentences another resource had closed were not searched here;
+                    # such results are not reused for the next draft
+                    if closed:
+                        result["rows_closed_early"] = closed
+                    update_top_matches(top, similarity_matrix, resource["id"], rows=rows)
+                    total_result.append(result)
+
+                except Exception:
+                    logging.warning(f"Resource error: {reference_name}", exc_info=True)
+    finally:
+        if pool:
+            pool.shutdown()
+
+    if borderline is not None:
+        apply_rescored(borderline, total_result, entries, top, user_sentences, db_keys=db_keys)
+    if coverage is not None:
+        coverage.update({
+            "resources_total": len(resources),
+            "resources_skipped": skipped,
+            "sentences_total": len(user_sentences),
+            "sentences_closed_early": int((~open_rows).sum()) if open_rows is not None else 0,
+        })
+    # Reports list resources in corpus order whatever order they were compared in
+    return sorted(total_result, key=lambda result: positions.get(result["resource_id"], len(positions)))
+
+
+def apply_rescored(borderline, results, entries, top, user_sentences, db_keys=None):
+    """
+    Re-scores the borderline pairs collected during a comparison and re-matches
+    the rows they are in: their pairs, report and top-k candidates are replaced
+    per resource.
+    """
+    positions = {result["resource_id"]: position for position, result in enumerate(results)}
+    for resource_id, (rows, similarity_matrix) in borderline.rescore().items():
+        if resource_id not in positions:
+            continue
+        entry, result = entries[resource_id], results[positions[resource_id]]
+        reference_name = result["filename"]
+        try:
+            matched_pairs = truetypealgorithm.match_sentences(
+                user_sentences, entry["sentences"], similarity_matrix, reference_name, row_indices=rows
+            )
+            rescored_rows = set(rows.tolist())
+            kept_pairs = [p for p in result["matched_pairs"] if p["doc1_idx"] not in rescored_rows]
+            rebuilt = truetypealgorithm.build_report(
+                user_sentences, entry["sentences"], entry["lines"],
+                sorted(kept_pairs + matched_pairs, key=lambda p: p["doc1_idx"]), reference_name,
+                db_keys=db_keys, citations=entry["citations"], references=entry["references"],
+            )
+            rebuilt["resource_id"] = resource_id
+            if "rows_closed_early" in result:
+                rebuilt["rows_closed_early"] = result["rows_closed_early"]
+            results[positions[resource_id]] = rebuilt
+            replace_top_matches(top, similarity_matrix, resource_id, rows)
+        except Exception:
+            print(f"⚠️ Resource error: {reference_name}")
+    if borderline.used:
+        logging.info(f"Re-scored {borderline.used} borderline sentence pairs")
+
+
+def shortlist_resources(resources, query_centroids, previous=None):
+    """
+    Resources with a reusable earlier result plus the HIERARCHY_TOP_RESOURCES
+    others whose document centroid is closest to the submission.
+    """
+    reused = previous["results"] if previous else {}
+    # Only document centroids are read here; entries are loaded for the shortlist
+    candidates = []
+    for resource in resources:
+        if resource["id"] in reused:
+            continue
+        try:
+            centroid = resource_centroid(resource)
+        except Exception:
+            print(f"⚠️ Resource error: {resource.get('title', 'Undefined Resource')}")
+            continue
+        if centroid is not None:
+            candidates.append({"resource_id": resource["id"], "centroid": centroid})
+    keep = {candidate["resource_id"] for candidate in hierarchy.rank_resources(query_centroids, candidates)}
+    return [r for r in resources if r["id"] in reused or r["id"] in keep]
+
+
+def carry_over_pairs(matched_pairs, old_to_new):
+    carried = []
+    for pair in matched_pairs:
+        new_idx = old_to_new.get(pair["doc1_idx"])
+        if new_idx is not None:
+            carried.append({**pair, "doc1_idx": new_idx})
+    return carried
+
+
+def reusable_results(record, resources):
+    # Results stay valid while the resource is active and unchanged since the
+    # check, and only if every sentence was searched (see EXACT_EARLY_STOP)
+    if record["settings"] != detection_settings():
+        return {}
+    versions = {r["id"]: r.get("corpus_version", 0) for r in resources}
+    return {
+        result["resource_id"]: result
+        for result in record["state"]["results"]
+        if result["resource_id"] in versions and versions[result["resource_id"]] <= record["corpus_version"]
+        and not result.get("rows_closed_early")
+    }
+
+
+def stored_embeddings(record):
+    """
+    The record's sentence embeddings if the current model produced them (same
+    MODEL_NAME, first field of the stored settings, and embedding_dim), else None.
+    """
+    embeddings = record["embeddings"]
+    if embeddings is None or record["settings"].split("|", 1)[0] != truetypealgorithm.MODEL_NAME:
+        return None
+    if embeddings.shape != (len(record["state"]["sentences"]), truetypealgorithm.model.get_sentence_embedding_dimension()):
+        return None
+    return embeddings
+
+
+def reuse_embeddings(previous_embeddings, row_map, changed_rows, user_sentences):
+    if previous_embeddings is None:
+        return truetypealgorithm.encode_sentences(user_sentences)
+    embeddings = np.empty((len(user_sentences), previous_embeddings.shape[1]), dtype=np.float32)
+    if row_map:
+        embeddings[list(row_map.keys())] = previous_embeddings[list(row_map.values())]
+    if len(changed_rows):
+        embeddings[changed_rows] = truetypealgorithm.encode_sentences([user_sentences[i] for i in changed_rows])
+    return embeddings
+
+
+def seed_top_annotations(top, results):
+    """
+    Resource sentence and citation status of the stored top-k candidates that
+    are also matched pairs of `results`; the others (below the check's
+    threshold) are left None and classified by rethreshold_check when needed.
+    """
+    num_sentences, k = top["similarity"].shape
+    annotations = {
+        "doc2_sentence": [[None] * k for _ in range(num_sentences)],
+        "citation_status": [[None] * k for _ in range(num_sentences)],
+        "citation_text": [[None] * k for _ in range(num_sentences)],
+    }
+    for result in results:
+        for pair in result.get("matched_pairs", []):
+            i = pair["doc1_idx"]
+            slots = np.nonzero(
+                (top["resource_id"][i] == result["resource_id"]) & (top["sentence_idx"][i] == pair["doc2_idx"])
+            )[0]
+            for slot in slots:
+                annotations["doc2_sentence"][i][slot] = pair["doc2_sentence"]
+                annotations["citation_status"][i][slot] = pair.get("citation_status")
+                annotations["citation_text"][i][slot] = pair.get("citation_text")
+    return annotations
+
+
+def annotate_top_matches(top, annotations, wanted, user_sentences, versions, db_keys=None):
+    """
+    Fills in the annotations of the `wanted` candidates that have none from the
+    resource entries. Returns the candidates whose resource was deleted or
+    changed since the check (`versions`: corpus_version per resource id), which
+    cannot be annotated any more.
+    """
+    missing = wanted & np.array([[sentence is None for sentence in row] for row in annotations["doc2_sentence"]],
+                                dtype=bool).reshape(wanted.shape)
+    unavailable = np.zeros(wanted.shape, dtype=bool)
+    for resource_id in np.unique(top["resource_id"][missing]):
+        rows, slots = np.nonzero(missing & (top["resource_id"] == resource_id))
+        try:
+            resource = get_resource_by_id(int(resource_id))
+        except HTTPException:
+            resource = None
+        entry = None
+        if resource is not None and resource.get("corpus_version") == versions.get(str(resource_id)):
+            entry = get_resource_entry(resource)
+        if entry is None:
+            unavailable[rows, slots] = True
+            continue
+        pairs = [{"doc1_idx": int(i), "doc2_idx": int(top["sentence_idx"][i, slot])} for i, slot in zip(rows, slots)]
+        classify_citation_status(
+            pairs, user_sentences, entry["sentences"], entry["lines"], db_keys=db_keys,
+            annotations=entry["citations"], references=entry["references"],
+        )
+        for pair, slot in zip(pairs, slots):
+            i = pair["doc1_idx"]
+            annotations["doc2_sentence"][i][slot] = entry["sentences"][pair["doc2_idx"]]
+            annotations["citation_status"][i][slot] = pair["citation_status"]
+            annotations["citation_text"][i][slot] = pair["citation_text"]
+    return unavailable
+
+
+def add_sentence_table(final_plag, table, titles):
+    # Each sentence resolved once to its best source; per-source stats follow from it
+    final_plag["sentence_table"] = table
+    final_plag["sources"] = source_stats(table, titles)
+    return final_plag
+
+
+def finish_check(check_id, content_hash, corpus_version, uploaded_filename, user_sentences,
+                 total_result, top, resources, user_embeddings=None, user_id=None, db_keys=None,
+                 resource_filter=None, suppressed=0, coverage=None):
+    # Only resources that are some sentence's top-k candidate can show up in a rethreshold
+    top_ids = set(top["resource_id"][top["resource_id"] >= 0].tolist())
+    titles = {str(r["id"]): r.get("title", "Undefined Resource") for r in resources if r["id"] in top_ids}
+    versions = {str(r["id"]): r.get("corpus_version", 0) for r in resources if r["id"] in top_ids}
+    table = resolve_sentences(top, truetypealgorithm.SIMILARITY_THRESHOLD, truetypealgorithm.EXACT_THRESHOLD)
+    final_plag = total_score(total_result, uploaded_filename, user_sentences=user_sentences, sentence_table=table)
+    final_plag["check_id"] = check_id
+    final_plag["suppressed_sentences"] = suppressed
+    if coverage:
+        final_plag["coverage"] = coverage
+        final_plag["partial"] = coverage["resources_skipped"] > 0
+    add_sentence_table(final_plag, table, titles)
+    final_plag = convert_np_types(final_plag)
+
+    save_check_state(check_id, content_hash, corpus_version, detection_settings(), {
+        "uploaded_filename": uploaded_filename,
+        "sentences": user_sentences,
+        "top_matches": top_matches_to_json(top),
+        "top_annotations": seed_top_annotations(top, total_result),
+        "resource_titles": titles,
+        "resource_versions": versions,
+        "resource_filter": normalize_filter(resource_filter),
+        "suppressed_sentences": suppressed,
+        "coverage": coverage,
+        "results": convert_np_types(total_result),
+    }, user_id=user_id, embeddings=user_embeddings)
+    return final_plag
+
+
+def assign_check_state(final_plag, content_hash, corpus_version, user_id=None, resource_filter=None):
+    """
+    The report with the caller's own check_id, for reports served from the
+    cache or shared between concurrent uploads of the same file (see
+    claim_check_state). Guests get none: only a check's owner may recheck it.
+    """
+    final_plag = {key: value for key, value in final_plag.items() if key != "check_id"}
+    if user_id is None:
+        return final_plag
+    check_id = claim_check_state(
+        content_hash, corpus_version, detection_settings(), normalize_filter(resource_filter), user_id
+    )
+    if check_id is not None:
+        final_plag["check_id"] = check_id
+    return final_plag
+
+
+def add_peer_results(final_plag, content_hash, user_embeddings=None, user_id=None, exclude_report_id=None,
+                     peer_details=False):
+    """
+    The report with "peer_results": its matches against earlier submissions of
+    other users, with their authors and sentences only for `peer_details` (see
+    find_peer_matches). Added after the cache, since every saved report can
+    change them.
+    """
+    if not PEER_SEARCH:
+        return final_plag
+    user_sentences = final_plag.get("user_files") or []
+    if not user_sentences:
+        return {**final_plag, "peer_results": []}
+    if user_embeddings is None:
+        record = load_check_state_by_hash(content_hash)
+        if record is not None and record["state"]["sentences"] == user_sentences:
+            user_embeddings = stored_embeddings(record)
+        if user_embeddings is None:
+            user_embeddings = truetypealgorithm.encode_sentences(user_sentences)
+    peer_results = find_peer_matches(
+        user_sentences, user_embeddings, user_id=user_id, exclude_report_id=exclude_report_id, details=peer_details
+    )
+    return {**final_plag, "peer_results": convert_np_types(peer_results)}
+
+
+def run_check(check_id, content_hash, corpus_version, uploaded_filename, user_sentences, resources,
+              previous_record=None, user_id=None, resource_filter=None, suppressed=0, deadline=None):
+    """
+    Runs a check of `user_sentences` against `resources` (already filtered by
+    `resource_filter`, which is only recorded, as is the number of `suppressed`
+    boilerplate sentences), until `deadline` (see compare_resources), reusing embeddings and
+    per-resource results of `previous_record` (an earlier check of the same or an
+    earlier draft of the text) wherever they are still valid.
+    """
+    top = new_top_matches(len(user_sentences))
+    user_embeddings = None
+    total_result = []
+    coverage = {}
+    # One reference-key lookup shared by every comparison of this check
+    db_keys = reference_index.keys(corpus_version)
+
+    if user_sentences:
+        previous = None
+        if previous_record is None:
+            user_embeddings = truetypealgorithm.encode_sentences(user_sentences)
+        else:
+            previous_sentences = previous_record["state"]["sentences"]
+            row_map, changed_rows = diff_sentences(previous_sentences, user_sentences)
+            user_embeddings = reuse_embeddings(stored_embeddings(previous_record), row_map, changed_rows, user_sentences)
+
+            results = reusable_results(previous_record, resources)
+            previous_state = previous_record["state"]
+            previous_top = top_matches_from_json(previous_state.get("top_matches") or previous_state["best_matches"])
+            rebuild_top_matches(previous_top, list(results.values()))
+            top = remap_top_matches(previous_top, row_map, len(user_sentences))
+
+            previous = {
+                "results": results,
+                "old_to_new": {old: new for new, old in row_map.items()},
+                "changed_rows": changed_rows,
+                "unchanged": previous_sentences == user_sentences,
+            }
+            logging.info(
+                f"Reusing {len(row_map)}/{len(user_sentences)} sentences and "
+                f"{len(results)} resource results from check {previous_record['check_id']}"
+            )
+
+        total_result = compare_resources(
+            user_sentences, user_embeddings, resources, top, previous, db_keys=db_keys,
+            borderline=BorderlinePairs(user_sentences), deadline=deadline, coverage=coverage,
+        )
+
+    return finish_check(
+        check_id, content_hash, corpus_version, uploaded_filename, user_sentences,
+        total_result, top, resources, user_embeddings=user_embeddings, user_id=user_id, db_keys=db_keys,
+        resource_filter=resource_filter, suppressed=suppressed, coverage=coverage,
+    )
+
+
+def run_plagiarism_check(user_file, content_hash=None, corpus_version=None, uploaded_filename=None,
+                         resources=None, user_id=None, resource_filter=None):
+    # The time budget covers the whole check, parsing and encoding included
+    deadline = time.monotonic() + CHECK_TIME_BUDGET if CHECK_TIME_BUDGET else None
+    if content_hash is None:
+        content_hash = hash_file(user_file)
+    if corpus_version is None:
+        corpus_version = get_corpus_version()
+    if resources is None:
+        resources = get_all_resources()
+
+    # Boilerplate frequencies come from the whole corpus, whatever the filter
+    user_sentences, suppressed = suppress_boilerplate(truetypealgorithm.read_file(user_file), resources, corpus_version)
+    # Excluded resources are never loaded, encoded or searched
+    resources = filter_resources(resources, resource_filter)
+
+    # A logged-in user's previous submission is usually an earlier draft of this one
+    previous_record = None
+    if user_id is not None and user_sentences:
+        previous_record = load_latest_user_check_state(user_id)
+
+    return run_check(
+        uuid.uuid4().hex, content_hash, corpus_version,
+        uploaded_filename or os.path.basename(user_file), user_sentences, resources,
+        previous_record=previous_record, user_id=user_id, resource_filter=resource_filter,
+        suppressed=suppressed, deadline=deadline,
+    )
+
+
+def compare_batch(documents, offsets, embeddings, resources, tops, db_keys=None):
+    """
+    compare_resources for many submissions at once: every resource is loaded and
+    compared once against the combined query matrix, then split per submission.
+    Screening and the hierarchical shortlist are still decided per submission.
+    """
+    results = [[] for _ in documents]
+    borderline = [BorderlinePairs(sentences) for sentences in documents]
+    entries = {}
+    allowed = [None] * len(documents)
+    query_centroids = [None] * len(documents)
+    for d in range(len(documents)):
+        candidates = resources
+        document_embeddings = embeddings[offsets[d]:offsets[d + 1]]
+        if SCREENING_TOP_RESOURCES:
+            candidates = screen_resources(candidates, document_embeddings)
+        if MATCHING_MODE == "hierarchical":
+            query_centroids[d] = hierarchy.paragraph_centroids(document_embeddings)
+            candidates = shortlist_resources(candidates, query_centroids[d])
+        allowed[d] = {r["id"] for r in candidates}
+
+    ann_hits, ann_covered = None, set()
+    if MATCHING_MODE == "ann":
+        ann_hits, ann_covered = ann_index.search_corpus(embeddings, resources)
+    elif MATCHING_MODE == "sharded":
+        ann_hits, ann_covered = sharded_index.search_corpus(embeddings, resources)
+
+    for resource in resources:
+        reference_name = resource.get("title", "Undefined Resource")
+        targets = [d for d in range(len(documents)) if documents[d] and resource["id"] in allowed[d]]
+        try:
+            if not targets or (resource["id"] in ann_covered and resource["id"] not in ann_hits):
+                continue
+            entry = get_resource_entry(resource)
+            if entry is None:
+                continue
+
+            if resource["id"] in ann_covered:
+                similarity_matrix = ann_index.hit_similarity(
+                    ann_hits.get(resource["id"]), len(embeddings), len(entry["sentences"])
+                )
+            elif MATCHING_MODE != "hierarchical":
+                similarity_matrix = embeddings @ entry["embeddings"].T
+
+            for d in targets:
+                if query_centroids[d] is not None:
+                    block = hierarchy.restricted_similarity(
+                        embeddings[offsets[d]:offsets[d + 1]], query_centroids[d], entry
+                    )
+                else:
+                    block = similarity_matrix[offsets[d]:offsets[d + 1]]
+                borderline[d].collect(resource["id"], block, entry["sentences"])
+                entries[resource["id"]] = entry
+                matched_pairs = truetypealgorithm.match_sentences(documents[d], entry["sentences"], block, reference_name)
+                result = truetypealgorithm.build_report(
+                    documents[d], entry["sentences"], entry["lines"], matched_pairs, reference_name,
+                    db_keys=db_keys, citations=entry["citations"], references=entry["references"],
+                )
+                result["resource_id"] = resource["id"]
+                update_top_matches(tops[d], block, resource["id"])
+                results[d].append(result)
+
+        except Exception:
+            logging.warning(f"Resource error: {reference_name}", exc_info=True)
+    for d in range(len(documents)):
+        apply_rescored(borderline[d], results[d], entries, tops[d], documents[d], db_keys=db_keys)
+    return results
+
+
+def run_batch_check(submissions, resources=None, resource_filter=None, user_id=None, pairwise=False,
+                    peer_details=False):
+    """
+    Checks many submissions, given as (user_file, uploaded_filename), together:
+    files are parsed in parallel, all sentences are encoded in shared batches and
+    the corpus is searched once (see compare_batch). Yields (position, report)
+    as each report is ready, cached reports first. With `pairwise`, every
+    submission is also compared with every other and a last (None,
+    {"pairwise": ...}) item carries the overlap matrix (see pairwise_overlap).
+    """
+    corpus_version = get_corpus_version()
+    settings = detection_settings(resource_filter)
+    hashes = [hash_file(user_file) for user_file, _ in submissions]
+    pending = []
+    for position, ((user_file, filename), content_hash) in enumerate(zip(submissions, hashes)):
+        cached = get_cached_report(content_hash, corpus_version, settings)
+        if cached is not None:
+            cached = assign_check_state(cached, content_hash, corpus_version, user_id, resource_filter)
+            yield position, add_peer_results(
+                {**cached, "uploaded_filename": filename}, content_hash, user_id=user_id, peer_details=peer_details
+            )
+        else:
+            pending.append(position)
+    if not pending and not pairwise:
+        return
+
+    # Cached submissions are only read and encoded for the pairwise comparison
+    parsed = list(range(len(submissions))) if pairwise else pending
+    if resources is None:
+        resources = get_all_resources()
+    with ThreadPoolExecutor(max_workers=BATCH_PARSE_WORKERS) as pool:
+        documents = list(pool.map(truetypealgorithm.read_file, [submissions[p][0] for p in parsed]))
+    documents, suppressed = zip(*[suppress_boilerplate(sentences, resources, corpus_version) for sentences in documents])
+    offsets = np.cumsum([0] + [len(sentences) for sentences in documents])
+    embeddings = truetypealgorithm.encode_sentences([s for sentences in documents for s in sentences])
+
+    if pending:
+        resources = filter_resources(resources, resource_filter)
+        at = pending if pairwise else range(len(pending))
+        pending_documents = [documents[d] for d in at]
+        pending_offsets = np.cumsum([0] + [len(sentences) for sentences in pending_documents])
+        pending_embeddings = np.concatenate([embeddings[offsets[d]:offsets[d + 1]] for d in at])
+        db_keys = reference_index.keys(corpus_version)
+        tops = [new_top_matches(len(sentences)) for sentences in pending_documents]
+        results = compare_batch(
+            pending_documents, pending_offsets, pending_embeddings, resources, tops, db_keys=db_keys
+        )
+
+        for d, position in enumerate(pending):
+            user_embeddings = pending_embeddings[pending_offsets[d]:pending_offsets[d + 1]]
+            final_plag = finish_check(
+                uuid.uuid4().hex, hashes[position], corpus_version, submissions[position][1], pending_documents[d],
+                results[d], tops[d], resources, user_embeddings=user_embeddings, user_id=user_id, db_keys=db_keys,
+                resource_filter=resource_filter, suppressed=suppressed[at[d]],
+            )
+            # An unreadable file gives no sentences; it is not cached so a retry reads it again
+            if final_plag.get("user_files"):
+                store_report(hashes[position], corpus_version, settings, final_plag)
+            yield position, add_peer_results(
+                final_plag, hashes[position], user_embeddings=user_embeddings, user_id=user_id,
+                peer_details=peer_details,
+            )
+
+    if pairwise:
+        names = [filename for _, filename in submissions]
+        yield None, {"pairwise": convert_np_types(pairwise_overlap(documents, offsets, embeddings, names))}
+
+
+def recheck_plagiarism(check_id, peer_details=False):
+    """
+    Brings a stored check up to date with the corpus. Only resources created or
+    updated since the check's corpus version are compared; results for resources
+    deleted or updated since then are dropped and everything else is reused.
+    Returns None if the check is unknown.
+    """
+    record = load_check_state(check_id)
+    if record is None:
+        return None
+
+    state = record["state"]
+    corpus_version = get_corpus_version()
+    resource_filter = state.get("resource_filter")
+    final_plag = run_check(
+        check_id, record["content_hash"], corpus_version, state["uploaded_filename"], state["sentences"],
+        filter_resources(get_all_resources(), resource_filter), previous_record=record,
+        user_id=record["user_id"], resource_filter=resource_filter,
+        suppressed=state.get("suppressed_sentences", 0),
+    )
+    if not final_plag.get("partial"):
+        store_report(record["content_hash"], corpus_version, detection_settings(resource_filter), final_plag)
+    if record["report_id"] is not None:
+        update_report_scores(record["report_id"], final_plag)
+    return add_peer_results(
+        final_plag, record["content_hash"], user_id=record["user_id"], exclude_report_id=record["report_id"],
+        peer_details=peer_details,
+    )
+
+
+def rethreshold_check(check_id, threshold, exact_threshold):
+    """
+    Reclassifies a stored check for new thresholds from its top-k state alone;
+    nothing is encoded. Candidates that were below the check's own threshold are
+    annotated from the resource index on first use; those of resources deleted
+    or changed since the check are dropped, as are pairs beyond a sentence's
+    top-k resources. Returns None if the check is unknown or was stored without
+    top-k state.
+    """
+    record = load_check_state(check_id)
+    if record is None or "top_annotations" not in record["state"]:
+        return None
+
+    state = record["state"]
+    user_sentences = state["sentences"]
+    titles = state["resource_titles"]
+    annotations = state["top_annotations"]
+    top = top_matches_from_json(state["top_matches"])
+    wanted = top["similarity"] >= threshold
+    unavailable = annotate_top_matches(
+        top, annotations, wanted, user_sentences, state.get("resource_versions", {}),
+        db_keys=reference_index.keys(record["corpus_version"]),
+    )
+    if unavailable.any():
+        order = drop_top_matches(top, unavailable)
+        for key, values in annotations.items():
+            annotations[key] = [[row[slot] for slot in slots] for row, slots in zip(values, order)]
+
+    pairs_by_resource = {}
+    rows, slots = np.nonzero(top["similarity"] >= threshold)
+    for i, slot in zip(rows, slots):
+        resource_id = str(top["resource_id"][i, slot])
+        similarity = float(top["similarity"][i, slot])
+        pairs_by_resource.setdefault(resource_id, []).append({
+            "doc1_idx": int(i),
+            "doc1_sentence": user_sentences[i],
+            "doc2_idx": int(top["sentence_idx"][i, slot]),
+            "doc2_sentence": annotations["doc2_sentence"][i][slot],
+            "similarity": similarity,
+            "type": "exact" if similarity >= exact_threshold else "partial",
+            "source_file": titles.get(resource_id, "Undefined Resource"),
+            "citation_status": annotations["citation_status"][i][slot],
+            "citation_text": annotations["citation_text"][i][slot],
+        })
+
+    total_result = []
+    for resource_id, title in titles.items():
+        if resource_id in pairs_by_resource:
+            pairs = sorted(pairs_by_resource[resource_id], key=lambda p: p["doc1_idx"])
+            result = truetypealgorithm.summarize_matches(user_sentences, pairs, title)
+            result["resource_id"] = int(resource_id)
+            total_result.append(result)
+
+    table = resolve_sentences(top, threshold, exact_threshold)
+    final_plag = total_score(total_result, state["uploaded_filename"], user_sentences=user_sentences, sentence_table=table)
+    final_plag["check_id"] = check_id
+    final_plag["thresholds"] = {"threshold": threshold, "exact_threshold": exact_threshold}
+    final_plag["suppressed_sentences"] = state.get("suppressed_sentences", 0)
+    if state.get("coverage"):
+        final_plag["coverage"] = state["coverage"]
+        final_plag["partial"] = state["coverage"]["resources_skipped"] > 0
+    add_sentence_table(final_plag, table, titles)
+    return convert_np_types(final_plag)
+
+
+def convert_np_types(obj):
+    if isinstance(obj, dict):
+        return {k: convert_np_types(v) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [convert_np_types(i) for i in obj]
+    elif isinstance(obj, np.ndarray):
+        return [convert_np_types(i) for i in obj]
+    elif isinstance(obj, np.integer):
+        return int(obj)
+    elif isinstance(obj, np.floating):
+        return float(obj)
+    else:
+        return obj
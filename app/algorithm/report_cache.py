@@ -0,0 +1,148 @@
+# report_cache.py
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from app.config import REPORT_CACHE_DB_ROWS, REPORT_CACHE_SIZE
+from app.database.db_connect import test_database_connection
+
+
+def hash_file(file_path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ReportCache:
+    """
+    Bounded LRU of finished reports keyed by (content_hash, corpus_version, settings).
+    """
+
+    def __init__(self, max_size=REPORT_CACHE_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            report = self._entries.get(key)
+            if report is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return report
+
+    def put(self, key, report):
+        with self._lock:
+            self._entries[key] = report
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+memory_cache = ReportCache()
+
+
+def get_cached_report(content_hash, corpus_version, settings):
+    key = (content_hash, corpus_version, settings)
+    report = memory_cache.get(key)
+    if report is not None:
+        return dict(report)
+
+    conn = test_database_connection()
+    if not conn:
+        return None
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT report FROM report_cache
+            WHERE content_hash = %s AND corpus_version = %s AND settings = %s
+        """, (content_hash, corpus_version, settings))
+        row = cursor.fetchone()
+    except Exception as e:
+        print(f"⚠️ Report cache lookup failed: {e}")
+        row = None
+    finally:
+        cursor.close()
+        conn.close()
+
+    if not row:
+        return None
+    report = row[0] if isinstance(row[0], dict) else json.loads(row[0])
+    memory_cache.put(key, report)
+    return dict(report)
+
+
+def store_report(content_hash, corpus_version, settings, report):
+    # A check_id belongs to the user whose check produced the report; whoever is
+    # served the report later gets their own (see pipeline.assign_check_state)
+    report = {key: value for key, value in report.items() if key != "check_id"}
+    memory_cache.put((content_hash, corpus_version, settings), report)
+
+    conn = test_database_connection()
+    if not conn:
+        return
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            INSERT INTO report_cache (content_hash, corpus_version, settings, report)
+            VALUES (%s, %s, %s, %s::jsonb)
+            ON CONFLICT (content_hash, corpus_version, settings)
+            DO UPDATE SET report = EXCLUDED.report, created_at = CURRENT_TIMESTAMP
+        """, (content_hash, corpus_version, settings, json.dumps(report, default=str)))
+        # Keep the persisted cache bounded as well
+        cursor.execute("""
+            DELETE FROM report_cache
+            WHERE id NOT IN (SELECT id FROM report_cache ORDER BY created_at DESC LIMIT %s)
+        """, (REPORT_CACHE_DB_ROWS,))
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"⚠️ Could not persist cached report: {e}")
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def invalidate_report_cache():
+    """
+    Called after any resource mutation. Entries for older corpus versions can never
+    be hit again, so they are dropped from memory and from the database.
+    """
+    memory_cache.clear()
+
+    conn = test_database_connection()
+    if not conn:
+        return
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            DELETE FROM report_cache
+            WHERE corpus_version < (SELECT COALESCE(MAX(corpus_version), 0) FROM resources)
+        """)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"⚠️ Could not invalidate report cache: {e}")
+    finally:
+        cursor.close()
+        conn.close()
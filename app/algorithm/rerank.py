@@ -0,0 +1,139 @@
+# rerank.py
+import difflib
+import re
+import threading
+
+import numpy as np
+
+from app.config import (
+    EXACT_THRESHOLD,
+    RERANK_BAND_HIGH,
+    RERANK_BAND_LOW,
+    RERANK_BUDGET,
+    RERANK_EXACT_THRESHOLD,
+    RERANK_MODEL,
+    RERANK_SCORER,
+    RERANK_THRESHOLD,
+    SIMILARITY_THRESHOLD,
+)
+
+# -----------------------------
+# Second-stage scoring
+# -----------------------------
+# Bi-encoder similarities inside [RERANK_BAND_LOW, RERANK_BAND_HIGH) are too
+# close to the thresholds to trust, so they are replaced by a more expensive
+# score: a cross-encoder over the sentence pair ("cross-encoder") or the
+# alignment ratio of their word sequences ("token"). Band pairs are collected
+# across all resources of a check and the RERANK_BUDGET most similar of them are
+# re-scored; everything else keeps its cosine similarity. Second-stage scores
+# are on their own scale, so they are mapped onto the cosine one first: a score
+# of RERANK_THRESHOLD lands on SIMILARITY_THRESHOLD and RERANK_EXACT_THRESHOLD
+# on EXACT_THRESHOLD, linearly in between.
+
+WORD = re.compile(r"\w+")
+
+
+def token_alignment_scores(pairs):
+    return np.array([
+        difflib.SequenceMatcher(None, WORD.findall(a.lower()), WORD.findall(b.lower()), autojunk=False).ratio()
+        for a, b in pairs
+    ], dtype=np.float32)
+
+
+_cross_encoder = None
+_lock = threading.Lock()
+
+
+def cross_encoder_scores(pairs):
+    global _cross_encoder
+    with _lock:
+        if _cross_encoder is None:
+            from sentence_transformers import CrossEncoder
+            _cross_encoder = CrossEncoder(RERANK_MODEL)
+        model = _cross_encoder
+    return np.clip(np.asarray(model.predict(pairs), dtype=np.float32), 0.0, 1.0)
+
+
+SCORERS = {
+    "cross-encoder": cross_encoder_scores,
+    "token": token_alignment_scores,
+}
+
+
+def calibrate(scores, threshold=RERANK_THRESHOLD, exact_threshold=RERANK_EXACT_THRESHOLD):
+    # Second-stage score -> cosine scale, so the detection thresholds apply to it
+    return np.interp(
+        scores, [0.0, threshold, exact_threshold, 1.0], [0.0, SIMILARITY_THRESHOLD, EXACT_THRESHOLD, 1.0]
+    ).astype(np.float32)
+
+
+class BorderlinePairs:
+    """
+    Band pairs of one submission, collected across its resource comparisons.
+    Only the `limit` most similar so far are kept, each with a copy of its
+    similarity row, so memory stays bounded by the budget whatever the corpus.
+    """
+
+    def __init__(self, doc1, limit=RERANK_BUDGET, scorer=RERANK_SCORER, low=RERANK_BAND_LOW, high=RERANK_BAND_HIGH):
+        self.doc1 = doc1
+        self.limit = limit
+        self.scorer = scorer
+        self.low, self.high = low, high
+        self.used = 0
+        self._pairs = []  # (-similarity, arrival, key, doc1 row, col), best first
+        self._rows = {}   # (key, doc1 row) -> similarity row
+        self._doc2 = {}
+        self._arrival = 0
+
+    def collect(self, key, similarity_matrix, doc2, row_indices=None):
+        """
+        Records the pairs of `similarity_matrix` in [low, high); `row_indices`
+        maps rows to doc1 indices as in match_sentences.
+        """
+        if not self.scorer or not self.limit or similarity_matrix.size == 0:
+            return
+        low = self.low
+        if len(self._pairs) == self.limit:
+            # Equal similarities: the resource compared first wins
+            low = np.nextafter(np.float32(-self._pairs[-1][0]), np.float32(np.inf))
+        rows, cols = np.nonzero((similarity_matrix >= low) & (similarity_matrix < self.high))
+        if not len(rows):
+            return
+        sims = similarity_matrix[rows, cols]
+        order = np.argsort(-sims, kind="stable")[:self.limit]
+        rows, cols, sims = rows[order], cols[order], sims[order]
+        doc1_rows = rows if row_indices is None else np.asarray(row_indices)[rows]
+        for row, doc1_row, col, sim in zip(rows, doc1_rows, cols, sims):
+            self._pairs.append((-float(sim), self._arrival, key, int(doc1_row), int(col)))
+            self._arrival += 1
+            if (key, int(doc1_row)) not in self._rows:
+                self._rows[(key, int(doc1_row))] = np.array(similarity_matrix[row], dtype=np.float32)
+        self._doc2[key] = doc2
+        self._pairs.sort()
+        del self._pairs[self.limit:]
+        wanted = {(pair[2], pair[3]) for pair in self._pairs}
+        self._rows = {row: values for row, values in self._rows.items() if row in wanted}
+        self._doc2 = {k: v for k, v in self._doc2.items() if k in {row[0] for row in wanted}}
+
+    def rescore(self):
+        """
+        Scores the kept pairs in one call and returns {key: (doc1_rows,
+        similarity_rows)}: the similarity rows of every doc1 row with a
+        re-scored pair, calibrated second-stage scores in place of the cosine.
+        """
+        if not self._pairs:
+            return {}
+        scores = calibrate(SCORERS[self.scorer]([
+            (self.doc1[doc1_row], self._doc2[key][col]) for _, _, key, doc1_row, col in self._pairs
+        ]))
+        for (_, _, key, doc1_row, col), score in zip(self._pairs, scores):
+            self._rows[(key, doc1_row)][col] = score
+        self.used = len(self._pairs)
+
+        rescored = {}
+        for (key, doc1_row) in sorted(self._rows, key=lambda row: row[1]):
+            rescored.setdefault(key, []).append(doc1_row)
+        return {
+            key: (np.array(doc1_rows), np.stack([self._rows[(key, row)] for row in doc1_rows]))
+            for key, doc1_rows in rescored.items()
+        }
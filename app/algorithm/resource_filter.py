@@ -0,0 +1,38 @@
+# resource_filter.py
+import json
+
+# -----------------------------
+# Resource subsets
+# -----------------------------
+# A resource filter is a dict with any of:
+#   publishers   list of publisher names (case-insensitive)
+#   year_from    first publication year, inclusive
+#   year_to      last publication year, inclusive
+#   authors      list of author names (case-insensitive)
+#   resource_ids list of resource ids
+# Different keys narrow the subset (AND); values within a key widen it (OR).
+
+
+def normalize_filter(resource_filter):
+    """
+    Canonical form of a filter (None when it does not restrict anything), so equal
+    filters share cache keys.
+    """
+    if not resource_filter:
+        return None
+    normalized = {}
+    for key in ("publishers", "authors"):
+        values = resource_filter.get(key)
+        if values:
+            normalized[key] = sorted({str(v).strip().lower() for v in values if str(v).strip()})
+    for key in ("year_from", "year_to"):
+        if resource_filter.get(key) is not None:
+            normalized[key] = int(resource_filter[key])
+    if resource_filter.get("resource_ids"):
+        normalized["resource_ids"] = sorted({int(v) for v in resource_filter["resource_ids"]})
+    return normalized or None
+
+
+def filter_key(resource_filter):
+    resource_filter = normalize_filter(resource_filter)
+    return json.dumps(resource_filter, sort_keys=True) if resource_filter else ""
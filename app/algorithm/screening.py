@@ -0,0 +1,159 @@
+# screening.py
+import threading
+
+import numpy as np
+import psycopg2
+
+from app.algorithm import hierarchy, truetypealgorithm
+from app.config import SCREENING_TOP_RESOURCES
+from app.database.db_connect import test_database_connection
+
+
+def screening_text(resource):
+    return f"{resource.get('title') or ''}\n{resource.get('content') or ''}".strip()
+
+
+def _store_embeddings(cursor, resources, embeddings):
+    for resource, embedding in zip(resources, embeddings):
+        cursor.execute("""
+            INSERT INTO resource_screening (resource_id, model, corpus_version, embedding)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (resource_id, model) DO UPDATE SET
+                corpus_version = EXCLUDED.corpus_version,
+                embedding = EXCLUDED.embedding
+            WHERE resource_screening.corpus_version <= EXCLUDED.corpus_version
+        """, (
+            resource["id"], truetypealgorithm.MODEL_NAME, resource.get("corpus_version", 0),
+            psycopg2.Binary(np.ascontiguousarray(embedding, dtype=np.float32).tobytes()),
+        ))
+
+
+class ScreeningIndex:
+    """
+    Title + content embeddings of the corpus, one row per resource. Rows are
+    written when a resource is created or updated and loaded once per
+    corpus_version; rows missing at check time (older resources, failed
+    ingests) are encoded then.
+    """
+
+    def __init__(self):
+        self._embeddings = {}  # resource_id -> (corpus_version, embedding)
+        self._lock = threading.Lock()
+
+    def index_resource(self, resource):
+        embedding = truetypealgorithm.encode_sentences([screening_text(resource)])
+        conn = test_database_connection()
+        if not conn:
+            return
+        cursor = conn.cursor()
+        try:
+            _store_embeddings(cursor, [resource], embedding)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"⚠️ Could not index resource {resource['id']} for screening: {e}")
+            return
+        finally:
+            cursor.close()
+            conn.close()
+        with self._lock:
+            self._embeddings[resource["id"]] = (resource.get("corpus_version", 0), embedding[0])
+
+    def _load(self, resources):
+        ids = [r["id"] for r in resources]
+        conn = test_database_connection()
+        if not conn:
+            return
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                SELECT resource_id, corpus_version, embedding
+                FROM resource_screening
+                WHERE model = %s AND resource_id = ANY(%s)
+            """, (truetypealgorithm.MODEL_NAME, ids))
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+            conn.close()
+        with self._lock:
+            for resource_id, version, embedding in rows:
+                self._embeddings[resource_id] = (version, np.frombuffer(bytes(embedding), dtype=np.float32))
+
+    def _encode_missing(self, resources):
+        embeddings = truetypealgorithm.encode_sentences([screening_text(r) for r in resources])
+        conn = test_database_connection()
+        if conn:
+            cursor = conn.cursor()
+            try:
+                _store_embeddings(cursor, resources, embeddings)
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                print(f"⚠️ Could not store screening embeddings: {e}")
+            finally:
+                cursor.close()
+                conn.close()
+        with self._lock:
+            for resource, embedding in zip(resources, embeddings):
+                self._embeddings[resource["id"]] = (resource.get("corpus_version", 0), embedding)
+
+    def _stale(self, resources):
+        with self._lock:
+            return [
+                r for r in resources
+                if self._embeddings.get(r["id"], (None,))[0] != r.get("corpus_version", 0)
+            ]
+
+    def embeddings(self, resources, encode_missing=True):
+        """
+        (len(resources), dim) matrix of screening embeddings, in resource order.
+        Without `encode_missing`, resources with no stored embedding get a row of
+        NaN instead of being encoded now.
+        """
+        stale = self._stale(resources)
+        if stale:
+            self._load(stale)
+            stale = self._stale(stale)
+        if stale and encode_missing:
+            self._encode_missing(stale)
+            stale = []
+        missing = np.full(truetypealgorithm.model.get_sentence_embedding_dimension(), np.nan, dtype=np.float32)
+        stale_ids = {r["id"] for r in stale}
+        with self._lock:
+            return np.stack([missing if r["id"] in stale_ids else self._embeddings[r["id"]][1] for r in resources])
+
+
+screening_index = ScreeningIndex()
+
+
+def index_resource_screening(resource):
+    screening_index.index_resource(resource)
+
+
+def screen_resources(resources, user_embeddings, keep=(), top=SCREENING_TOP_RESOURCES):
+    """
+    The `top` resources whose title + content is closest to any submission
+    paragraph, plus the resources in `keep`, in their original order. Nothing
+    here reads a resource file.
+    """
+    candidates = [r for r in resources if r["id"] not in keep]
+    if not top or len(candidates) <= top or not len(user_embeddings):
+        return resources
+    query_centroids = hierarchy.paragraph_centroids(user_embeddings)
+    scores = (query_centroids @ screening_index.embeddings(candidates).T).max(axis=0)
+    selected = {candidates[i]["id"] for i in np.argsort(-scores, kind="stable")[:top]}
+    return [r for r in resources if r["id"] in keep or r["id"] in selected]
+
+
+def rank_by_screening(resources, user_embeddings, encode_missing=True):
+    """
+    `resources` ordered by how close their title + content is to any submission
+    paragraph, most promising first. Without `encode_missing`, resources with no
+    stored screening embedding come last, in their original order.
+    """
+    if len(resources) < 2 or not len(user_embeddings):
+        return resources
+    query_centroids = hierarchy.paragraph_centroids(user_embeddings)
+    scores = (query_centroids @ screening_index.embeddings(resources, encode_missing).T).max(axis=0)
+    scores = np.nan_to_num(scores, nan=-np.inf)
+    return [resources[i] for i in np.argsort(-scores, kind="stable")]
@@ -0,0 +1,81 @@
+# segmenter.py
+import re
+
+# Merged lines of at most this many words are kept as one sentence (as with nltk)
+MIN_SPLIT_WORDS = 10
+
+# Lower-cased tokens (with their final period) after which a period does not end
+# a sentence
+ABBREVIATIONS = frozenset({
+    "al.", "e.g.", "i.e.", "etc.", "cf.", "vs.", "viz.", "approx.", "ca.", "resp.",
+    "fig.", "figs.", "eq.", "eqs.", "tab.", "sec.", "ch.", "chap.", "app.", "ref.", "refs.",
+    "no.", "nos.", "vol.", "vols.", "pp.", "p.", "ed.", "eds.", "rev.", "suppl.",
+    "dr.", "mr.", "mrs.", "ms.", "prof.", "jr.", "sr.", "st.",
+    "dept.", "univ.", "inst.", "assoc.", "inc.", "ltd.", "co.", "corp.",
+    "jan.", "feb.", "mar.", "apr.", "jun.", "jul.", "aug.", "sep.", "sept.", "oct.", "nov.", "dec.",
+})
+
+# Sentence-final punctuation, optional closing quotes/brackets, whitespace, and a
+# sentence start: an upper-case letter or digit, optionally behind an opening
+# quote or bracket. Decimals ("3.14") never match because whitespace is required.
+BOUNDARY = re.compile(r'(?<=[.!?])["\'”’)\]]*\s+(?=["\'“‘(\[]?[A-Z0-9])')
+
+# "J." or "U.S." - initials and dotted acronyms
+INITIALS = re.compile(r'^(?:[A-Za-z]\.)+$')
+# Leading punctuation stripped before an abbreviation lookup, e.g. "(e.g."
+LEADING_PUNCTUATION = re.compile(r'^["\'“‘(\[]+')
+
+
+def _is_abbreviation(text, end):
+    """
+    Whether the token ending at text[end - 1] (a period) is an abbreviation or an
+    initial rather than the end of a sentence.
+    """
+    start = max(text.rfind(" ", 0, end), text.rfind("\n", 0, end)) + 1
+    token = LEADING_PUNCTUATION.sub("", text[start:end])
+    return token.lower() in ABBREVIATIONS or bool(INITIALS.match(token))
+
+
+def split_sentences(text):
+    """
+    Rule-based replacement for nltk's sent_tokenize on academic text: keeps
+    "et al.", "e.g.", "Fig. 2", initials, decimals and citations such as
+    "(Smith, 2020)" or "[3]" inside their sentence.
+    """
+    sentences = []
+    start = 0
+    for match in BOUNDARY.finditer(text):
+        end = match.start()
+        closers = len(match.group(0)) - len(match.group(0).lstrip("\"'”’)]"))
+        if text[end - 1] == "." and _is_abbreviation(text, end):
+            continue
+        sentence = text[start:end + closers].strip()
+        if sentence:
+            sentences.append(sentence)
+        start = match.end()
+    tail = text[start:].strip()
+    if tail:
+        sentences.append(tail)
+    return sentences
+
+
+def segment_document(merged_lines):
+    """
+    Sentences of one document given its merged lines; short lines are kept whole,
+    as split_merged_lines does.
+    """
+    sentences = []
+    for line in merged_lines:
+        if len(line.split()) > MIN_SPLIT_WORDS:
+            sentences.extend(split_sentences(line))
+        else:
+            sentences.append(line)
+    return sentences
+
+
+def segment_documents(documents):
+    """
+    Batch form of segment_document: a list of merged-line lists in, a list of
+    sentence lists out.
+    """
+    return [segment_document(merged_lines) for merged_lines in documents]
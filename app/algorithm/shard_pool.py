@@ -0,0 +1,256 @@
+# shard_pool.py
+import atexit
+import multiprocessing
+import threading
+import zlib
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# -----------------------------
+# Sharded exact search
+# -----------------------------
+# Resources are partitioned across worker processes by a hash of their id; every
+# worker holds the sentence embeddings of its shard in one stacked matrix. A
+# search writes the query matrix to shared memory once, every shard returns its
+# own top-k per query, and the parent merges them into the global top-k.
+# This module only needs numpy, so spawned workers start without the encoder.
+
+SCAN_ROWS = 65536  # corpus rows per matrix product inside a worker
+
+
+def shard_of(resource_id, shards):
+    return zlib.crc32(str(resource_id).encode()) % shards
+
+
+def top_k(similarity, k):
+    # Column indices of the k largest values per row, best first
+    k = min(k, similarity.shape[1])
+    part = np.argpartition(-similarity, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(similarity, part, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(part, order, axis=1)
+
+
+def merge_top_k(parts, k):
+    """
+    Global top-k from per-shard (resource_ids, sentence_idx, similarity)
+    arrays of shape (n, k_shard); missing candidates have resource id -1.
+    """
+    ids, sentences, similarity = (np.concatenate(arrays, axis=1) for arrays in zip(*parts))
+    similarity = np.where(ids >= 0, similarity, -np.inf)
+    best = top_k(similarity, k)
+    similarity = np.take_along_axis(similarity, best, axis=1)
+    missing = np.isinf(similarity)
+    return (
+        np.where(missing, -1, np.take_along_axis(ids, best, axis=1)),
+        np.where(missing, -1, np.take_along_axis(sentences, best, axis=1)),
+        np.where(missing, -1.0, similarity).astype(np.float32),
+    )
+
+
+class Shard:
+    """
+    The worker side: embeddings of the shard's resources, stacked on first use
+    after every change.
+    """
+
+    def __init__(self):
+        self.resources = {}  # resource_id -> (version, embeddings)
+        self.matrix = None
+        self.resource_ids = None
+        self.sentence_idx = None
+
+    def load(self, entries):
+        for resource_id, version, path in entries:
+            self.resources[resource_id] = (version, np.load(path, mmap_mode="r"))
+        self.matrix = None
+
+    def _stack(self):
+        items = [(rid, emb) for rid, (_, emb) in sorted(self.resources.items()) if len(emb)]
+        if not items:
+            self.matrix = np.zeros((0, 0), dtype=np.float32)
+            self.resource_ids = self.sentence_idx = np.zeros(0, dtype=np.int64)
+            return
+        self.matrix = np.ascontiguousarray(np.concatenate([emb for _, emb in items]), dtype=np.float32)
+        self.resource_ids = np.concatenate([np.full(len(emb), rid, dtype=np.int64) for rid, emb in items])
+        self.sentence_idx = np.concatenate([np.arange(len(emb), dtype=np.int64) for _, emb in items])
+
+    def search(self, queries, k, allowed=None):
+        if self.matrix is None:
+            self._stack()
+        n = len(queries)
+        result = (
+            np.full((n, k), -1, dtype=np.int64), np.full((n, k), -1, dtype=np.int64),
+            np.full((n, k), -1.0, dtype=np.float32),
+        )
+        valid = None if allowed is None else np.isin(self.resource_ids, allowed)
+        for start in range(0, len(self.matrix), SCAN_ROWS):
+            block = queries @ self.matrix[start:start + SCAN_ROWS].T
+            if valid is not None:
+                block[:, ~valid[start:start + SCAN_ROWS]] = -np.inf
+            best = top_k(block, k)
+            rows = best + start
+            part = (self.resource_ids[rows], self.sentence_idx[rows], np.take_along_axis(block, best, axis=1))
+            result = merge_top_k([result, part], k)
+        return result
+
+
+def serve(conn):
+    """
+    Worker loop: ("load", request_id, entries), ("search", request_id, shm_name,
+    shape, k, allowed) or ("stop",). Every request is answered with
+    (request_id, "ok", result) or (request_id, "error", text).
+    """
+    shard = Shard()
+    while True:
+        message = conn.recv()
+        if message[0] == "stop":
+            break
+        request_id = message[1]
+        try:
+            if message[0] == "load":
+                shard.load(message[2])
+                conn.send((request_id, "ok", None))
+            elif message[0] == "search":
+                _, _, name, shape, k, allowed = message
+                # Workers share the parent's resource tracker; the parent unlinks
+                shm = shared_memory.SharedMemory(name=name)
+                try:
+                    queries = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+                    conn.send((request_id, "ok", shard.search(queries, k, allowed)))
+                    del queries
+                finally:
+                    shm.close()
+        except Exception as e:
+            conn.send((request_id, "error", repr(e)))
+    conn.close()
+
+
+class ShardError(RuntimeError):
+    pass
+
+
+class ShardPool:
+    """
+    N shard worker processes and what each of them has loaded. Thread-safe: one
+    search or load at a time goes through the pipes. After any shard fails the
+    pool is marked broken and get_shard_pool starts a new one.
+    """
+
+    def __init__(self, shards, start_method="spawn"):
+        context = multiprocessing.get_context(start_method)
+        self.shards = shards
+        self.loaded = [{} for _ in range(shards)]  # per shard: resource_id -> version
+        self.connections, self.processes = [], []
+        for _ in range(shards):
+            parent, child = context.Pipe()
+            process = context.Process(target=serve, args=(child,), daemon=True)
+            process.start()
+            child.close()
+            self.connections.append(parent)
+            self.processes.append(process)
+        self._lock = threading.Lock()
+        self._request_id = 0
+        self.broken = False
+
+    def _send(self, messages):
+        """
+        Sends {shard: (command, *args)} tagged with a new request id; returns the
+        id and the shards that got their message.
+        """
+        self._request_id += 1
+        sent = []
+        for s, (command, *args) in messages.items():
+            try:
+                self.connections[s].send((command, self._request_id, *args))
+                sent.append(s)
+            except (BrokenPipeError, OSError):
+                self.broken = True
+        return self._request_id, sent
+
+    def _gather(self, request_id, shards):
+        """
+        Reads the reply to `request_id` from every shard, even after one failed,
+        so no reply is left in a pipe for the next request.
+        """
+        results, errors = [], []
+        for s in shards:
+            try:
+                reply_id, status, result = self.connections[s].recv()
+                while reply_id != request_id:
+                    reply_id, status, result = self.connections[s].recv()
+            except (EOFError, OSError) as e:
+                status, result = "error", f"worker exited ({e!r})"
+            if status != "ok":
+                errors.append(f"shard {s}: {result}")
+            results.append(result)
+        if errors or self.broken:
+            self.broken = True
+            raise ShardError("; ".join(errors) or "worker exited")
+        return results
+
+    def sync(self, entries):
+        """
+        Sends every (resource_id, version, embeddings_path) a shard does not hold
+        at that version yet.
+        """
+        missing = [[] for _ in range(self.shards)]
+        for resource_id, version, path in entries:
+            s = shard_of(resource_id, self.shards)
+            if self.loaded[s].get(resource_id) != version:
+                missing[s].append((resource_id, version, str(path)))
+        busy = [s for s in range(self.shards) if missing[s]]
+        self._gather(*self._send({s: ("load", missing[s]) for s in busy}))
+        for s in busy:
+            self.loaded[s].update({resource_id: version for resource_id, version, _ in missing[s]})
+
+    def search(self, queries, entries, k, allowed=None):
+        """
+        Exact top-k over the resources in `entries` (loading what is missing),
+        restricted to the ids in `allowed` when given. Returns (resource_ids,
+        sentence_idx, similarity) of shape (len(queries), k), best first.
+        """
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        with self._lock:
+            self.sync(entries)
+            shm = shared_memory.SharedMemory(create=True, size=max(1, queries.nbytes))
+            try:
+                np.ndarray(queries.shape, dtype=np.float32, buffer=shm.buf)[:] = queries
+                allowed = None if allowed is None else np.fromiter(allowed, dtype=np.int64)
+                parts = self._gather(*self._send(
+                    {s: ("search", shm.name, queries.shape, k, allowed) for s in range(self.shards)}
+                ))
+            finally:
+                shm.close()
+                shm.unlink()
+        return merge_top_k(parts, k)
+
+    def close(self):
+        with self._lock:
+            for conn in self.connections:
+                try:
+                    conn.send(("stop",))
+                except (BrokenPipeError, OSError):
+                    pass
+            for process in self.processes:
+                process.join(timeout=5)
+                if process.is_alive():
+                    process.terminate()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_shard_pool(shards):
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool.broken:
+            print("⚠️ Restarting the shard pool after a shard failed")
+            _pool.close()
+            atexit.unregister(_pool.close)
+            _pool = None
+        if _pool is None:
+            _pool = ShardPool(shards)
+            atexit.register(_pool.close)
+        return _pool
@@ -0,0 +1,31 @@
+# sharded_index.py
+from app.algorithm import corpus_index
+from app.algorithm.ann_index import group_hits
+from app.algorithm.shard_pool import ShardError, get_shard_pool
+from app.config import SHARD_TOP_K, SHARD_WORKERS
+
+
+def search_corpus(user_embeddings, resources, k=SHARD_TOP_K):
+    """
+    Exact top-k of every submission sentence over the corpus, searched by
+    SHARD_WORKERS shard processes (see shard_pool.py). Same result shape as
+    ann_index.search_corpus: (hits by resource, ids of the resources searched).
+    If a shard fails, no resource counts as searched, so the check compares
+    every resource exhaustively; the next search starts a new pool.
+    """
+    entries = []
+    for resource in resources:
+        path = corpus_index.embeddings_path(resource)
+        if path is not None:
+            entries.append((resource["id"], resource.get("corpus_version", 0), path))
+    if not entries or not len(user_embeddings):
+        return {}, {resource_id for resource_id, _, _ in entries}
+    pool = get_shard_pool(SHARD_WORKERS)
+    try:
+        ids, sentences, similarity = pool.search(
+            user_embeddings, entries, k, allowed=[resource_id for resource_id, _, _ in entries]
+        )
+    except ShardError as e:
+        print(f"⚠️ Sharded search failed, comparing exhaustively: {e}")
+        return {}, set()
+    return group_hits(ids, sentences, similarity), {resource_id for resource_id, _, _ in entries}
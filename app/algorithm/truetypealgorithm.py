@@ -8,11 +8,11 @@ import numpy as np
 import nltk
 from nltk.tokenize import sent_tokenize
 from sentence_transformers import SentenceTransformer
-from itertools import groupby
-from operator import itemgetter
 from docx import Document
 import PyPDF2
 from app.algorithm.citation_checker import classify_citation_status  # your import
+from app.algorithm import segmenter
+from app.config import EXACT_THRESHOLD, PASSAGE_MAX_GAP, SENTENCE_SEGMENTER, SIMILARITY_THRESHOLD
 
 # Setup logging
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -157,6 +157,11 @@ def read_file(input_source):
         logging.error(f"Error reading input source {input_source}: {e}")
         merged = []
 
+    return split_merged_lines(merged)
+
+def split_merged_lines(merged):
+    if SENTENCE_SEGMENTER == "regex":
+        return segmenter.segment_document(merged)
     sentences = []
     for line in merged:
         if len(line.split()) > 10:
@@ -165,6 +170,12 @@ def read_file(input_source):
             sentences.append(line)
     return sentences
 
+def read_text(text):
+    """
+    Same sentences read_file would return for `text` saved as a .txt file.
+    """
+    return split_merged_lines(read_txt_from_string(text))
+
 # -----------------------------
 # Similarity & Detection Logic
 # -----------------------------
@@ -172,6 +183,18 @@ def read_file(input_source):
 def get_sentence_embeddings(sentences, model):
     return model.encode(sentences, convert_to_numpy=True)
 
+def normalize_embeddings(embeddings):
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True) + EPSILON
+    return (embeddings / norms).astype(np.float32)
+
+def encode_sentences(sentences):
+    """
+    Unit-length float32 embeddings, so cosine similarity is a plain dot product.
+    """
+    if not sentences:
+        return np.zeros((0, model.get_sentence_embedding_dimension()), dtype=np.float32)
+    return normalize_embeddings(get_sentence_embeddings(sentences, model))
+
 def cosine_similarity(matrix1, matrix2):
     matrix1_norm = np.linalg.norm(matrix1, axis=1, keepdims=True) + EPSILON
     matrix2_norm = np.linalg.norm(matrix2, axis=1, keepdims=True) + EPSILON
@@ -182,8 +205,8 @@ def cosine_similarity(matrix1, matrix2):
 def compute_similarity_matrix(embeddings1, embeddings2):
     return cosine_similarity(embeddings1, embeddings2)
 
-def extract_plagiarized_pairs(sentences1, sentences2, similarity_matrix, threshold=0.8):
-    exact_threshold = 0.95
+def extract_plagiarized_pairs(sentences1, sentences2, similarity_matrix, threshold=SIMILARITY_THRESHOLD):
+    exact_threshold = EXACT_THRESHOLD
     plagiarized_pairs = []
     for i, row in enumerate(similarity_matrix):
         j = np.argmax(row)
@@ -200,44 +223,122 @@ def extract_plagiarized_pairs(sentences1, sentences2, similarity_matrix, thresho
             })
     return plagiarized_pairs
 
-def group_consecutive_indices(indices):
-    groups = []
-    for k, g in groupby(enumerate(indices), lambda ix: ix[0] - ix[1]):
-        group = list(map(itemgetter(1), g))
-        groups.append(group)
-    return groups
-
-def get_plagiarism_blocks(matched_pairs, sentences_doc1, sentences_doc2):
-    matched_pairs.sort(key=lambda x: x['doc1_idx'])
-    plag_indices = [p['doc1_idx'] for p in matched_pairs]
-    grouped_indices = group_consecutive_indices(plag_indices)
-    blocks = []
-    for group in grouped_indices:
-        doc1_block_sentences = [sentences_doc1[i] for i in group]
-        doc1_block_text = " ".join(doc1_block_sentences)
-        group_pairs = [p for p in matched_pairs if p['doc1_idx'] in group]
-        doc2_indices = sorted(set(p['doc2_idx'] for p in group_pairs))
-        doc2_block_sentences = [sentences_doc2[j] for j in doc2_indices]
-        doc2_block_text = " ".join(doc2_block_sentences)
-        avg_similarity = sum(p['similarity'] for p in group_pairs) / len(group_pairs)
-        blocks.append({
-            'doc1_text': doc1_block_text,
-            'doc2_text': doc2_block_text,
-            'avg_similarity': avg_similarity,
-            'doc1_indices': group,
-            'doc2_indices': doc2_indices,
+def align_passages(matched_pairs, sentences_doc1, max_gap=PASSAGE_MAX_GAP):
+    """
+    Seed-and-extend alignment of sentence matches into passages. Pairs sorted by
+    doc1_idx are scanned once; a pair extends an open passage when it follows that
+    passage in both documents with at most `max_gap` unmatched sentences in between,
+    otherwise it seeds a new one. Passages that can no longer be extended are
+    closed as the scan moves on, so the open set stays small and the scan linear.
+    """
+    passages = []
+    open_passages = []
+    for pair in sorted(matched_pairs, key=lambda p: (p["doc1_idx"], p["doc2_idx"])):
+        i, j = pair["doc1_idx"], pair["doc2_idx"]
+        still_open = []
+        for passage in open_passages:
+            if i - passage["doc1_end"] <= max_gap + 1:
+                still_open.append(passage)
+            else:
+                passages.append(passage)
+        open_passages = still_open
+
+        target = None
+        for passage in open_passages:
+            if i > passage["doc1_end"] and 0 <= j - passage["doc2_end"] <= max_gap + 1:
+                if target is None or passage["doc1_end"] > target["doc1_end"]:
+                    target = passage
+        if target is None:
+            target = {"doc1_start": i, "doc2_start": j, "doc2_end": j, "pairs": []}
+            open_passages.append(target)
+        target["doc1_end"] = i
+        target["doc2_end"] = max(target["doc2_end"], j)
+        target["pairs"].append(pair)
+    passages.extend(open_passages)
+
+    result = []
+    for passage in sorted(passages, key=lambda p: (p["doc1_start"], p["doc2_start"])):
+        pairs = passage.pop("pairs")
+        doc2_sentences = {}
+        for p in pairs:
+            doc2_sentences.setdefault(p["doc2_idx"], p.get("doc2_sentence", ""))
+        result.append({
+            **passage,
+            "doc1_text": " ".join(sentences_doc1[passage["doc1_start"]:passage["doc1_end"] + 1]),
+            "doc2_text": " ".join(doc2_sentences[j] for j in sorted(doc2_sentences)),
+            "avg_similarity": sum(p["similarity"] for p in pairs) / len(pairs),
+            "doc1_indices": [p["doc1_idx"] for p in pairs],
+            "doc2_indices": sorted(doc2_sentences),
+            "source_file": pairs[0].get("source_file"),
         })
-    return blocks
+    return result
 
 # -----------------------------
 # Main plagiarism detection with citation checking
 # -----------------------------
 
-def get_plagiarism_report(file_path1, file_path2, threshold=0.8, display_name=None):
+def match_sentences(doc1, doc2, similarity_matrix, source_name,
+                    threshold=SIMILARITY_THRESHOLD, exact_threshold=EXACT_THRESHOLD, row_indices=None):
+    """
+    Best doc2 match per similarity row. `row_indices` maps rows to doc1 indices
+    when only a subset of doc1 was compared.
+    """
+    if similarity_matrix.size == 0:
+        return []
+    if row_indices is None:
+        row_indices = np.arange(similarity_matrix.shape[0])
+    best_idx = np.argmax(similarity_matrix, axis=1)
+    best_sim = similarity_matrix[np.arange(len(best_idx)), best_idx]
+    matched_pairs = []
+    for row in np.nonzero(best_sim >= threshold)[0]:
+        i = int(row_indices[row])
+        max_j = best_idx[row]
+        max_sim = best_sim[row]
+        matched_pairs.append({
+            "doc1_idx": i,
+            "doc1_sentence": doc1[i],
+            "doc2_idx": int(max_j),
+            "doc2_sentence": doc2[max_j],
+            "similarity": max_sim,
+            "type": "exact" if max_sim >= exact_threshold else "partial",
+            "source_file": source_name
+        })
+    return matched_pairs
+
+def build_report(doc1, doc2, doc2_lines, matched_pairs, source_name, db_keys=None, citations=None, references=None):
+    matched_pairs = classify_citation_status(
+        matched_pairs, doc1, doc2, doc2_lines, db_keys=db_keys, annotations=citations, references=references
+    )
+    return summarize_matches(doc1, matched_pairs, source_name)
+
+def summarize_matches(doc1, matched_pairs, source_name):
+    num_sentences = len(doc1)
+    exact_matches = [p["doc1_sentence"] for p in matched_pairs if p["type"] == "exact"]
+    partial_matches = [p["doc1_sentence"] for p in matched_pairs if p["type"] == "partial"]
+    unique_count = num_sentences - len(matched_pairs)
+
+    x = len(exact_matches) / num_sentences
+    y = len(partial_matches) / num_sentences
+    z = unique_count / num_sentences
+
+    return {
+        "filename": source_name,
+        "exact_score": round(x, 4),
+        "partial_score": round(y, 4),
+        "unique_score": round(z, 4),
+        "total_score": 1.0,
+        "exact_matches": exact_matches,
+        "partial_matches": partial_matches,
+        "matched_pairs": matched_pairs,
+        "passages": align_passages(matched_pairs, doc1),
+    }
+
+def get_plagiarism_report(file_path1, file_path2, threshold=SIMILARITY_THRESHOLD, display_name=None):
     logging.info(f"Generating plagiarism report for '{file_path1}' vs '{file_path2}'")
     doc1 = read_file(file_path1)
     doc2 = read_file(file_path2)
     user_basename = os.path.basename(file_path1)
+    source_name = display_name or os.path.basename(file_path2)
     if not doc1:
         logging.warning(f"No text extracted from {file_path1}")
     if not doc2:
@@ -248,13 +349,11 @@ def get_plagiarism_report(file_path1, file_path2, threshold=0.8, display_name=No
 
     similarity_matrix = compute_similarity_matrix(embeddings_doc1, embeddings_doc2)
 
-    exact_threshold = 0.95
-    num_sentences = len(doc1)
-    if num_sentences == 0:
+    if len(doc1) == 0:
         logging.warning("No sentences found in first document; returning empty report")
         return {
             "uploaded_filename": user_basename, 
-            "filename": display_name or os.path.basename(file_path2),
+            "filename": source_name,
             "exact_score": 0.0,
             "partial_score": 0.0,
             "unique_score": 1.0,
@@ -264,38 +363,7 @@ def get_plagiarism_report(file_path1, file_path2, threshold=0.8, display_name=No
             "matched_pairs": []
         }
 
-    exact_matches = []
-    partial_matches = []
-    matched_pairs = []
-    unique_count = 0
-
-    for i, row in enumerate(similarity_matrix):
-        max_j = np.argmax(row)
-        max_sim = row[max_j]
-        if max_sim >= exact_threshold:
-            exact_matches.append(doc1[i])
-            matched_pairs.append({
-                "doc1_idx": i,
-                "doc1_sentence": doc1[i],
-                "doc2_idx": max_j,
-                "doc2_sentence": doc2[max_j],
-                "similarity": max_sim,
-                "type": "exact",
-                "source_file": display_name or os.path.basename(file_path2)
-            })
-        elif max_sim >= threshold:
-            partial_matches.append(doc1[i])
-            matched_pairs.append({
-                "doc1_idx": i,
-                "doc1_sentence": doc1[i],
-                "doc2_idx": max_j,
-                "doc2_sentence": doc2[max_j],
-                "similarity": max_sim,
-                "type": "partial",
-                "source_file": display_name or os.path.basename(file_path2)
-            })
-        else:
-            unique_count += 1
+    matched_pairs = match_sentences(doc1, doc2, similarity_matrix, source_name, threshold=threshold)
 
     try:
         doc2_lines = read_raw_lines(file_path2)
@@ -303,24 +371,9 @@ def get_plagiarism_report(file_path1, file_path2, threshold=0.8, display_name=No
         logging.warning(f"Could not read raw lines from {file_path2} for citation checking: {e}")
         doc2_lines = []
 
-    matched_pairs = classify_citation_status(matched_pairs, doc1, doc2, doc2_lines)
-
-    x = len(exact_matches) / num_sentences
-    y = len(partial_matches) / num_sentences
-    z = unique_count / num_sentences
-
-    report = {
-        "filename": display_name or os.path.basename(file_path2),
-        "exact_score": round(x, 4),
-        "partial_score": round(y, 4),
-        "unique_score": round(z, 4),
-        "total_score": 1.0,
-        "exact_matches": exact_matches,
-        "partial_matches": partial_matches,
-        "matched_pairs": matched_pairs
-    }
+    report = build_report(doc1, doc2, doc2_lines, matched_pairs, source_name)
 
-    logging.info(f"Plagiarism report generated for '{display_name or file_path2}'")
+    logging.info(f"Plagiarism report generated for '{source_name}'")
     return report
 
 
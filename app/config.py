@@ -0,0 +1,143 @@
+# app/config.py
+
+import os
+from pathlib import Path
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Plagiarism report cache
+REPORT_CACHE_SIZE = int(os.getenv("REPORT_CACHE_SIZE", 128))
+REPORT_CACHE_DB_ROWS = int(os.getenv("REPORT_CACHE_DB_ROWS", 5000))
+
+# Per-resource sentence/embedding index, rebuilt when a resource's corpus_version changes
+CORPUS_INDEX_DIR = os.getenv("CORPUS_INDEX_DIR", "corpus_index")
+
+# Uploaded submissions are kept here while they are checked
+UPLOAD_DIR = Path(os.getenv("UPLOAD_DIR", "uploads"))
+
+# Sentence similarity from which a pair counts as a (partial) match, and as exact
+SIMILARITY_THRESHOLD = 0.8
+EXACT_THRESHOLD = 0.95
+
+# Unsaved check states (no report linked) are pruned after this many days
+CHECK_STATE_TTL_DAYS = int(os.getenv("CHECK_STATE_TTL_DAYS", 7))
+
+# Per-sentence top-k candidates kept with each check for instant re-thresholding.
+# Candidates below the floor are not stored, so it is the lowest usable threshold.
+RETHRESHOLD_TOP_K = int(os.getenv("RETHRESHOLD_TOP_K", 5))
+RETHRESHOLD_FLOOR = float(os.getenv("RETHRESHOLD_FLOOR", 0.5))
+
+# Sentence segmenter for parsed documents: "nltk" (punkt) or "regex" (app/algorithm/segmenter.py)
+SENTENCE_SEGMENTER = os.getenv("SENTENCE_SEGMENTER", "nltk")
+
+# Sentence matches up to this many unmatched sentences apart join into one passage
+PASSAGE_MAX_GAP = int(os.getenv("PASSAGE_MAX_GAP", 1))
+
+# "exhaustive" compares every sentence with every resource sentence; "hierarchical"
+# shortlists resources by document centroid and compares each submission paragraph
+# only with its closest resource paragraphs (paragraph = run of N sentences); "ann"
+# searches the IVF/PQ index (ANN_* settings below); "sharded" searches exactly across
+# shard worker processes (SHARD_* settings below)
+MATCHING_MODE = os.getenv("MATCHING_MODE", "exhaustive")
+HIERARCHY_PARAGRAPH_SENTENCES = int(os.getenv("HIERARCHY_PARAGRAPH_SENTENCES", 8))
+HIERARCHY_TOP_RESOURCES = int(os.getenv("HIERARCHY_TOP_RESOURCES", 20))
+HIERARCHY_TOP_PARAGRAPHS = int(os.getenv("HIERARCHY_TOP_PARAGRAPHS", 3))
+
+# Compare only this many resources per check, chosen by title + content similarity
+# before any resource file is read (0 compares every resource)
+SCREENING_TOP_RESOURCES = int(os.getenv("SCREENING_TOP_RESOURCES", 0))
+
+# Approximate search (MATCHING_MODE=ann): IVF lists (0 = 4 * sqrt(sentences)), lists
+# probed per query, PQ subspaces, candidates re-ranked exactly, training sample size,
+# and the share of changed/new resources that triggers a background rebuild
+ANN_NLIST = int(os.getenv("ANN_NLIST", 0))
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", 8))
+ANN_PQ_SUBSPACES = int(os.getenv("ANN_PQ_SUBSPACES", 48))
+ANN_RERANK = int(os.getenv("ANN_RERANK", 50))
+ANN_TRAIN_SAMPLE = int(os.getenv("ANN_TRAIN_SAMPLE", 100000))
+ANN_MAX_STALE = float(os.getenv("ANN_MAX_STALE", 0.1))
+
+# Batch checks (/checks/batch): most files per request, most bytes written for
+# them (uploads and extracted archive members together) and parallel file parsers
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", 100))
+BATCH_MAX_BYTES = int(os.getenv("BATCH_MAX_BYTES", 200 * 1024 * 1024))
+BATCH_PARSE_WORKERS = int(os.getenv("BATCH_PARSE_WORKERS", 4))
+
+# Peer search: also compare every check with earlier submissions (reports) of other
+# users; the peer index is split into IVF lists once it holds this many sentences
+PEER_SEARCH = os.getenv("PEER_SEARCH", "false").lower() == "true"
+PEER_MIN_TRAIN = int(os.getenv("PEER_MIN_TRAIN", 5000))
+# Seconds between background scans for deleted reports (hits are checked on every search)
+PEER_PRUNE_SECONDS = int(os.getenv("PEER_PRUNE_SECONDS", 600))
+# Roles (comma-separated) shown who wrote a matching submission and its sentences;
+# everyone else only gets the report id and scores of peer matches
+PEER_DETAIL_ROLES = {role.strip() for role in os.getenv("PEER_DETAIL_ROLES", "admin").split(",") if role.strip()}
+
+# Rows per block of the within-batch all-pairs comparison (/checks/batch?pairwise=true)
+PAIRWISE_BLOCK_SIZE = int(os.getenv("PAIRWISE_BLOCK_SIZE", 4096))
+
+# Boilerplate suppression before encoding: submission sentences with fewer content
+# words than this (0 = off), or found in this share of corpus documents (0 = off)
+# and in at least BOILERPLATE_MIN_DOCS of them, are not checked
+BOILERPLATE_MIN_WORDS = int(os.getenv("BOILERPLATE_MIN_WORDS", 0))
+BOILERPLATE_MAX_DF = float(os.getenv("BOILERPLATE_MAX_DF", 0))
+BOILERPLATE_MIN_DOCS = int(os.getenv("BOILERPLATE_MIN_DOCS", 5))
+# Phrase-level boilerplate: runs of this many words are counted per corpus document
+# too (0 = whole sentences only), and a sentence is not checked when at least
+# BOILERPLATE_PHRASE_SHARE of its phrases are that frequent (templated sentences)
+BOILERPLATE_PHRASE_WORDS = int(os.getenv("BOILERPLATE_PHRASE_WORDS", 0))
+BOILERPLATE_PHRASE_SHARE = float(os.getenv("BOILERPLATE_PHRASE_SHARE", 0.8))
+
+# Second-stage scoring of borderline pairs: "cross-encoder" (RERANK_MODEL), "token"
+# (word alignment) or empty for off; similarities in [LOW, HIGH) are re-scored,
+# the RERANK_BUDGET most similar of them across a check
+RERANK_SCORER = os.getenv("RERANK_SCORER", "")
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/stsb-distilroberta-base")
+RERANK_BAND_LOW = float(os.getenv("RERANK_BAND_LOW", 0.72))
+RERANK_BAND_HIGH = float(os.getenv("RERANK_BAND_HIGH", 0.85))
+RERANK_BUDGET = int(os.getenv("RERANK_BUDGET", 200))
+# Second-stage scores that count as a match / an exact match (mapped onto
+# SIMILARITY_THRESHOLD / EXACT_THRESHOLD); tune them for the scorer in use
+RERANK_THRESHOLD = float(os.getenv("RERANK_THRESHOLD", 0.6))
+RERANK_EXACT_THRESHOLD = float(os.getenv("RERANK_EXACT_THRESHOLD", 0.9))
+
+# Seconds a single upload check may take (0 = no limit); when it runs out the
+# remaining resources are skipped and the report is marked partial
+CHECK_TIME_BUDGET = float(os.getenv("CHECK_TIME_BUDGET", 0))
+# Stop searching a sentence once any resource matched it exactly
+EXACT_EARLY_STOP = os.getenv("EXACT_EARLY_STOP", "false").lower() == "true"
+
+# Resources compared in parallel per check (1 = sequential), and the per-process
+# BLAS thread cap set by the thread governor; 0 divides the process's thread
+# budget by COMPARE_WORKERS, so compare threads x BLAS threads stays within it
+COMPARE_WORKERS = int(os.getenv("COMPARE_WORKERS", 1))
+COMPARE_BLAS_THREADS = int(os.getenv("COMPARE_BLAS_THREADS", 0))
+
+# Sharded search (MATCHING_MODE=sharded): shard worker processes and the candidates
+# kept per submission sentence across all shards
+SHARD_WORKERS = int(os.getenv("SHARD_WORKERS", 4))
+SHARD_TOP_K = int(os.getenv("SHARD_TOP_K", 50))
+
+# Start the notification/subscription scheduler in this process; gunicorn.conf.py
+# turns it off in the workers and runs it once in the master
+RUN_SCHEDULER = os.getenv("RUN_SCHEDULER", "true").lower() == "true"
+
+# Memory-map corpus embeddings from the index instead of reading them into every
+# worker (see gunicorn.conf.py for the preload/fork mode)
+CORPUS_MMAP = os.getenv("CORPUS_MMAP", "false").lower() == "true"
+
+# Detection worker service (detection_worker.py): base URL the API forwards checks
+# to, e.g. http://127.0.0.1:8001; empty runs detection inside the API process
+DETECTION_WORKER_URL = os.getenv("DETECTION_WORKER_URL", "").rstrip("/")
+DETECTION_WORKER_PORT = int(os.getenv("DETECTION_WORKER_PORT", 8001))
+DETECTION_WORKER_TIMEOUT = int(os.getenv("DETECTION_WORKER_TIMEOUT", 600))
+
+# Thread governor: caps torch and BLAS/OpenMP intra-op threads of every worker
+# process at COMPUTE_THREADS, or by default at the CPUs the process may run on
+# divided by the processes computing at once: the web/API worker processes
+# (WORKER_PROCESSES, default WEB_CONCURRENCY) times the shard processes each
+# starts in sharded MATCHING_MODE, so N workers do not each start one thread per core
+THREAD_GOVERNOR = os.getenv("THREAD_GOVERNOR", "true").lower() == "true"
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES") or os.getenv("WEB_CONCURRENCY") or 1)
+COMPUTE_THREADS = int(os.getenv("COMPUTE_THREADS", 0))
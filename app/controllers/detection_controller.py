@@ -0,0 +1,119 @@
+# app/controllers/detection_controller.py
+
+import json
+
+import requests
+from starlette.concurrency import run_in_threadpool
+
+from app.config import DETECTION_WORKER_TIMEOUT, DETECTION_WORKER_URL, UPLOAD_DIR
+
+# With DETECTION_WORKER_URL set, every check is forwarded to the detection worker
+# (detection_worker.py) and this process never imports numpy, torch or
+# sentence-transformers. Without it, the pipeline runs in-process as before.
+if not DETECTION_WORKER_URL:
+    from app.algorithm import detection_service, pipeline, screening
+
+UPLOAD_DIR.mkdir(exist_ok=True)
+
+
+def _post(path, **kwargs):
+    response = requests.post(f"{DETECTION_WORKER_URL}{path}", timeout=DETECTION_WORKER_TIMEOUT, **kwargs)
+    response.raise_for_status()
+    return response
+
+
+def _post_or_none(path, **kwargs):
+    # The worker answers 404 for unknown checks
+    response = requests.post(f"{DETECTION_WORKER_URL}{path}", timeout=DETECTION_WORKER_TIMEOUT, **kwargs)
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    return response.json()
+
+
+def _upload(user_file, filename, user_id, resource_filter, peer_details):
+    with open(user_file, "rb") as f:
+        return _post(
+            "/detect/upload",
+            files={"file": (filename, f)},
+            data={
+                "user_id": "" if user_id is None else str(user_id),
+                "resource_filter": json.dumps(resource_filter) if resource_filter else "",
+                "peer_details": str(peer_details).lower(),
+            },
+        ).json()
+
+
+async def check_upload(user_file, filename, user_id=None, resource_filter=None, peer_details=False):
+    if not DETECTION_WORKER_URL:
+        return await detection_service.check_upload(user_file, filename, user_id, resource_filter, peer_details)
+    return await run_in_threadpool(_upload, user_file, filename, user_id, resource_filter, peer_details)
+
+
+async def upload_metrics():
+    if not DETECTION_WORKER_URL:
+        return detection_service.upload_metrics()
+    response = await run_in_threadpool(
+        requests.get, f"{DETECTION_WORKER_URL}/detect/metrics", timeout=DETECTION_WORKER_TIMEOUT
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def batch_lines(submissions, user_id=None, pairwise=False, peer_details=False):
+    """
+    NDJSON lines of a batch check of (path, filename) submissions.
+    """
+    if not DETECTION_WORKER_URL:
+        yield from detection_service.batch_lines(
+            submissions, user_id=user_id, pairwise=pairwise, peer_details=peer_details
+        )
+        return
+    handles = [open(path, "rb") for path, _ in submissions]
+    try:
+        response = _post(
+            "/detect/batch",
+            files=[("files", (name, handle)) for (_, name), handle in zip(submissions, handles)],
+            data={
+                "user_id": "" if user_id is None else str(user_id),
+                "pairwise": str(pairwise).lower(),
+                "peer_details": str(peer_details).lower(),
+            },
+            stream=True,
+        )
+        with response:
+            for line in response.iter_lines():
+                if line:
+                    yield line.decode("utf-8") + "\n"
+    finally:
+        for handle in handles:
+            handle.close()
+
+
+def recheck_plagiarism(check_id, peer_details=False):
+    if not DETECTION_WORKER_URL:
+        return pipeline.recheck_plagiarism(check_id, peer_details)
+    return _post_or_none(f"/detect/checks/{check_id}/recheck", params={"peer_details": peer_details})
+
+
+def rethreshold_check(check_id, threshold, exact_threshold):
+    if not DETECTION_WORKER_URL:
+        return pipeline.rethreshold_check(check_id, threshold, exact_threshold)
+    return _post_or_none(
+        f"/detect/checks/{check_id}/rethreshold",
+        params={"threshold": threshold, "exact_threshold": exact_threshold},
+    )
+
+
+def discard_resource(resource_id):
+    # resource_controller has already updated this process; the worker holds its own copies
+    if DETECTION_WORKER_URL:
+        _post(f"/detect/resources/{resource_id}/discard")
+
+
+def index_resource(resource):
+    if not DETECTION_WORKER_URL:
+        screening.index_resource_screening(resource)
+        return
+    _post("/detect/resources/index", data=json.dumps(resource, default=str),
+          headers={"Content-Type": "application/json"})
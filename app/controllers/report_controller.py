@@ -25,6 +25,13 @@ def create_report(report_data: dict, user_id: int):
             report_data.get('citation_status')
         ))
         report_id = cursor.fetchone()[0]
+        if report_data.get('check_id'):
+            # Keep the check's match state so the report can be re-checked later;
+            # only the check's owner may link it
+            cursor.execute(
+                "UPDATE check_states SET report_id = %s WHERE check_id = %s AND user_id = %s",
+                (report_id, report_data['check_id'], user_id)
+            )
         conn.commit()
         return {"message": "Report created successfully.", "report_id": report_id}
     except Exception as e:
@@ -35,6 +42,30 @@ def create_report(report_data: dict, user_id: int):
         conn.close()
 
 
+def update_report_scores(report_id: int, report_data: dict):
+    conn = test_database_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            UPDATE reports
+            SET unique_score = %s, total_exact_score = %s, total_partial_score = %s, citation_status = %s
+            WHERE id = %s
+        """, (
+            report_data.get('unique_score'),
+            report_data.get('total_exact_score'),
+            report_data.get('total_partial_score'),
+            report_data.get('document_citation_status'),
+            report_id
+        ))
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    finally:
+        cursor.close()
+        conn.close()
+
+
 def fetch_reports_history(user_id: int, page: int = 1, limit: int = 10):
     offset = (page - 1) * limit
     conn = test_database_connection()
@@ -101,6 +132,23 @@ def get_report_by_id(report_id: int, user_id: int, force: bool = False):
         conn.close()
 
 
+def authorize_check(check_id: str, user_id: int):
+    # Checks (and their stored similarity state) belong to the user who ran them;
+    # guests' checks belong to no one
+    conn = test_database_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT user_id FROM check_states WHERE check_id = %s", (check_id,))
+        row = cursor.fetchone()
+        if not row:
+            raise HTTPException(status_code=404, detail="Check not found")
+        if row[0] is None or row[0] != user_id:
+            raise HTTPException(status_code=403, detail="Unauthorized to access this check")
+    finally:
+        cursor.close()
+        conn.close()
+
+
 def delete_report(report_id: int, user_id: int = None, force: bool = False):
     conn = test_database_connection()
     cursor = conn.cursor()
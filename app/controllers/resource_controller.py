@@ -4,6 +4,8 @@ import os
 import base64
 import uuid
 from app.database.db_connect import test_database_connection
+from app.algorithm.report_cache import invalidate_report_cache
+from app.algorithm.citation_checker import reference_index
 
 UPLOAD_DIR = "uploaded_resources"
 
@@ -60,7 +62,7 @@ def get_resource_by_id(resource_id: int):
     cursor = conn.cursor()
     try:
         cursor.execute("""
-            SELECT id, title, content, file_path, file_url, publication_date, publisher, created_at, updated_at, deleted_at
+            SELECT id, title, content, file_path, file_url, publication_date, publisher, corpus_version, created_at, updated_at, deleted_at
             FROM resources 
             WHERE id = %s
         """, (resource_id,))
@@ -121,7 +123,7 @@ def get_all_resources():
     cursor = conn.cursor()
     try:
         cursor.execute("""
-            SELECT id, title, content, file_path, file_url, publication_date, publisher, created_at, updated_at 
+            SELECT id, title, content, file_path, file_url, publication_date, publisher, corpus_version, created_at, updated_at 
             FROM resources 
             WHERE deleted_at IS NULL 
             ORDER BY created_at DESC
@@ -163,39 +165,44 @@ def link_authors_to_resource(cursor, resource_id: int, authors: list[dict]):
     for author_data in authors:
         author_id = get_or_create_author(cursor, author_data)
         cursor.execute("INSERT INTO resource_authors (resource_id, author_id) VALUES (%s, %s)", (resource_id, author_id))
+    reference_index.refresh_resource(cursor, resource_id)
 
-def update_resource(file: UploadFile, base_dir=UPLOAD_DIR) -> str:
-    os.makedirs(base_dir, exist_ok=True)
-    ext = os.path.splitext(file.filename)[1]
-    filename = f"{uuid.uuid4().hex}{ext}"
-    file_path = os.path.join(base_dir, filename)
-    
-    file.file.seek(0)
-    with open(file_path, "wb") as f:
-        f.write(file.file.read())
-    file.file.close()
-    return file_path
+def parse_publication_date(pub_date_str):
+    if not pub_date_str:
+        return None
+    try:
+        return datetime.strptime(pub_date_str, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid publication_date format, use YYYY-MM-DD")
+
+
+def get_corpus_version() -> int:
+    # Every create/update/soft-delete stamps the row with nextval('corpus_version_seq'),
+    # so the max over all rows (deleted included) identifies the current corpus.
+    conn = test_database_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT COALESCE(MAX(corpus_version), 0) FROM resources")
+        return cursor.fetchone()[0]
+    finally:
+        cursor.close()
+        conn.close()
 
 
 def create_resource(resource_data: dict, uploaded_file: UploadFile = None):
     conn = test_database_connection()
     cursor = conn.cursor()
+    new_id = None
     try:
         now = datetime.utcnow()
 
         file_path = process_file_input(resource_data.get("file_path"), uploaded_file)
 
-        pub_date_str = resource_data.get("publication_date")
-        publication_date = None
-        if pub_date_str:
-            try:
-                publication_date = datetime.strptime(pub_date_str, "%Y-%m-%d").date()
-            except ValueError:
-                raise HTTPException(status_code=400, detail="Invalid publication_date format, use YYYY-MM-DD")
+        publication_date = parse_publication_date(resource_data.get("publication_date"))
 
         cursor.execute("""
-            INSERT INTO resources (title, content, file_path, file_url, publication_date, publisher, created_at, updated_at)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            INSERT INTO resources (title, content, file_path, file_url, publication_date, publisher, created_at, updated_at, corpus_version)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, nextval('corpus_version_seq'))
             RETURNING id
         """, (
             resource_data["title"],
@@ -214,9 +221,12 @@ def create_resource(resource_data: dict, uploaded_file: UploadFile = None):
             link_authors_to_resource(cursor, new_id, authors)
 
         conn.commit()
+        invalidate_report_cache()
         return get_resource_by_id(new_id)
     except Exception as e:
         conn.rollback()
+        if new_id is not None:
+            reference_index.discard_resource(new_id)
         raise HTTPException(status_code=400, detail=str(e))
     finally:
         cursor.close()
@@ -229,8 +239,13 @@ def soft_delete_resource(resource_id: int):
     try:
         _ = get_resource_by_id(resource_id)
         now = datetime.utcnow()
-        cursor.execute("UPDATE resources SET deleted_at = %s WHERE id = %s", (now, resource_id))
+        cursor.execute(
+            "UPDATE resources SET deleted_at = %s, corpus_version = nextval('corpus_version_seq') WHERE id = %s",
+            (now, resource_id),
+        )
         conn.commit()
+        invalidate_report_cache()
+        reference_index.discard_resource(resource_id)
         return {"message": "Resource deleted"}
     except HTTPException:
         raise
@@ -240,3 +255,47 @@ def soft_delete_resource(resource_id: int):
     finally:
         cursor.close()
         conn.close()
+
+
+def update_resource(resource_id: int, resource_data: dict, uploaded_file: UploadFile = None):
+    conn = test_database_connection()
+    cursor = conn.cursor()
+    try:
+        _ = get_resource_by_id(resource_id)
+
+        fields = {
+            column: resource_data[column]
+            for column in ("title", "content", "file_url", "publisher")
+            if column in resource_data
+        }
+        if "publication_date" in resource_data:
+            fields["publication_date"] = parse_publication_date(resource_data["publication_date"])
+
+        file_path = process_file_input(resource_data.get("file_path"), uploaded_file)
+        if file_path:
+            fields["file_path"] = file_path
+        fields["updated_at"] = datetime.utcnow()
+
+        assignments = ", ".join(f"{column} = %s" for column in fields)
+        cursor.execute(
+            f"UPDATE resources SET {assignments}, corpus_version = nextval('corpus_version_seq') WHERE id = %s",
+            (*fields.values(), resource_id),
+        )
+
+        if "authors" in resource_data:
+            link_authors_to_resource(cursor, resource_id, resource_data["authors"])
+
+        conn.commit()
+        invalidate_report_cache()
+        return get_resource_by_id(resource_id)
+    except HTTPException:
+        conn.rollback()
+        reference_index.discard_resource(resource_id)
+        raise
+    except Exception as e:
+        conn.rollback()
+        reference_index.discard_resource(resource_id)
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        cursor.close()
+        conn.close()
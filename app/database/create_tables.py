@@ -65,6 +65,7 @@ def create_tables():
                     file_url TEXT NULL,
                     publication_date DATE,
                     publisher VARCHAR(50),
+                    corpus_version BIGINT NOT NULL DEFAULT 0,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     deleted_at TIMESTAMP
@@ -143,8 +144,52 @@ def create_tables():
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 );
             """,
+            "report_cache": """
+                CREATE TABLE report_cache (
+                    id SERIAL PRIMARY KEY,
+                    content_hash VARCHAR(64) NOT NULL,
+                    corpus_version BIGINT NOT NULL,
+                    settings TEXT NOT NULL,
+                    report JSONB NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    UNIQUE (content_hash, corpus_version, settings)
+                );
+            """,
+            "check_states": """
+                CREATE TABLE check_states (
+                    id SERIAL PRIMARY KEY,
+                    check_id VARCHAR(32) UNIQUE NOT NULL,
+                    report_id INTEGER REFERENCES reports(id) ON DELETE CASCADE,
+                    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+                    content_hash VARCHAR(64) NOT NULL,
+                    corpus_version BIGINT NOT NULL,
+                    settings TEXT NOT NULL,
+                    state JSONB NOT NULL,
+                    embeddings BYTEA,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+            """,
+            "resource_screening": """
+                CREATE TABLE resource_screening (
+                    resource_id INTEGER REFERENCES resources(id) ON DELETE CASCADE,
+                    model TEXT NOT NULL,
+                    corpus_version BIGINT NOT NULL,
+                    embedding BYTEA NOT NULL,
+                    PRIMARY KEY (resource_id, model)
+                );
+            """,
         }
 
+        # Idempotent changes for databases created before these columns existed
+        migrations = [
+            "CREATE SEQUENCE IF NOT EXISTS corpus_version_seq;",
+            "ALTER TABLE resources ADD COLUMN IF NOT EXISTS corpus_version BIGINT NOT NULL DEFAULT 0;",
+            "ALTER TABLE check_states ADD COLUMN IF NOT EXISTS user_id INTEGER REFERENCES users(id) ON DELETE CASCADE;",
+            "ALTER TABLE check_states ADD COLUMN IF NOT EXISTS embeddings BYTEA;",
+            "CREATE INDEX IF NOT EXISTS idx_check_states_user ON check_states (user_id, updated_at DESC);",
+        ]
+
         for name, ddl in tables.items():
             if not table_exists(cursor, name):
                 cursor.execute(ddl)
@@ -152,6 +197,9 @@ def create_tables():
             else:
                 print(f"ℹ️ Table '{name}' already exists")
 
+        for ddl in migrations:
+            cursor.execute(ddl)
+
         conn.commit()
         cursor.close()
         conn.close()
@@ -1,5 +1,5 @@
 -- Drop tables if they exist (in reverse dependency order)
-DROP TABLE IF EXISTS  notifications, reports, resource_authors, authors, resources, payments, users, plans;
+DROP TABLE IF EXISTS  resource_screening, check_states, report_cache, notifications, reports, resource_authors, authors, resources, payments, users, plans;
 
 -- Create Plans table
 CREATE TABLE plans (
@@ -40,6 +40,9 @@ CREATE TABLE payments (
     deleted_at TIMESTAMP
 );
 
+-- Bumped on every resource create/update/soft-delete
+CREATE SEQUENCE IF NOT EXISTS corpus_version_seq;
+
 -- Create Resources table
 CREATE TABLE resources (
    id SERIAL PRIMARY KEY,
@@ -49,6 +52,7 @@ CREATE TABLE resources (
    file_url TEXT NULL,
    publication_date DATE,
    publisher VARCHAR(50),
+   corpus_version BIGINT NOT NULL DEFAULT 0,
    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
    deleted_at TIMESTAMP
@@ -102,6 +106,42 @@ CREATE TABLE blacklisted_tokens (
     expires_at TIMESTAMP NOT NULL
 );
 
+-- Cached plagiarism reports, keyed by upload hash and corpus version
+CREATE TABLE report_cache (
+    id SERIAL PRIMARY KEY,
+    content_hash VARCHAR(64) NOT NULL,
+    corpus_version BIGINT NOT NULL,
+    settings TEXT NOT NULL,
+    report JSONB NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (content_hash, corpus_version, settings)
+);
+
+-- Per-sentence match state of a check, used to re-check against new resources
+CREATE TABLE check_states (
+    id SERIAL PRIMARY KEY,
+    check_id VARCHAR(32) UNIQUE NOT NULL,
+    report_id INTEGER REFERENCES reports(id) ON DELETE CASCADE,
+    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+    content_hash VARCHAR(64) NOT NULL,
+    corpus_version BIGINT NOT NULL,
+    settings TEXT NOT NULL,
+    state JSONB NOT NULL,
+    embeddings BYTEA,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX idx_check_states_user ON check_states (user_id, updated_at DESC);
+
+-- Title + content embedding of each resource, used to screen resources before their files are read
+CREATE TABLE resource_screening (
+    resource_id INTEGER REFERENCES resources(id) ON DELETE CASCADE,
+    model TEXT NOT NULL,
+    corpus_version BIGINT NOT NULL,
+    embedding BYTEA NOT NULL,
+    PRIMARY KEY (resource_id, model)
+);
+
 -- CREATE TABLE password_reset_tokens (
 --     id SERIAL PRIMARY KEY,
 --     user_id INT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
@@ -0,0 +1,142 @@
+import json
+import traceback
+import uuid
+import zipfile
+from pathlib import Path
+from typing import List
+
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile
+from fastapi.responses import StreamingResponse
+
+from app.config import BATCH_MAX_BYTES, BATCH_MAX_FILES, EXACT_THRESHOLD, RETHRESHOLD_FLOOR, UPLOAD_DIR
+from app.controllers.detection_controller import batch_lines, recheck_plagiarism, rethreshold_check
+from app.controllers.report_controller import authorize_check
+from app.utils.jwt_handler import get_current_user
+from app.utils.role_handle import sees_peer_details
+
+router = APIRouter(prefix="/checks", tags=["Plagiarism Check"])
+
+BATCH_EXTENSIONS = {".pdf", ".docx", ".txt"}
+
+
+@router.post("/{check_id}/recheck")
+def recheck(check_id: str, current_user: dict = Depends(get_current_user)):
+    authorize_check(check_id, current_user["user_id"])
+    result = recheck_plagiarism(check_id, sees_peer_details(current_user))
+    if result is None:
+        raise HTTPException(status_code=404, detail="Check not found")
+    return result
+
+
+@router.post("/{check_id}/rethreshold")
+def rethreshold(
+    check_id: str,
+    threshold: float = Query(..., ge=RETHRESHOLD_FLOOR, le=1.0),
+    exact_threshold: float = Query(EXACT_THRESHOLD, ge=RETHRESHOLD_FLOOR, le=1.0),
+    current_user: dict = Depends(get_current_user),
+):
+    if exact_threshold < threshold:
+        raise HTTPException(status_code=400, detail="exact_threshold must not be lower than threshold")
+    authorize_check(check_id, current_user["user_id"])
+    result = rethreshold_check(check_id, threshold, exact_threshold)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Check not found or has no stored similarity state")
+    return result
+
+
+def save_batch_uploads(files):
+    """
+    Saves the uploaded files, expanding .zip archives, and returns a list of
+    (path on disk, display filename). Unsupported files are skipped. More than
+    BATCH_MAX_FILES submissions, or archives declaring more than BATCH_MAX_BYTES,
+    are rejected before anything more is written, and copying stops once
+    BATCH_MAX_BYTES have been written whatever the sizes claimed; on any error
+    the files saved so far are removed.
+    """
+    saved = []
+    written = 0
+    try:
+        for file in files:
+            name = Path(file.filename or "").name
+            if name.lower().endswith(".zip"):
+                try:
+                    with zipfile.ZipFile(file.file) as archive:
+                        members = [
+                            member for member in archive.infolist()
+                            if not member.is_dir() and Path(member.filename).suffix.lower() in BATCH_EXTENSIONS
+                        ]
+                        check_batch_size(len(saved) + len(members))
+                        check_batch_bytes(written + sum(member.file_size for member in members))
+                        for member in members:
+                            member_name = Path(member.filename).name
+                            path = UPLOAD_DIR / f"{uuid.uuid4().hex}_{member_name}"
+                            saved.append((path, member_name))
+                            with archive.open(member) as source, open(path, "wb") as buffer:
+                                written = copy_within_limit(source, buffer, written)
+                except zipfile.BadZipFile:
+                    raise HTTPException(status_code=400, detail=f"Invalid zip archive: {name}")
+            elif Path(name).suffix.lower() in BATCH_EXTENSIONS:
+                check_batch_size(len(saved) + 1)
+                path = UPLOAD_DIR / f"{uuid.uuid4().hex}_{name}"
+                saved.append((path, name))
+                with open(path, "wb") as buffer:
+                    written = copy_within_limit(file.file, buffer, written)
+    except BaseException:
+        for path, _ in saved:
+            path.unlink(missing_ok=True)
+        raise
+    return saved
+
+
+def check_batch_size(count):
+    if count > BATCH_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_FILES} submissions per batch.")
+
+
+def check_batch_bytes(size):
+    if size > BATCH_MAX_BYTES:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_BYTES} bytes of submissions per batch.")
+
+
+def copy_within_limit(source, buffer, written, chunk_size=1024 * 1024):
+    # Archive members can decompress to far more than their declared file_size
+    while chunk := source.read(chunk_size):
+        written += len(chunk)
+        check_batch_bytes(written)
+        buffer.write(chunk)
+    return written
+
+
+def stream_batch_reports(saved, user_id=None, pairwise=False, peer_details=False):
+    try:
+        submissions = [(str(path), name) for path, name in saved]
+        yield from batch_lines(submissions, user_id=user_id, pairwise=pairwise, peer_details=peer_details)
+    except Exception:
+        traceback.print_exc()
+        yield json.dumps({"error": "Failed to process batch."}) + "\n"
+    finally:
+        for path, _ in saved:
+            path.unlink(missing_ok=True)
+
+
+@router.post("/batch")
+def batch_check(
+    files: List[UploadFile] = File(...),
+    pairwise: bool = Query(False),
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Checks a set of submissions (files and/or .zip archives of .pdf, .docx and .txt
+    files) in one pass over the corpus. Responds with newline-delimited JSON, one
+    report per submission as soon as it is ready; "position" is the submission's
+    index in upload order (archives expanded in place). With `pairwise`, a last
+    {"pairwise": ...} line holds the submission x submission overlap matrix and
+    the passages every pair shares.
+    """
+    saved = save_batch_uploads(files)
+    if not saved:
+        raise HTTPException(status_code=400, detail="No .pdf, .docx or .txt submissions found.")
+    return StreamingResponse(
+        stream_batch_reports(saved, current_user["user_id"], pairwise, sees_peer_details(current_user)),
+        media_type="application/x-ndjson",
+    )
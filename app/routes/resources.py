@@ -1,7 +1,8 @@
-from fastapi import APIRouter, Depends, status, UploadFile, File, Form, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, status, UploadFile, File, Form, HTTPException
 from typing import Optional, List
 import json
 
+from app.controllers.detection_controller import discard_resource, index_resource
 from app.utils.role_handle import require_admin
 from app.routes.users import get_current_user
 from app.models.resource_model import ResourceOut
@@ -32,6 +33,7 @@ def read_resource(resource_id: int, current_user: dict = Depends(get_current_use
 
 @router.post("/", response_model=ResourceOut, status_code=status.HTTP_201_CREATED)
 async def create_new_resource(
+    background_tasks: BackgroundTasks,
     title: str = Form(...),
     content: str = Form(...),
     publisher: Optional[str] = Form(None),
@@ -72,11 +74,13 @@ async def create_new_resource(
 
     # Creating the resource
     new_resource = create_resource(resource_data, uploaded_file=file)
+    background_tasks.add_task(index_resource, new_resource)
     return new_resource
 
 @router.patch("/{resource_id}", response_model=ResourceOut)
 async def patch_resource(
     resource_id: int,
+    background_tasks: BackgroundTasks,
     title: Optional[str] = Form(None),
     content: Optional[str] = Form(None),
     file_url: Optional[str] = Form(None),
@@ -115,14 +119,18 @@ async def patch_resource(
     if authors_list:
         resource_data["authors"] = authors_list
 
-    return update_resource(resource_id, resource_data, uploaded_file)
+    updated_resource = update_resource(resource_id, resource_data, uploaded_file)
+    background_tasks.add_task(index_resource, updated_resource)
+    return updated_resource
 
 @router.delete("/{resource_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_resource(
     resource_id: int,
+    background_tasks: BackgroundTasks,
     current_user: dict = Depends(require_admin),
 ):
     deleted = soft_delete_resource(resource_id)
     if not deleted:
         raise HTTPException(status_code=404, detail="Resource not found")
+    background_tasks.add_task(discard_resource, resource_id)
     return None
@@ -0,0 +1,100 @@
+import os
+import sys
+
+from threadpoolctl import threadpool_info, threadpool_limits
+
+from app.config import (
+    COMPARE_BLAS_THREADS,
+    COMPARE_WORKERS,
+    COMPUTE_THREADS,
+    MATCHING_MODE,
+    SHARD_WORKERS,
+    THREAD_GOVERNOR,
+    WORKER_PROCESSES,
+)
+
+# Read by OpenMP/BLAS when a library is first loaded, and inherited by processes
+# started later (e.g. shard workers)
+OPENMP_ENV_VARS = ("OMP_NUM_THREADS", "NUMEXPR_NUM_THREADS")
+BLAS_ENV_VARS = ("OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "VECLIB_MAXIMUM_THREADS")
+
+_active = None  # {"workers", "shard_workers", "threads", "blas_threads"} once the limits are applied
+
+
+def available_cpus():
+    # CPUs this process may run on (cgroup cpusets, taskset), not the cores of the node
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def shard_processes(matching_mode=MATCHING_MODE, shard_workers=SHARD_WORKERS):
+    # Shard processes each worker starts; they inherit its limits (see shard_pool.py)
+    return shard_workers if matching_mode == "sharded" else 0
+
+
+def thread_budget(workers=WORKER_PROCESSES, threads=COMPUTE_THREADS, shards=None):
+    # A worker waits while its shard processes search, so its shards, not the
+    # worker itself, are what computes alongside the other workers then
+    if threads:
+        return threads
+    if shards is None:
+        shards = shard_processes()
+    return max(1, available_cpus() // (max(1, workers) * max(1, shards)))
+
+
+def blas_budget(budget, compare_workers=COMPARE_WORKERS, blas_threads=COMPARE_BLAS_THREADS):
+    # Up to COMPARE_WORKERS threads of one check run matrix products at once
+    if blas_threads:
+        return blas_threads
+    return max(1, budget // max(1, compare_workers))
+
+
+def apply_thread_limits(workers=WORKER_PROCESSES, threads=COMPUTE_THREADS):
+    """
+    Caps the intra-op threads of this process at thread_budget(workers, threads)
+    for OpenMP and torch, and at blas_budget() for BLAS, which also covers the
+    COMPARE_WORKERS threads of a check and the shard processes: libraries already
+    loaded, torch if it is, and (through the environment) everything loaded or
+    spawned later. The limits are process-wide, so they are set once per worker
+    process, after the fork, and never changed per request. Returns the budget.
+    """
+    global _active
+    shards = shard_processes()
+    budget = thread_budget(workers, threads, shards)
+    blas_threads = blas_budget(budget)
+    for name in OPENMP_ENV_VARS:
+        os.environ[name] = str(budget)
+    for name in BLAS_ENV_VARS:
+        os.environ[name] = str(blas_threads)
+    threadpool_limits(limits=budget, user_api="openmp")
+    threadpool_limits(limits=blas_threads, user_api="blas")
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(budget)
+    _active = {"workers": workers, "shard_workers": shards, "threads": budget, "blas_threads": blas_threads}
+    return budget
+
+
+def govern_threads():
+    if not THREAD_GOVERNOR:
+        return
+    budget = apply_thread_limits()
+    print(
+        f"✅ Worker {os.getpid()}: {budget} compute threads, {_active['blas_threads']} BLAS threads "
+        f"({available_cpus()} CPUs, {WORKER_PROCESSES} workers, {_active['shard_workers']} shard processes each)"
+    )
+
+
+def thread_settings():
+    """
+    The governor's budget and the thread counts actually in effect per library.
+    """
+    settings = {"governor": _active is not None, "cpus": available_cpus(), **(_active or {})}
+    settings["libraries"] = [
+        {"library": info["internal_api"], "threading_layer": info.get("threading_layer"), "threads": info["num_threads"]}
+        for info in threadpool_info()
+    ]
+    if "torch" in sys.modules:
+        settings["torch_threads"] = sys.modules["torch"].get_num_threads()
+    return settings
@@ -14,6 +14,7 @@ ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 15))
 REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", 7))
 
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
@@ -58,3 +59,10 @@ def get_current_user(token: HTTPAuthorizationCredentials = Depends(security)):
     if user_id is None:
         raise HTTPException(status_code=401, detail="Invalid token payload")
     return {"user_id": int(user_id), **payload}
+
+
+def get_optional_user(token: HTTPAuthorizationCredentials = Depends(optional_security)):
+    # Same as get_current_user, but anonymous requests get None instead of a 403
+    if token is None:
+        return None
+    return get_current_user(token)
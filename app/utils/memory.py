@@ -0,0 +1,39 @@
+import os
+import resource
+from pathlib import Path
+
+# /proc fields reported at startup, in kB
+STATUS_FIELDS = {"VmRSS": "rss", "RssAnon": "anon", "RssFile": "file", "RssShmem": "shmem"}
+
+
+def memory_usage():
+    """
+    Resident memory of this process in MB: total, private (anon), file-backed
+    (model files, mmapped corpus matrices), shared memory and, where the kernel
+    provides it, the proportional share (PSS) that counts pages shared with other
+    workers only partly. Falls back to peak RSS outside Linux.
+    """
+    usage = {}
+    status = Path("/proc/self/status")
+    if status.exists():
+        for line in status.read_text().splitlines():
+            key, _, value = line.partition(":")
+            if key in STATUS_FIELDS:
+                usage[STATUS_FIELDS[key]] = int(value.split()[0]) / 1024
+        rollup = Path("/proc/self/smaps_rollup")
+        try:
+            for line in rollup.read_text().splitlines():
+                if line.startswith("Pss:"):
+                    usage["pss"] = int(line.split()[1]) / 1024
+        except OSError:
+            pass
+    else:
+        usage["rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return usage
+
+
+def report_memory(label="Worker"):
+    usage = memory_usage()
+    details = ", ".join(f"{name} {usage[name]:.0f} MB" for name in ("pss", "anon", "file", "shmem") if name in usage)
+    print(f"✅ {label} {os.getpid()}: RSS {usage.get('rss', 0):.0f} MB" + (f" ({details})" if details else ""))
+    return usage
@@ -1,7 +1,16 @@
 from fastapi import Depends, HTTPException
+from app.config import PEER_DETAIL_ROLES
 from app.utils.jwt_handler import get_current_user
 
 def require_admin(current_user: dict = Depends(get_current_user)):
     if "admin" not in current_user.get("roles", []):
         raise HTTPException(status_code=403, detail="Admin access required")
     return current_user
+
+
+def sees_peer_details(current_user):
+    # Guests and ordinary users only get the report id and scores of peer matches
+    if not current_user:
+        return False
+    roles = current_user.get("roles") or []
+    return bool(({roles} if isinstance(roles, str) else set(roles)) & PEER_DETAIL_ROLES)
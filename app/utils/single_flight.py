@@ -0,0 +1,44 @@
+import asyncio
+from starlette.concurrency import run_in_threadpool
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key into one computation.
+
+    The first caller for a key starts the work in the threadpool; callers arriving
+    while it is still running await the same task and receive the same result (or
+    exception). The task is shielded, so a disconnecting client does not cancel the
+    computation for the others. State is per process and per event loop.
+
+    `release` is called once the computation no longer needs this call's
+    arguments: when the task it started finishes, or right away when the call
+    joined a task already running.
+    """
+
+    def __init__(self):
+        self._in_flight = {}
+        self.computations = 0
+        self.coalesced = 0
+
+    async def run(self, key, fn, *args, release=None, **kwargs):
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(run_in_threadpool(fn, *args, **kwargs))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+            if release is not None:
+                task.add_done_callback(lambda _: release())
+            self.computations += 1
+        else:
+            self.coalesced += 1
+            if release is not None:
+                release()
+        return await asyncio.shield(task)
+
+    def stats(self):
+        return {
+            "computations": self.computations,
+            "computations_saved": self.coalesced,
+            "in_flight": len(self._in_flight),
+        }
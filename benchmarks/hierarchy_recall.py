@@ -0,0 +1,118 @@
+# hierarchy_recall.py
+"""
+Recall and speed of hierarchical matching against exhaustive matching.
+
+    python -m benchmarks.hierarchy_recall [--submission FILE] [--directory DIR]
+        [--top-resources N] [--top-paragraphs N] [--paragraph-sentences N]
+
+Every .pdf, .docx and .txt in the directory (default: uploaded_resources/) is a
+resource; resources are parsed and encoded in memory and never written to the
+corpus index, whose ids belong to the database. Without --submission, a synthetic submission is stitched together from
+random runs of resource sentences. Recall is the share of exhaustive matched
+pairs (submission sentence, resource, resource sentence) that the hierarchical
+mode also finds.
+"""
+import argparse
+import random
+import time
+from pathlib import Path
+
+import numpy as np
+
+from app.algorithm import hierarchy, truetypealgorithm
+from app.algorithm.corpus_index import build_resource_entry
+
+EXTENSIONS = {".pdf", ".docx", ".txt"}
+
+
+def load_entries(directory, size):
+    # Built, not indexed: the made-up ids would replace real resources' index
+    # entries. Centroids are for the paragraph size under test
+    entries = []
+    paths = sorted(p for p in Path(directory).iterdir() if p.suffix.lower() in EXTENSIONS)
+    for resource_id, path in enumerate(paths, start=1):
+        entry = build_resource_entry({"id": resource_id, "title": path.name, "file_path": str(path), "corpus_version": 0})
+        if entry is not None:
+            entries.append(hierarchy.add_centroids(entry, size))
+    return entries
+
+
+def synthetic_submission(entries, runs, run_length, seed):
+    rng = random.Random(seed)
+    sentences = []
+    for _ in range(runs):
+        entry = rng.choice(entries)
+        start = rng.randrange(max(1, len(entry["sentences"]) - run_length))
+        sentences.extend(entry["sentences"][start:start + run_length])
+    return sentences
+
+
+def matched_pairs(user_sentences, entry, similarity_matrix):
+    pairs = truetypealgorithm.match_sentences(user_sentences, entry["sentences"], similarity_matrix, entry["title"])
+    return {(p["doc1_idx"], entry["resource_id"], p["doc2_idx"]) for p in pairs}
+
+
+def exhaustive(user_sentences, user_embeddings, entries):
+    found = set()
+    for entry in entries:
+        found |= matched_pairs(user_sentences, entry, user_embeddings @ entry["embeddings"].T)
+    return found
+
+
+def hierarchical(user_sentences, user_embeddings, entries, top_resources, top_paragraphs, size):
+    found = set()
+    query_centroids = hierarchy.paragraph_centroids(user_embeddings, size)
+    for entry in hierarchy.rank_resources(query_centroids, entries, top=top_resources):
+        similarity_matrix = hierarchy.restricted_similarity(
+            user_embeddings, query_centroids, entry, top_paragraphs=top_paragraphs, size=size
+        )
+        found |= matched_pairs(user_sentences, entry, similarity_matrix)
+    return found
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--submission")
+    parser.add_argument("--directory", default="uploaded_resources")
+    parser.add_argument("--top-resources", type=int, default=hierarchy.HIERARCHY_TOP_RESOURCES)
+    parser.add_argument("--top-paragraphs", type=int, default=hierarchy.HIERARCHY_TOP_PARAGRAPHS)
+    parser.add_argument("--paragraph-sentences", type=int, default=hierarchy.HIERARCHY_PARAGRAPH_SENTENCES)
+    parser.add_argument("--runs", type=int, default=10, help="runs in the synthetic submission")
+    parser.add_argument("--run-length", type=int, default=6, help="sentences per synthetic run")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    entries = load_entries(args.directory, args.paragraph_sentences)
+    if not entries:
+        raise SystemExit(f"No readable resources in {args.directory}")
+    if args.submission:
+        user_sentences = truetypealgorithm.read_file(args.submission)
+    else:
+        user_sentences = synthetic_submission(entries, args.runs, args.run_length, args.seed)
+    user_embeddings = truetypealgorithm.encode_sentences(user_sentences)
+
+    reference, exhaustive_time = timed(exhaustive, user_sentences, user_embeddings, entries)
+    candidate, hierarchical_time = timed(
+        hierarchical, user_sentences, user_embeddings, entries,
+        args.top_resources, args.top_paragraphs, args.paragraph_sentences,
+    )
+
+    recall = len(reference & candidate) / len(reference) if reference else 1.0
+    covered = np.mean([any(p[0] == i for p in candidate) for i in {p[0] for p in reference}]) if reference else 1.0
+    print(f"resources: {len(entries)}, resource sentences: {sum(len(e['sentences']) for e in entries)}, "
+          f"submission sentences: {len(user_sentences)}")
+    print(f"fan-out: {args.top_resources} resources, {args.top_paragraphs} paragraphs "
+          f"of {args.paragraph_sentences} sentences")
+    print(f"exhaustive pairs: {len(reference)}, hierarchical pairs: {len(candidate)}")
+    print(f"pair recall: {recall:.1%}, matched-sentence recall: {covered:.1%}")
+    print(f"time: exhaustive {exhaustive_time * 1000:.1f} ms, hierarchical {hierarchical_time * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# import_time.py
+"""
+Cold import time and heavy modules of the API and the detection worker.
+
+    python -m benchmarks.import_time [--repeat N] [--worker-url URL]
+
+Every entry point is imported in a fresh interpreter: main.py with the
+pipeline in-process (no DETECTION_WORKER_URL), main.py forwarding to a
+detection worker (DETECTION_WORKER_URL set; nothing is contacted at import),
+and detection_worker.py. Reports the best wall time of N runs and which of
+numpy, torch and sentence_transformers ended up in sys.modules.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+HEAVY_MODULES = ("numpy", "torch", "sentence_transformers")
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def time_import(module, env, repeat):
+    best, loaded = float("inf"), []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY_MODULES)],
+            env=env, capture_output=True, text=True, check=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        best, loaded = min(best, result["seconds"]), result["loaded"]
+    return best, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--worker-url", default="http://127.0.0.1:8001")
+    args = parser.parse_args()
+
+    local = {k: v for k, v in os.environ.items() if k != "DETECTION_WORKER_URL"}
+    # An empty value in the process environment keeps a .env setting from applying
+    local["DETECTION_WORKER_URL"] = ""
+    remote = {**local, "DETECTION_WORKER_URL": args.worker_url}
+    cases = [
+        ("main (in-process pipeline)", "main", local),
+        ("main (DETECTION_WORKER_URL set)", "main", remote),
+        ("detection_worker", "detection_worker", local),
+    ]
+    for label, module, env in cases:
+        seconds, loaded = time_import(module, env, args.repeat)
+        print(f"{label}: {seconds:.2f} s, heavy modules: {', '.join(loaded) or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# segmentation.py
+"""
+Speed and agreement of the regex sentence segmenter against nltk's sent_tokenize.
+
+    python -m benchmarks.segmentation [directory] [--repeat N]
+
+Every .pdf, .docx and .txt in the directory (default: uploaded_resources/) is read
+and merged once; segmentation alone is timed. Agreement is the share of nltk
+sentences the regex segmenter reproduces exactly (recall) and the share of regex
+sentences nltk also produces (precision).
+"""
+import argparse
+import time
+from collections import Counter
+from pathlib import Path
+
+from app.algorithm import segmenter, truetypealgorithm
+
+READERS = {
+    ".pdf": truetypealgorithm.read_pdf,
+    ".docx": truetypealgorithm.read_docx,
+    ".txt": truetypealgorithm.read_txt,
+}
+
+
+def segment_with_nltk(merged_lines):
+    sentences = []
+    for line in merged_lines:
+        if len(line.split()) > segmenter.MIN_SPLIT_WORDS:
+            sentences.extend(truetypealgorithm.sent_tokenize(line))
+        else:
+            sentences.append(line)
+    return sentences
+
+
+def timed(fn, documents, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(documents)
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def common_sentences(reference, candidate):
+    return sum((Counter(reference) & Counter(candidate)).values())
+
+
+def ratio(part, whole):
+    return part / whole if whole else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", nargs="?", default="uploaded_resources")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    paths = sorted(p for p in Path(args.directory).iterdir() if p.suffix.lower() in READERS)
+    documents = [READERS[p.suffix.lower()](str(p)) for p in paths]
+
+    nltk_out, nltk_time = timed(lambda docs: [segment_with_nltk(d) for d in docs], documents, args.repeat)
+    regex_out, regex_time = timed(segmenter.segment_documents, documents, args.repeat)
+
+    print(f"{'file':<45} {'nltk':>6} {'regex':>6} {'recall':>7} {'precision':>9}")
+    totals = Counter()
+    for path, reference, candidate in zip(paths, nltk_out, regex_out):
+        common = common_sentences(reference, candidate)
+        print(
+            f"{path.name[:45]:<45} {len(reference):>6} {len(candidate):>6} "
+            f"{ratio(common, len(reference)):>7.1%} {ratio(common, len(candidate)):>9.1%}"
+        )
+        totals.update(reference=len(reference), candidate=len(candidate), common=common)
+
+    print(
+        f"{'total':<45} {totals['reference']:>6} {totals['candidate']:>6} "
+        f"{ratio(totals['common'], totals['reference']):>7.1%} {ratio(totals['common'], totals['candidate']):>9.1%}"
+    )
+    print(
+        f"\nsegmentation time (best of {args.repeat}): nltk {nltk_time * 1000:.1f} ms, "
+        f"regex {regex_time * 1000:.1f} ms ({nltk_time / max(regex_time, 1e-9):.1f}x)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# sharded_search.py
+"""
+Local multi-process harness for the sharded corpus search.
+
+    python -m benchmarks.sharded_search [--shards N] [--resources N]
+        [--sentences N] [--queries N] [--dim N] [--k N] [--repeat N]
+
+Writes a synthetic corpus of random unit embeddings (one .npy per resource, as
+the corpus index stores them) to a temporary directory, starts N shard worker
+processes and checks that the merged per-shard top-k equals a single-process
+exact top-k, with and without a resource filter. Timings exclude the first
+search, which loads the shards.
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from app.algorithm.shard_pool import Shard, ShardPool
+
+
+def unit_rows(rng, rows, dim):
+    vectors = rng.standard_normal((rows, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def write_corpus(directory, rng, resources, sentences, dim):
+    entries = []
+    for resource_id in range(1, resources + 1):
+        path = Path(directory) / f"{resource_id}_0.npy"
+        np.save(path, unit_rows(rng, int(rng.integers(1, 2 * sentences)), dim))
+        entries.append((resource_id, 0, path))
+    return entries
+
+
+def same_results(expected, actual):
+    ids, sentences, similarity = expected
+    return (
+        np.array_equal(ids, actual[0])
+        and np.array_equal(sentences, actual[1])
+        and np.allclose(similarity, actual[2], atol=1e-5)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shards", type=int, default=4)
+    parser.add_argument("--resources", type=int, default=400)
+    parser.add_argument("--sentences", type=int, default=200, help="mean sentences per resource")
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--k", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        entries = write_corpus(directory, rng, args.resources, args.sentences, args.dim)
+        queries = unit_rows(rng, args.queries, args.dim)
+        subset = sorted(rng.choice([e[0] for e in entries], size=max(1, len(entries) // 3), replace=False).tolist())
+
+        single = Shard()
+        single.load([(resource_id, version, str(path)) for resource_id, version, path in entries])
+        start = time.perf_counter()
+        expected = single.search(queries, args.k)
+        single_time = time.perf_counter() - start
+        expected_subset = single.search(queries, args.k, allowed=subset)
+
+        pool = ShardPool(args.shards)
+        try:
+            start = time.perf_counter()
+            pool.search(queries, entries, args.k)
+            load_time = time.perf_counter() - start
+            best = float("inf")
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                actual = pool.search(queries, entries, args.k)
+                best = min(best, time.perf_counter() - start)
+            actual_subset = pool.search(queries, entries, args.k, allowed=subset)
+        finally:
+            pool.close()
+
+    print(f"resources: {args.resources}, queries: {args.queries}, dim: {args.dim}, k: {args.k}, shards: {args.shards}")
+    print(f"merged top-k equals single process: {same_results(expected, actual)}")
+    print(f"filtered ({len(subset)} resources) equals single process: {same_results(expected_subset, actual_subset)}")
+    print(
+        f"time: single process {single_time * 1000:.1f} ms, sharded {best * 1000:.1f} ms "
+        f"(best of {args.repeat}; first search with shard loading {load_time * 1000:.1f} ms)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+# thread_throughput.py
+"""
+Detection throughput at different worker process / compute thread splits.
+
+    python -m benchmarks.thread_throughput [directory] [--splits 1x8,2x4,...]
+        [--jobs N] [--sentences N] [--seed N]
+
+Every .pdf, .docx and .txt in the directory (default: uploaded_resources/) is a
+resource; every worker parses and encodes them in memory, and nothing is
+written to the corpus index. Jobs are synthetic submissions stitched together
+from random runs of resource sentences; each worker process encodes its
+submissions and compares them exhaustively against every resource, as a check
+does. A split WxT runs W
+worker processes capped at T threads each (apply_thread_limits); without
+--splits, W runs over the powers of two up to this process's CPU count with
+T = CPUs / W, plus the ungoverned baseline of as many workers as CPUs with one
+thread per CPU each. Model and corpus loading are not timed.
+"""
+import argparse
+import multiprocessing
+import random
+import time
+from pathlib import Path
+
+from app.utils.compute_threads import apply_thread_limits, available_cpus
+
+EXTENSIONS = {".pdf", ".docx", ".txt"}
+
+
+def load_entries(directory):
+    # Imported here, not at the top: it loads torch and the encoder. Built, not
+    # indexed: the made-up ids would replace real resources' index entries
+    from app.algorithm.corpus_index import build_resource_entry
+    entries = []
+    paths = sorted(p for p in Path(directory).iterdir() if p.suffix.lower() in EXTENSIONS)
+    for resource_id, path in enumerate(paths, start=1):
+        entry = build_resource_entry({"id": resource_id, "title": path.name, "file_path": str(path), "corpus_version": 0})
+        if entry is not None and entry["sentences"]:
+            entries.append(entry)
+    return entries
+
+
+def synthetic_submissions(entries, jobs, sentences, seed, run_length=5):
+    rng = random.Random(seed)
+    submissions = []
+    for _ in range(jobs):
+        submission = []
+        while len(submission) < sentences:
+            entry = rng.choice(entries)
+            start = rng.randrange(max(1, len(entry["sentences"]) - run_length))
+            submission.extend(entry["sentences"][start:start + run_length])
+        submissions.append(submission[:sentences])
+    return submissions
+
+
+def run_worker(directory, threads, submissions, queue, ready):
+    # Limits first, so torch and BLAS start with the budget
+    apply_thread_limits(threads=threads)
+    from app.algorithm import truetypealgorithm
+
+    entries = load_entries(directory)
+    truetypealgorithm.encode_sentences(submissions[0][:2])
+    ready.wait()
+    while (job := queue.get()) is not None:
+        user_sentences = submissions[job]
+        user_embeddings = truetypealgorithm.encode_sentences(user_sentences)
+        for entry in entries:
+            truetypealgorithm.match_sentences(
+                user_sentences, entry["sentences"], user_embeddings @ entry["embeddings"].T, entry["title"]
+            )
+
+
+def run_split(context, directory, workers, threads, submissions):
+    queue = context.Queue()
+    ready = context.Barrier(workers + 1)
+    processes = [
+        context.Process(target=run_worker, args=(directory, threads, submissions, queue, ready))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    ready.wait()
+    start = time.perf_counter()
+    for job in range(len(submissions)):
+        queue.put(job)
+    for _ in processes:
+        queue.put(None)
+    for process in processes:
+        process.join()
+    return time.perf_counter() - start
+
+
+def default_splits(cpus):
+    splits = []
+    workers = 1
+    while workers <= cpus:
+        splits.append((workers, cpus // workers))
+        workers *= 2
+    if cpus > 1:
+        splits.append((cpus, cpus))
+    return splits
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", nargs="?", default="uploaded_resources")
+    parser.add_argument("--splits", help="comma-separated WORKERSxTHREADS, e.g. 1x8,4x2")
+    parser.add_argument("--jobs", type=int, default=32)
+    parser.add_argument("--sentences", type=int, default=200, help="sentences per submission")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    cpus = available_cpus()
+    if args.splits:
+        splits = [tuple(int(n) for n in split.lower().split("x")) for split in args.splits.split(",")]
+    else:
+        splits = default_splits(cpus)
+
+    entries = load_entries(args.directory)
+    if not entries:
+        raise SystemExit(f"No resources with text in {args.directory}")
+    submissions = synthetic_submissions(entries, args.jobs, args.sentences, args.seed)
+
+    context = multiprocessing.get_context("spawn")
+    print(f"resources: {len(entries)}, jobs: {args.jobs} x {args.sentences} sentences, CPUs: {cpus}")
+    for workers, threads in splits:
+        seconds = run_split(context, args.directory, workers, threads, submissions)
+        note = " (oversubscribed)" if workers * threads > cpus else ""
+        print(f"{workers} workers x {threads} threads{note}: {args.jobs / seconds:.2f} jobs/s ({seconds:.1f} s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import json
+import shutil
+import traceback
+import uuid
+from pathlib import Path
+from typing import List, Optional
+from fastapi import BackgroundTasks, Body, FastAPI, File, Form, HTTPException, UploadFile
+from fastapi.responses import StreamingResponse
+from dotenv import load_dotenv
+import uvicorn
+
+from app.algorithm import detection_service, pipeline, screening
+from app.algorithm.citation_checker import reference_index
+from app.algorithm.report_cache import memory_cache
+from app.config import DETECTION_WORKER_PORT, UPLOAD_DIR
+from app.utils.compute_threads import govern_threads
+from app.utils.memory import report_memory
+
+load_dotenv()
+
+# The detection side of the API: everything that needs numpy, torch and the
+# sentence encoder. main.py forwards to it when DETECTION_WORKER_URL is set;
+# it only listens on localhost and has no authentication of its own.
+app = FastAPI(title="Plagiarism Detection Worker")
+
+
+@app.on_event("startup")
+def startup_event():
+    govern_threads()
+    report_memory("Detection worker")
+
+
+def optional_user_id(value):
+    return int(value) if value else None
+
+
+def save_upload(file):
+    path = UPLOAD_DIR / f"{uuid.uuid4().hex}_{Path(file.filename or '').name}"
+    with open(path, "wb") as buffer:
+        shutil.copyfileobj(file.file, buffer)
+    return path
+
+
+@app.post("/detect/upload")
+async def detect_upload(
+    file: UploadFile = File(...),
+    user_id: Optional[str] = Form(None),
+    resource_filter: Optional[str] = Form(None),
+    peer_details: bool = Form(False),
+):
+    upload_path = save_upload(file)
+    try:
+        return await detection_service.check_upload(
+            str(upload_path), file.filename, optional_user_id(user_id),
+            json.loads(resource_filter) if resource_filter else None, peer_details,
+        )
+    finally:
+        upload_path.unlink(missing_ok=True)
+
+
+@app.get("/detect/metrics")
+def detect_metrics():
+    return detection_service.upload_metrics()
+
+
+def stream_batch_lines(saved, user_id, pairwise, peer_details):
+    try:
+        yield from detection_service.batch_lines(
+            [(str(path), name) for path, name in saved], user_id, pairwise, peer_details
+        )
+    except Exception:
+        traceback.print_exc()
+        yield json.dumps({"error": "Failed to process batch."}) + "\n"
+    finally:
+        for path, _ in saved:
+            path.unlink(missing_ok=True)
+
+
+@app.post("/detect/batch")
+def detect_batch(
+    files: List[UploadFile] = File(...),
+    user_id: Optional[str] = Form(None),
+    pairwise: bool = Form(False),
+    peer_details: bool = Form(False),
+):
+    saved = [(save_upload(file), file.filename) for file in files]
+    return StreamingResponse(
+        stream_batch_lines(saved, optional_user_id(user_id), pairwise, peer_details),
+        media_type="application/x-ndjson",
+    )
+
+
+@app.post("/detect/checks/{check_id}/recheck")
+def detect_recheck(check_id: str, peer_details: bool = False):
+    # Peer details are decided by the API from the caller's role
+    result = pipeline.recheck_plagiarism(check_id, peer_details)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Check not found")
+    return result
+
+
+@app.post("/detect/checks/{check_id}/rethreshold")
+def detect_rethreshold(check_id: str, threshold: float, exact_threshold: float):
+    # Bounds are validated by the API before forwarding
+    result = pipeline.rethreshold_check(check_id, threshold, exact_threshold)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Check not found or has no stored similarity state")
+    return result
+
+
+@app.post("/detect/resources/index", status_code=202)
+def detect_index_resource(background_tasks: BackgroundTasks, resource: dict = Body(...)):
+    background_tasks.add_task(screening.index_resource_screening, resource)
+    return {"queued": resource.get("id")}
+
+
+@app.post("/detect/resources/{resource_id}/discard")
+def detect_discard_resource(resource_id: int):
+    # The resource was deleted through the API process
+    reference_index.discard_resource(resource_id)
+    memory_cache.clear()
+    return {"discarded": resource_id}
+
+
+if __name__ == "__main__":
+    print(f"✅ Detection worker ready at http://127.0.0.1:{DETECTION_WORKER_PORT}")
+    uvicorn.run("detection_worker:app", host="127.0.0.1", port=DETECTION_WORKER_PORT, log_level="warning")
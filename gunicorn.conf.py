@@ -0,0 +1,37 @@
+# gunicorn.conf.py
+# Preload/fork mode: gunicorn main:app -c gunicorn.conf.py
+import gc
+import os
+
+from app.utils.memory import report_memory
+
+# Also read by the thread governor (WORKER_PROCESSES) when the app is imported
+os.environ.setdefault("WEB_CONCURRENCY", "2")
+# Every worker runs the app's startup event; the scheduled jobs must run once
+os.environ["RUN_SCHEDULER"] = "false"
+
+bind = f"0.0.0.0:{os.getenv('PORT', 8000)}"
+workers = int(os.environ["WEB_CONCURRENCY"])
+worker_class = "uvicorn.workers.UvicornWorker"
+# Import the app (and load the encoder) once in the master; workers share its
+# pages copy-on-write
+preload_app = True
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 300))
+
+
+def when_ready(server):
+    # Daily notifications and subscription checks run in the master only
+    from app.controllers.notification_controller import check_and_send_scheduled_notifications
+    from app.database.init_db import create_database_if_not_exists
+    from app.utils.scheduler import start
+
+    create_database_if_not_exists()
+    check_and_send_scheduled_notifications()
+    start()
+    report_memory("Master")
+
+
+def pre_fork(server, worker):
+    # Objects created so far are never collected, so the collector does not touch
+    # (and copy) their pages in every worker
+    gc.freeze()
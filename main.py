@@ -1,14 +1,14 @@
-from pathlib import Path
+import json
 import shutil
 import traceback
-from fastapi import FastAPI, Request, UploadFile, File
+import uuid
+from typing import Optional
+from fastapi import Depends, FastAPI, Form, HTTPException, Request, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from dotenv import load_dotenv
 import uvicorn
 import os
-import numpy as np
-import requests
 import warnings
 import logging
 
@@ -28,11 +28,15 @@ logging.getLogger("pydantic").setLevel(logging.ERROR)
 from app.controllers.notification_controller import check_and_send_scheduled_notifications
 from app.routes import (
     password_reset_routes, users, plans, payments, resources, reports, notifications,
-     authme, subscriptions, financialmetrics
+     authme, subscriptions, financialmetrics, checks
 )
-from app.controllers.resource_controller import get_all_resources
-from app.algorithm import truetypealgorithm
-from app.algorithm.algoimplementation import total_score
+from app.algorithm.resource_filter import normalize_filter
+from app.config import RUN_SCHEDULER, UPLOAD_DIR
+from app.controllers.detection_controller import check_upload, upload_metrics as detection_metrics
+from app.utils.jwt_handler import get_optional_user
+from app.utils.role_handle import sees_peer_details
+from app.utils.compute_threads import govern_threads
+from app.utils.memory import report_memory
 from app.database.init_db import create_database_if_not_exists
 from app.utils.scheduler import start
 
@@ -40,14 +44,15 @@ load_dotenv()
 
 app = FastAPI(title="Plagiarism Detection API")
 
-UPLOAD_DIR = Path("uploads")
-UPLOAD_DIR.mkdir(exist_ok=True)
-
 @app.on_event("startup")
 def startup_event():
     create_database_if_not_exists()
-    check_and_send_scheduled_notifications()
-    start()
+    # Under gunicorn the master runs the scheduler, not every worker
+    if RUN_SCHEDULER:
+        check_and_send_scheduled_notifications()
+        start()
+    govern_threads()
+    report_memory()
     print("✅ Server is ready.")
 
 app.add_middleware(
@@ -69,6 +74,7 @@ app.include_router(authme.router)
 app.include_router(financialmetrics.router)
 app.include_router(subscriptions.router)
 app.include_router(password_reset_routes.router)
+app.include_router(checks.router)
 
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
@@ -78,82 +84,61 @@ async def global_exception_handler(request: Request, exc: Exception):
 async def root():
     return {"message": "Plagiarism Detection API is running."}
 
+def parse_json_list(value, name):
+    if value is None:
+        return None
+    try:
+        parsed = json.loads(value)
+        if not isinstance(parsed, list):
+            raise ValueError()
+        return parsed
+    except (json.JSONDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail=f"Invalid {name} format; must be a JSON array.")
+
+
 @app.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
+async def upload_file(
+    file: UploadFile = File(...),
+    publishers: Optional[str] = Form(None),
+    year_from: Optional[int] = Form(None),
+    year_to: Optional[int] = Form(None),
+    authors: Optional[str] = Form(None),
+    resource_ids: Optional[str] = Form(None),
+    current_user: dict | None = Depends(get_optional_user),
+):
+    # Optional restriction of the corpus; lists are JSON arrays
+    try:
+        resource_filter = normalize_filter({
+            "publishers": parse_json_list(publishers, "publishers"),
+            "year_from": year_from,
+            "year_to": year_to,
+            "authors": parse_json_list(authors, "authors"),
+            "resource_ids": parse_json_list(resource_ids, "resource_ids"),
+        })
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid resource_ids; must be integers.")
     try:
-        upload_path = UPLOAD_DIR / file.filename
+        # Unique on-disk name so concurrent uploads with the same filename don't clobber each other
+        upload_path = UPLOAD_DIR / f"{uuid.uuid4().hex}_{file.filename}"
         with open(upload_path, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
 
-        user_file = str(upload_path)
-        resources = get_all_resources()
-        total_result = []
-
-        for resource in resources:
-            reference_text = None
-            file_path = resource.get("file_path")
-            reference_name = resource.get("title", "Undefined Resource")
-            try:
-                if isinstance(file_path, str) and Path(file_path).exists():
-                    reference_text = truetypealgorithm.read_file(file_path)
-                    if isinstance(reference_text, list):
-                        reference_text = "\n".join(reference_text)
-                else:
-                    file_url = resource.get("file_url")
-                    if isinstance(file_url, str) and file_url:
-                        response = requests.get(file_url)
-                        if response.status_code == 200:
-                            content_type = response.headers.get("Content-Type", "")
-                            temp_path = UPLOAD_DIR / f"temp_{resource['id']}"
-                            if "text/plain" in content_type:
-                                reference_text = response.text
-                            elif "application/pdf" in content_type:
-                                temp_path = temp_path.with_suffix(".pdf")
-                                with open(temp_path, "wb") as f:
-                                    f.write(response.content)
-                                reference_text = truetypealgorithm.read_file(str(temp_path))
-                                temp_path.unlink()
-                            elif "wordprocessingml.document" in content_type:
-                                temp_path = temp_path.with_suffix(".docx")
-                                with open(temp_path, "wb") as f:
-                                    f.write(response.content)
-                                reference_text = truetypealgorithm.read_file(str(temp_path))
-                                temp_path.unlink()
-                        # Skip if unsupported
-                if isinstance(reference_text, str):
-                    temp_ref = UPLOAD_DIR / f"temp_resource_{resource['id']}.txt"
-                    temp_ref.write_text(reference_text, encoding="utf-8")
-                    result = truetypealgorithm.get_plagiarism_report(user_file, str(temp_ref), display_name=reference_name)
-                    total_result.append(result)
-                    temp_ref.unlink()
-
-            except Exception as sub_e:
-                # Log minimal error
-                print(f"⚠️ Resource error: {reference_name}")
-
-        final_plag = total_score(total_result, user_file)
-        final_plag = convert_np_types(final_plag)
-        upload_path.unlink()
-        return final_plag
+        user_id = current_user["user_id"] if current_user else None
+        try:
+            return await check_upload(
+                str(upload_path), file.filename, user_id, resource_filter, sees_peer_details(current_user)
+            )
+        finally:
+            upload_path.unlink(missing_ok=True)
 
     except Exception:
         traceback.print_exc()
         return {"error": "Failed to process uploaded file."}
 
 
-def convert_np_types(obj):
-    if isinstance(obj, dict):
-        return {k: convert_np_types(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [convert_np_types(i) for i in obj]
-    elif isinstance(obj, np.ndarray):
-        return [convert_np_types(i) for i in obj]
-    elif isinstance(obj, np.integer):
-        return int(obj)
-    elif isinstance(obj, np.floating):
-        return float(obj)
-    else:
-        return obj
+@app.get("/upload/metrics", tags=["Plagiarism Check"])
+async def upload_metrics():
+    return await detection_metrics()
 
 
 if __name__ == "__main__":